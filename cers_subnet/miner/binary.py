@@ -0,0 +1,107 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+from typing import List, Optional, Tuple
+
+from cers_subnet.miner.deadline import Deadline
+from cers_subnet.miner.filters import popcount
+from cers_subnet.miner.index import top_k
+
+
+def binarize(vectors: np.ndarray) -> np.ndarray:
+    """
+    Packs the sign of every dimension into uint64 words, zero-padded to a multiple of 64 bits.
+
+    A 384-dimension vector becomes six words, i.e. 48 bytes.
+    """
+    vectors = np.atleast_2d(vectors)
+    words = -(-vectors.shape[1] // 64)
+    bits = np.zeros((len(vectors), words * 64), dtype=bool)
+    bits[:, : vectors.shape[1]] = vectors > 0
+    return np.packbits(bits, axis=1, bitorder="little").view("<u8")
+
+
+class BinaryPrefilter:
+    """
+    First-pass stage that shortlists candidates by Hamming distance between sign-binarized vectors.
+
+    The scan reads 1 bit per dimension instead of 32 and compares vectors with XOR and
+    popcount on packed uint64 words. Only the `shortlist` nearest rows are handed to the
+    index behind it, which re-scores them with its full-precision (or PQ) vectors, so
+    memory traffic per query drops by roughly 32x on a CPU-only miner.
+    """
+
+    def __init__(self, shortlist: int = 256):
+        self.shortlist = shortlist
+        self._codes: Optional[np.ndarray] = None
+
+    def resize(self, capacity: int, size: int, dim: int) -> None:
+        """Grows storage to `capacity` rows, keeping the first `size`."""
+        codes = np.zeros((capacity, -(-dim // 64)), dtype=np.uint64)
+        if self._codes is not None:
+            codes[:size] = self._codes[:size]
+        self._codes = codes
+
+    def write(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        self._codes[rows] = binarize(vectors)
+
+    def memory_bytes(self) -> int:
+        return 0 if self._codes is None else self._codes.nbytes
+
+    def select(
+        self,
+        query: np.ndarray,
+        blocks: List,
+        live: np.ndarray,
+        k: int,
+        deadline: Optional[Deadline] = None,
+    ) -> Tuple[np.ndarray, bool]:
+        """
+        Returns the rows with the smallest Hamming distance to `query`.
+
+        Args:
+            query (np.ndarray): Normalized query embedding.
+            blocks (List): Row slices or row arrays to scan, as built by the index.
+            live (np.ndarray): Mask of rows that hold a document.
+            k (int): Number of results the caller wants; at least this many rows are kept.
+            deadline (Optional[Deadline]): Time budget; the first block is always scanned.
+
+        Returns:
+            Tuple[np.ndarray, bool]: Shortlisted rows and whether every block was scanned.
+        """
+        codes = self._codes
+        query_bits = binarize(query)[0]
+        size = max(k, self.shortlist)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.int64)
+        for i, block in enumerate(blocks):
+            if i > 0 and deadline is not None and deadline.expired():
+                return best_rows, False
+            block_rows = (
+                np.arange(block.start, block.stop)
+                if isinstance(block, slice)
+                else block
+            )
+            # Negated distance so that larger is better, as top_k expects.
+            scores = -popcount(codes[block] ^ query_bits).sum(axis=1)
+            alive = live[block]
+            rows = np.concatenate([best_rows, block_rows[alive]])
+            scores = np.concatenate([best_scores, scores[alive]])
+            keep = top_k(scores, size)
+            best_rows, best_scores = rows[keep], scores[keep]
+        return best_rows, True
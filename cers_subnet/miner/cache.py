@@ -0,0 +1,259 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import json
+import random
+import threading
+import collections
+import numpy as np
+from typing import Any, Dict, List, Optional, Set
+
+from cers_subnet.miner.index import BaseIndex, SearchResult, normalize
+
+
+class SemanticCache:
+    """
+    Search results cached by query embedding, so paraphrases of a cached query reuse its result.
+
+    Cached query embeddings are kept in a matrix of `capacity` slots. A lookup compares the
+    query with all of them; among the entries whose cosine similarity reaches `threshold`,
+    the most similar one with the same filter and at least k results answers with its
+    first k keys. The least recently used slot is reused when the cache is full.
+
+    Writes only evict the entries they can change. The cache listens to the index's
+    writes and drops an entry when a written or deleted key is among its results, or when
+    an upserted vector scores at least as high against the cached query as the last
+    result it fetched (its `floor`), so it could enter the top k. A result computed while
+    writes landed is checked against those writes before it is cached; writes of up to
+    `history_rows` rows are kept for that, and a result that missed older ones is dropped.
+
+    A `sample_rate` fraction of hits is searched anyway to measure how often the cached
+    result agrees with the fresh one.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 1024,
+        threshold: float = 0.95,
+        sample_rate: float = 0.05,
+        agreement_window: int = 500,
+        history_rows: int = 4096,
+    ):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self._agreement = collections.deque(maxlen=agreement_window)
+        self.history_rows = history_rows
+        self._history = collections.deque()
+        self._history_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._index: Optional[BaseIndex] = None
+        self._clear(None)
+
+    @staticmethod
+    def floor(result: SearchResult, fetch: int) -> float:
+        """The score a new vector needs to enter `result`, a search for `fetch` keys."""
+        return (
+            float(result.scores[-1]) if len(result.keys) >= fetch else -np.inf
+        )
+
+    def _clear(self, index: Optional[BaseIndex]) -> None:
+        if self._index is not None:
+            self._index.write_listeners.remove(self._written)
+        self._index = index
+        self._version = None if index is None else index.version
+        if index is not None:
+            index.write_listeners.append(self._written)
+        self._queries: Optional[np.ndarray] = None
+        self._floors = np.full(self.capacity, np.inf, dtype=np.float32)
+        self._entries: Dict[int, tuple] = {}
+        # Result key -> slots of the entries that return it.
+        self._slots_of: Dict[int, Set[int]] = collections.defaultdict(set)
+        self._free = list(range(self.capacity - 1, -1, -1))
+        self._recent: "collections.OrderedDict[int, None]" = (
+            collections.OrderedDict()
+        )
+        self._history.clear()
+        self._history_size = 0
+
+    def _current(self, index: BaseIndex) -> None:
+        if index is not self._index:
+            self._clear(index)
+
+    @staticmethod
+    def _filter_key(where: Optional[Dict[str, Any]]) -> str:
+        return json.dumps(where, sort_keys=True)
+
+    def _evict(self, slot: int) -> None:
+        _, _, keys = self._entries.pop(slot)
+        for key in keys.tolist():
+            slots = self._slots_of[key]
+            slots.discard(slot)
+            if not slots:
+                del self._slots_of[key]
+        self._floors[slot] = np.inf
+        self._recent.pop(slot, None)
+        self._free.append(slot)
+
+    def _affected(
+        self,
+        slots: List[int],
+        keys: Optional[np.ndarray],
+        vectors: Optional[np.ndarray],
+    ) -> Set[int]:
+        """The entries among `slots` that a write of `keys` (with `vectors` for upserts) can change."""
+        if keys is None:
+            return set(slots)
+        stale = set()
+        for key in keys.tolist():
+            stale.update(self._slots_of.get(key, ()))
+        if vectors is not None and slots:
+            slots = np.asarray(slots)
+            scores = vectors @ self._queries[slots].T
+            # A small margin keeps float rounding from hiding a tie with the floor.
+            stale.update(
+                slots[
+                    (scores >= self._floors[slots] - 1e-6).any(axis=0)
+                ].tolist()
+            )
+        return stale.intersection(slots)
+
+    def _written(
+        self,
+        version: int,
+        keys: Optional[np.ndarray],
+        vectors: Optional[np.ndarray],
+    ) -> None:
+        """`BaseIndex.write_listeners` callback; runs under the index's write lock."""
+        with self._lock:
+            self._history.append((version, keys, vectors))
+            self._history_size += len(keys) if keys is not None else 1
+            while self._history and self._history_size > self.history_rows:
+                _, old_keys, _ = self._history.popleft()
+                self._history_size -= (
+                    len(old_keys) if old_keys is not None else 1
+                )
+            self._version = version
+            stale = self._affected(list(self._entries), keys, vectors)
+            for slot in stale:
+                self._evict(slot)
+            self.evictions += len(stale)
+
+    def get(
+        self,
+        index: BaseIndex,
+        query: np.ndarray,
+        k: int,
+        where: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Returns `(keys, verify)` for a cached near-duplicate query, or None on a miss.
+
+        `verify` is True for sampled hits; the caller should search anyway and report
+        the fresh keys with `record_agreement`.
+        """
+        with self._lock:
+            self._current(index)
+            if self._entries:
+                slots = np.fromiter(
+                    self._entries, dtype=np.int64, count=len(self._entries)
+                )
+                scores = self._queries[slots] @ normalize(query).reshape(-1)
+                close = np.flatnonzero(scores >= self.threshold)
+                filter_key = self._filter_key(where)
+                for slot in slots[
+                    close[np.argsort(-scores[close], kind="stable")]
+                ].tolist():
+                    entry_k, entry_filter, keys = self._entries[slot]
+                    # A longer result of the same search starts with the shorter one.
+                    if entry_k >= k and entry_filter == filter_key:
+                        self._recent.move_to_end(slot)
+                        self.hits += 1
+                        return keys[:k], random.random() < self.sample_rate
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        index: BaseIndex,
+        version: int,
+        query: np.ndarray,
+        k: int,
+        where: Optional[Dict[str, Any]],
+        keys: np.ndarray,
+        floor: float = -np.inf,
+    ) -> None:
+        """
+        Caches a complete search result computed on `version` of `index`.
+
+        `floor` is the lowest score the search fetched (see `floor`); the default makes
+        every upsert evict the entry.
+        """
+        with self._lock:
+            self._current(index)
+            missed = [write for write in self._history if write[0] > version]
+            if version != self._version and (
+                not missed or missed[0][0] != version + 1
+            ):
+                # Writes since the search are no longer known, so the result cannot be checked.
+                return
+            query = normalize(query).reshape(-1)
+            if self._queries is None:
+                self._queries = np.zeros(
+                    (self.capacity, query.shape[0]), dtype=np.float32
+                )
+            if not self._free:
+                self._evict(next(iter(self._recent)))
+            slot = self._free.pop()
+            keys = np.array(keys, copy=True)
+            self._queries[slot] = query
+            self._floors[slot] = floor
+            self._entries[slot] = (k, self._filter_key(where), keys)
+            for key in keys.tolist():
+                self._slots_of[key].add(slot)
+            self._recent[slot] = None
+            if any(
+                self._affected([slot], write_keys, vectors)
+                for _, write_keys, vectors in missed
+            ):
+                self._evict(slot)
+
+    def record_agreement(self, cached: np.ndarray, fresh: np.ndarray) -> None:
+        """Records the overlap between a cached result and the fresh search for the same query."""
+        size = max(len(cached), len(fresh))
+        with self._lock:
+            self._agreement.append(
+                len(np.intersect1d(cached, fresh)) / size if size else 1.0
+            )
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "sampled_agreement": float(np.mean(self._agreement))
+                if self._agreement
+                else None,
+                "agreement_samples": len(self._agreement),
+            }
@@ -0,0 +1,201 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import threading
+import numpy as np
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from cers_subnet.miner.ids import IdTable
+
+# Separates a document id from the chunk number in the id of every chunk after the first.
+CHUNK_SEPARATOR = "\x1f"
+
+
+def chunk_id(doc_id: str, number: int) -> str:
+    """The index id of a document's chunk; the first chunk keeps the document id itself."""
+    return doc_id if number == 0 else f"{doc_id}{CHUNK_SEPARATOR}{number}"
+
+
+def split_chunk_id(stored_id: str) -> Tuple[str, int]:
+    """Returns the (document id, chunk number) an index id belongs to."""
+    doc_id, separator, number = stored_id.partition(CHUNK_SEPARATOR)
+    return doc_id, int(number) if separator else 0
+
+
+class Chunker:
+    """
+    Splits long documents into overlapping chunks of at most `max_tokens` tokens.
+
+    Sentence-transformer models truncate their input (all-MiniLM-L6-v2 at 256 tokens), so
+    without chunking only the beginning of a long document is ever embedded. Chunks are cut
+    on token boundaries of the model's own tokenizer and mapped back to the original text,
+    and consecutive chunks share `overlap` tokens so a passage that straddles a boundary is
+    still embedded whole in one of them. Without a tokenizer that reports character offsets,
+    whitespace-separated words are counted as tokens.
+    """
+
+    def __init__(
+        self, tokenizer=None, max_tokens: int = 254, overlap: int = 32
+    ):
+        if max_tokens < 1 or not 0 <= overlap < max_tokens:
+            raise ValueError(
+                "Chunks need at least one token and an overlap smaller than the chunk."
+            )
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+
+    @classmethod
+    def for_model(cls, model, max_tokens: int, overlap: int = 32) -> "Chunker":
+        """A chunker using a sentence-transformer's tokenizer, with chunks that fit its input limit."""
+        limit = getattr(model, "max_seq_length", None)
+        if limit:
+            # Two positions are taken by the special tokens the model adds around each input.
+            max_tokens = min(max_tokens, limit - 2)
+        return cls(
+            getattr(model, "tokenizer", None),
+            max_tokens=max_tokens,
+            overlap=min(overlap, max_tokens - 1),
+        )
+
+    def _spans(self, text: str) -> List[Tuple[int, int]]:
+        """Character spans of the tokens of `text`."""
+        if self.tokenizer is not None:
+            try:
+                encoding = self.tokenizer(
+                    text,
+                    add_special_tokens=False,
+                    return_offsets_mapping=True,
+                    verbose=False,
+                )
+                return [tuple(span) for span in encoding["offset_mapping"]]
+            except (NotImplementedError, TypeError, KeyError):
+                # Slow tokenizers cannot report offsets.
+                self.tokenizer = None
+        spans, start = [], None
+        for i, char in enumerate(text):
+            if char.isspace():
+                if start is not None:
+                    spans.append((start, i))
+                    start = None
+            elif start is None:
+                start = i
+        if start is not None:
+            spans.append((start, len(text)))
+        return spans
+
+    def split(self, text: str) -> List[str]:
+        """Returns the chunks of `text`; a document within the limit is a single chunk."""
+        spans = self._spans(text)
+        if len(spans) <= self.max_tokens:
+            return [text]
+        chunks, step = [], self.max_tokens - self.overlap
+        for start in range(0, len(spans), step):
+            end = min(start + self.max_tokens, len(spans))
+            chunks.append(text[spans[start][0] : spans[end - 1][1]])
+            if end == len(spans):
+                break
+        return chunks
+
+
+class ChunkMap:
+    """
+    Tracks which index entries are extra chunks of a document.
+
+    Only documents with more than one chunk are recorded, so an unchunked corpus costs
+    nothing. Searches over-fetch chunks and `collapse` turns them into unique document keys,
+    scoring each document by its best chunk.
+    """
+
+    def __init__(self):
+        self._chunks: Dict[str, Set[int]] = {}
+        self._extra = 0
+        # Chunk key -> document key. Keys are never reused, so entries never go stale.
+        self._parents = np.full(0, -2, dtype=np.int32)
+        self._parents_lock = threading.Lock()
+
+    @property
+    def extra_chunks(self) -> int:
+        """Number of index entries that are chunks after a document's first."""
+        return self._extra
+
+    def chunk_ids(self, doc_id: str) -> List[str]:
+        """Index ids of every stored chunk of `doc_id`, starting with the document id itself."""
+        return [doc_id] + [
+            chunk_id(doc_id, number)
+            for number in sorted(self._chunks.get(doc_id, ()))
+        ]
+
+    def add(self, stored_ids: Iterable[str]) -> None:
+        for stored_id in stored_ids:
+            doc_id, number = split_chunk_id(stored_id)
+            if number:
+                chunks = self._chunks.setdefault(doc_id, set())
+                if number not in chunks:
+                    chunks.add(number)
+                    self._extra += 1
+
+    def remove(self, stored_ids: Iterable[str]) -> None:
+        for stored_id in stored_ids:
+            doc_id, number = split_chunk_id(stored_id)
+            chunks = self._chunks.get(doc_id)
+            if number and chunks is not None and number in chunks:
+                chunks.discard(number)
+                self._extra -= 1
+                if not chunks:
+                    del self._chunks[doc_id]
+
+    def parents(self, id_table: IdTable, keys: np.ndarray) -> np.ndarray:
+        """Maps chunk keys to the keys of their documents."""
+        parents = self._parents
+        if keys.size and int(keys.max()) < len(parents):
+            mapped = parents[keys]
+            if not (mapped == -2).any():
+                return mapped
+        with self._parents_lock:
+            parents = self._parents
+            if keys.size and int(keys.max()) >= len(parents):
+                grown = np.full(
+                    max(int(keys.max()) + 1, 2 * len(parents)),
+                    -2,
+                    dtype=np.int32,
+                )
+                grown[: len(parents)] = parents
+                parents = grown
+            unknown = np.unique(keys[parents[keys] == -2])
+            if unknown.size:
+                doc_ids = [
+                    split_chunk_id(stored_id)[0]
+                    for stored_id in id_table.decode(unknown)
+                ]
+                parents[unknown] = id_table.intern(doc_ids)
+            self._parents = parents
+            return parents[keys]
+
+    def collapse(
+        self, id_table: IdTable, keys: np.ndarray, k: int
+    ) -> np.ndarray:
+        """
+        Turns chunk keys ranked by score into the top-k unique document keys.
+
+        Each document ranks at its best chunk, i.e. max-score aggregation.
+        """
+        if not self._chunks:
+            return keys[:k]
+        parents = self.parents(id_table, keys)
+        _, first = np.unique(parents, return_index=True)
+        return parents[np.sort(first)[:k]]
@@ -0,0 +1,67 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import math
+import time
+from typing import Optional
+
+# The margin never takes more than this share of the timeout, so short timeouts keep a budget.
+MAX_MARGIN_FRACTION = 0.1
+
+
+class Deadline:
+    """
+    Tracks how much of a validator's timeout is left while a request is served.
+
+    The validator stops waiting for a response once `synapse.timeout` seconds have
+    passed, so anything returned after that is scored 0. A `Deadline` is created
+    when the request reaches `forward` and keeps a safety margin to cover the
+    network round trip back to the validator. The margin is capped at
+    `MAX_MARGIN_FRACTION` of the timeout, so a sub-second timeout does not start
+    out already expired.
+    """
+
+    def __init__(self, timeout: Optional[float], margin: float = 0.0):
+        """
+        Args:
+            timeout (Optional[float]): Seconds the caller is willing to wait. `None` means no deadline.
+            margin (float): Seconds reserved for serializing and sending the response, at
+                most `MAX_MARGIN_FRACTION` of the timeout.
+        """
+        self.start = time.monotonic()
+        if timeout is None:
+            self.expires_at = math.inf
+        else:
+            margin = min(margin, MAX_MARGIN_FRACTION * timeout)
+            self.expires_at = self.start + max(0.0, timeout - margin)
+
+    @classmethod
+    def from_synapse(cls, synapse, margin: float = 0.0) -> "Deadline":
+        """Builds a deadline from the timeout the dendrite attached to the synapse."""
+        return cls(getattr(synapse, "timeout", None), margin=margin)
+
+    def elapsed(self) -> float:
+        """Seconds since the deadline was created."""
+        return time.monotonic() - self.start
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline, never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """True once there is no time left to produce a useful answer."""
+        return time.monotonic() >= self.expires_at
@@ -0,0 +1,332 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import re
+import json
+import zlib
+import threading
+import numpy as np
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Prime just above 2**32 for the universal hash family used by MinHash.
+_PRIME = np.uint64(4294967311)
+_WORD = re.compile(r"\w+")
+
+
+def minhash(
+    text: str, permutations: np.ndarray, shingle_size: int = 3
+) -> np.ndarray:
+    """
+    MinHash signature of the word `shingle_size`-grams of `text`.
+
+    Args:
+        text (str): Document text; case and punctuation are ignored.
+        permutations (np.ndarray): (2, n) uint64 hash coefficients, one column per signature value.
+        shingle_size (int): Words per shingle.
+
+    Returns:
+        np.ndarray: n uint32 values; the fraction of equal values estimates the Jaccard similarity.
+    """
+    words = _WORD.findall(text.lower())
+    count = max(len(words) - shingle_size + 1, 1)
+    shingles = {" ".join(words[i : i + shingle_size]) for i in range(count)}
+    hashes = np.fromiter(
+        (zlib.crc32(s.encode("utf-8")) for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+    a, b = permutations
+    return ((np.outer(hashes, a) + b) % _PRIME).min(axis=0).astype(np.uint32)
+
+
+class Deduplicator:
+    """
+    Finds near-duplicate documents at ingest and keeps them as aliases of one canonical document.
+
+    Documents are compared by MinHash signatures over word shingles. Candidates come from
+    locality-sensitive hashing (the signature split into `bands`, one bucket table per
+    band) and are accepted when the estimated Jaccard similarity reaches `threshold`
+    and the metadata is identical, so metadata filters still see every alias.
+
+    Only canonical documents are written to the collections and indexes. Aliases stay
+    addressable: search results list them right after their canonical document (`expand`),
+    they can be updated and deleted, and deleting a canonical document promotes one of
+    its aliases in its place.
+
+    The registry does not depend on the embedding model. With a `path` every change is
+    appended to a JSON-lines log that is replayed and compacted at startup.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.9,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 3,
+        path: Optional[str] = None,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError(
+                f"{num_perm} permutations cannot be split into {bands} bands."
+            )
+        self.threshold = threshold
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.path = path
+        rng = np.random.default_rng(seed)
+        self._permutations = rng.integers(
+            1, 2**31, size=(2, num_perm), dtype=np.int64
+        ).astype(np.uint64)
+        self._lock = threading.Lock()
+        # Canonical id -> (signature, metadata key).
+        self._canonical: Dict[str, Tuple[np.ndarray, str]] = {}
+        self._aliases: Dict[str, Set[str]] = {}
+        self._alias_of: Dict[str, str] = {}
+        self._buckets: List[Dict[bytes, Set[str]]] = [{} for _ in range(bands)]
+        self._log = None
+        if path is not None:
+            self._replay(path)
+            self._compact(path)
+            self._log = open(path, "a", encoding="utf-8")
+
+    def signature(self, text: str) -> np.ndarray:
+        return minhash(text, self._permutations, self.shingle_size)
+
+    @staticmethod
+    def metadata_key(metadata: Optional[Dict[str, Any]]) -> str:
+        return json.dumps(metadata or {}, sort_keys=True)
+
+    def _bands(self, signature: np.ndarray):
+        return enumerate(np.split(signature, self.bands))
+
+    def __len__(self) -> int:
+        return len(self._canonical)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._canonical or doc_id in self._alias_of
+
+    def canonical_of(self, doc_id: str) -> Optional[str]:
+        """The canonical id `doc_id` is stored under, or None if it is unknown."""
+        if doc_id in self._canonical:
+            return doc_id
+        return self._alias_of.get(doc_id)
+
+    def aliases(self, doc_id: str) -> List[str]:
+        return sorted(self._aliases.get(doc_id, ()))
+
+    def expand(self, doc_ids: List[str], k: int) -> List[str]:
+        """
+        Follows each ranked canonical id with its aliases and keeps the first k.
+
+        The aliases have the same text and metadata, so this is the ranking an index
+        holding every copy would return, and a relevant alias can still be found.
+        """
+        if not self._aliases:
+            return doc_ids[:k]
+        expanded = []
+        with self._lock:
+            for doc_id in doc_ids:
+                expanded.append(doc_id)
+                expanded.extend(sorted(self._aliases.get(doc_id, ())))
+                if len(expanded) >= k:
+                    break
+        return expanded[:k]
+
+    def match(
+        self, signature: np.ndarray, metadata: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """Returns the canonical document `signature` duplicates, or None."""
+        key = self.metadata_key(metadata)
+        best, best_similarity = None, self.threshold
+        with self._lock:
+            candidates = set()
+            for band, values in self._bands(signature):
+                candidates |= self._buckets[band].get(values.tobytes(), set())
+            for candidate in candidates:
+                other, other_key = self._canonical[candidate]
+                similarity = float(np.mean(other == signature))
+                if other_key == key and similarity >= best_similarity:
+                    best, best_similarity = candidate, similarity
+        return best
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        if self._log is not None:
+            self._log.write(json.dumps(entry) + "\n")
+            self._log.flush()
+
+    def _add_canonical(
+        self, doc_id: str, signature: np.ndarray, key: str
+    ) -> None:
+        self._canonical[doc_id] = (signature, key)
+        for band, values in self._bands(signature):
+            self._buckets[band].setdefault(values.tobytes(), set()).add(doc_id)
+
+    def _remove_canonical(self, doc_id: str) -> Tuple[np.ndarray, str]:
+        signature, key = self._canonical.pop(doc_id)
+        for band, values in self._bands(signature):
+            bucket = self._buckets[band].get(values.tobytes())
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del self._buckets[band][values.tobytes()]
+        return signature, key
+
+    def _add_alias(self, doc_id: str, canonical: str) -> None:
+        self._alias_of[doc_id] = canonical
+        self._aliases.setdefault(canonical, set()).add(doc_id)
+
+    def _remove_alias(self, doc_id: str) -> None:
+        canonical = self._alias_of.pop(doc_id)
+        aliases = self._aliases[canonical]
+        aliases.discard(doc_id)
+        if not aliases:
+            del self._aliases[canonical]
+
+    def add(
+        self,
+        doc_id: str,
+        signature: np.ndarray,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> Optional[str]:
+        """
+        Registers a new document, as an alias if it duplicates a canonical one.
+
+        `doc_id` must not be registered; `remove` it first when its content changes.
+
+        Returns:
+            Optional[str]: The canonical id it became an alias of, or None if it is canonical itself.
+        """
+        canonical = self.match(signature, metadata)
+        with self._lock:
+            if canonical is not None and canonical in self._canonical:
+                self._add_alias(doc_id, canonical)
+                self._write({"op": "alias", "id": doc_id, "of": canonical})
+                return canonical
+            key = self.metadata_key(metadata)
+            self._add_canonical(doc_id, signature, key)
+            self._write(
+                {
+                    "op": "canonical",
+                    "id": doc_id,
+                    "signature": signature.tolist(),
+                    "metadata": key,
+                }
+            )
+            return None
+
+    def remove(self, doc_id: str) -> Optional[str]:
+        """
+        Unregisters a document.
+
+        Returns:
+            Optional[str]: If `doc_id` was canonical and had aliases, the alias promoted to
+            take its place; the caller must store the canonical vector under that id.
+        """
+        with self._lock:
+            if doc_id in self._alias_of:
+                self._remove_alias(doc_id)
+                self._write({"op": "remove", "id": doc_id})
+                return None
+            if doc_id not in self._canonical:
+                return None
+            signature, key = self._remove_canonical(doc_id)
+            aliases = self._aliases.pop(doc_id, set())
+            self._write({"op": "remove", "id": doc_id})
+            if not aliases:
+                return None
+            promoted = min(aliases)
+            aliases.discard(promoted)
+            del self._alias_of[promoted]
+            self._add_canonical(promoted, signature, key)
+            self._write(
+                {
+                    "op": "canonical",
+                    "id": promoted,
+                    "signature": signature.tolist(),
+                    "metadata": key,
+                }
+            )
+            for alias in aliases:
+                self._add_alias(alias, promoted)
+                self._write({"op": "alias", "id": alias, "of": promoted})
+            return promoted
+
+    def _replay(self, path: str) -> None:
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash while appending can leave a partial last line.
+                    continue
+                doc_id = entry["id"]
+                if doc_id in self._alias_of:
+                    self._remove_alias(doc_id)
+                elif doc_id in self._canonical:
+                    self._remove_canonical(doc_id)
+                if entry["op"] == "canonical":
+                    self._add_canonical(
+                        doc_id,
+                        np.asarray(entry["signature"], dtype=np.uint32),
+                        entry["metadata"],
+                    )
+                elif entry["op"] == "alias":
+                    self._add_alias(doc_id, entry["of"])
+
+    def _compact(self, path: str) -> None:
+        """Rewrites the log with one entry per registered document."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for doc_id, (signature, key) in self._canonical.items():
+                f.write(
+                    json.dumps(
+                        {
+                            "op": "canonical",
+                            "id": doc_id,
+                            "signature": signature.tolist(),
+                            "metadata": key,
+                        }
+                    )
+                    + "\n"
+                )
+            for doc_id, canonical in self._alias_of.items():
+                f.write(
+                    json.dumps({"op": "alias", "id": doc_id, "of": canonical})
+                    + "\n"
+                )
+        os.replace(tmp_path, path)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    def status(self) -> Dict[str, Any]:
+        canonical, aliases = len(self._canonical), len(self._alias_of)
+        return {
+            "canonical_documents": canonical,
+            "aliases": aliases,
+            "dedup_ratio": aliases / (canonical + aliases)
+            if canonical + aliases
+            else 0.0,
+        }
@@ -0,0 +1,473 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import json
+import math
+import operator
+import re
+import sys
+import numpy as np
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# Roaring bitmaps split the 32-bit row space into 2^16 chunks. Each chunk is
+# stored as a sorted uint16 array while it is sparse and as a 1024-word bitset
+# once it holds more than ARRAY_CONTAINER_MAX rows.
+ARRAY_CONTAINER_MAX = 4096
+_CHUNK_SIZE = 1 << 16
+
+_POPCOUNT_TABLE = np.array(
+    [bin(i).count("1") for i in range(256)], dtype=np.uint8
+)
+
+_RANGE_OPERATORS: Dict[str, Callable[[Any, Any], Any]] = {
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+}
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """Counts the set bits of every byte-aligned word along the last axis."""
+    words = np.ascontiguousarray(words)
+    if hasattr(np, "bitwise_count"):
+        counts = np.bitwise_count(words)
+    else:
+        counts = (
+            _POPCOUNT_TABLE[words.view(np.uint8)]
+            .reshape(*words.shape, -1)
+            .sum(axis=-1)
+        )
+    return counts.astype(np.int64)
+
+
+def _to_bits(container: np.ndarray) -> np.ndarray:
+    if container.dtype == np.uint64:
+        return container
+    mask = np.zeros(_CHUNK_SIZE, dtype=bool)
+    mask[container] = True
+    return np.packbits(mask, bitorder="little").view("<u8")
+
+
+def _to_values(container: np.ndarray) -> np.ndarray:
+    if container.dtype == np.uint16:
+        return container
+    return np.flatnonzero(
+        np.unpackbits(container.view(np.uint8), bitorder="little")
+    ).astype(np.uint16)
+
+
+def _cardinality(container: np.ndarray) -> int:
+    if container.dtype == np.uint16:
+        return int(container.size)
+    return int(popcount(container).sum())
+
+
+def _compact(container: np.ndarray) -> Optional[np.ndarray]:
+    """Picks the cheaper container representation, or None if it is empty."""
+    count = _cardinality(container)
+    if count == 0:
+        return None
+    if container.dtype == np.uint64 and count <= ARRAY_CONTAINER_MAX:
+        return _to_values(container)
+    if container.dtype == np.uint16 and count > ARRAY_CONTAINER_MAX:
+        return _to_bits(container)
+    return container
+
+
+class RoaringBitmap:
+    """
+    A compressed set of non-negative row numbers in the style of Roaring bitmaps.
+
+    Set operations run chunk by chunk, using sorted-array merges for sparse
+    chunks and word-wise bit operations for dense ones, so filters over millions
+    of rows combine in time proportional to the compressed size.
+    """
+
+    __slots__ = ("_containers",)
+
+    def __init__(self, containers: Optional[Dict[int, np.ndarray]] = None):
+        self._containers: Dict[int, np.ndarray] = containers or {}
+
+    @classmethod
+    def from_array(cls, values: Iterable[int]) -> "RoaringBitmap":
+        values = np.unique(np.asarray(values, dtype=np.int64))
+        if values.size and values[0] < 0:
+            raise ValueError("RoaringBitmap only holds non-negative integers.")
+        high = values >> 16
+        keys, starts = np.unique(high, return_index=True)
+        containers = {}
+        for key, chunk in zip(keys, np.split(values, starts[1:])):
+            containers[int(key)] = _compact((chunk & 0xFFFF).astype(np.uint16))
+        return cls(containers)
+
+    def add(self, value: int) -> None:
+        key, low = value >> 16, np.uint16(value & 0xFFFF)
+        container = self._containers.get(key)
+        if container is None:
+            self._containers[key] = np.array([low], dtype=np.uint16)
+        elif container.dtype == np.uint16:
+            position = np.searchsorted(container, low)
+            if position == container.size or container[position] != low:
+                self._containers[key] = _compact(
+                    np.insert(container, position, low)
+                )
+        else:
+            container[int(low) >> 6] |= np.uint64(1) << np.uint64(
+                int(low) & 63
+            )
+
+    def discard(self, value: int) -> None:
+        key, low = value >> 16, np.uint16(value & 0xFFFF)
+        container = self._containers.get(key)
+        if container is None:
+            return
+        if container.dtype == np.uint16:
+            position = np.searchsorted(container, low)
+            if position == container.size or container[position] != low:
+                return
+            container = np.delete(container, position)
+        else:
+            container = container.copy()
+            container[int(low) >> 6] &= ~(
+                np.uint64(1) << np.uint64(int(low) & 63)
+            )
+        container = _compact(container)
+        if container is None:
+            del self._containers[key]
+        else:
+            self._containers[key] = container
+
+    def memory_bytes(self) -> int:
+        """Bytes held by the containers and the dict that maps chunks to them."""
+        return sys.getsizeof(self._containers) + sum(
+            sys.getsizeof(container) for container in self._containers.values()
+        )
+
+    def __contains__(self, value: int) -> bool:
+        container = self._containers.get(value >> 16)
+        if container is None:
+            return False
+        low = value & 0xFFFF
+        if container.dtype == np.uint16:
+            position = np.searchsorted(container, low)
+            return bool(
+                position < container.size and container[position] == low
+            )
+        return bool((int(container[low >> 6]) >> (low & 63)) & 1)
+
+    def __len__(self) -> int:
+        return sum(
+            _cardinality(container) for container in self._containers.values()
+        )
+
+    def __bool__(self) -> bool:
+        return bool(self._containers)
+
+    def _combine(
+        self, other: "RoaringBitmap", keys: Iterable[int], array_op, bits_op
+    ) -> "RoaringBitmap":
+        containers = {}
+        empty = np.empty(0, dtype=np.uint16)
+        for key in keys:
+            a = self._containers.get(key, empty)
+            b = other._containers.get(key, empty)
+            if a.dtype == np.uint16 and b.dtype == np.uint16:
+                result = array_op(a, b).astype(np.uint16)
+            else:
+                result = bits_op(_to_bits(a), _to_bits(b))
+            result = _compact(result)
+            if result is not None:
+                containers[key] = result
+        return RoaringBitmap(containers)
+
+    def __or__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        keys = self._containers.keys() | other._containers.keys()
+        return self._combine(other, keys, np.union1d, np.bitwise_or)
+
+    def __and__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        keys = self._containers.keys() & other._containers.keys()
+        return self._combine(
+            other,
+            keys,
+            lambda a, b: np.intersect1d(a, b, assume_unique=True),
+            np.bitwise_and,
+        )
+
+    def __sub__(self, other: "RoaringBitmap") -> "RoaringBitmap":
+        return self._combine(
+            other,
+            list(self._containers.keys()),
+            lambda a, b: np.setdiff1d(a, b, assume_unique=True),
+            lambda a, b: a & ~b,
+        )
+
+    def to_array(self) -> np.ndarray:
+        """Returns the members as a sorted int64 array."""
+        if not self._containers:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(
+            [
+                (np.int64(key) << 16)
+                | _to_values(self._containers[key]).astype(np.int64)
+                for key in sorted(self._containers)
+            ]
+        )
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _bitmap_key(value: Any) -> Any:
+    """The key of `value`'s equality bitmap; booleans are tagged because True == 1 in Python."""
+    return (bool, value) if isinstance(value, bool) else value
+
+
+# Integers without leading zeros, so that codes such as "02134" stay strings.
+_INTEGER = re.compile(r"[+-]?(0|[1-9][0-9]*)")
+_FLOAT = re.compile(
+    r"[+-]?(0|[1-9][0-9]*)?\.[0-9]+([eE][+-]?[0-9]+)?|[+-]?(0|[1-9][0-9]*)[eE][+-]?[0-9]+"
+)
+
+
+def parse_metadata_value(text: str) -> Any:
+    """
+    Converts a metadata value read as text, such as a CSV cell, to the type filters compare.
+
+    Integers and decimals become numbers, so range filters such as `{"date": {"$gte": 20240101}}`
+    match them; `true` and `false` become booleans. Anything else, including numbers with
+    leading zeros, stays a string.
+    """
+    stripped = text.strip()
+    if _INTEGER.fullmatch(stripped):
+        return int(stripped)
+    if _FLOAT.fullmatch(stripped):
+        value = float(stripped)
+        if math.isfinite(value):
+            return value
+    lowered = stripped.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    return text
+
+
+class MetadataIndex:
+    """
+    Inverted bitmap index over document metadata, keyed by index row.
+
+    Every distinct (field, value) pair owns a `RoaringBitmap` of the rows that
+    carry it; list values such as access-control groups add the row to each
+    member's bitmap. Numeric fields are also kept as a float64 column so range
+    filters over dates or sizes are a single vectorized comparison.
+
+    Filters use the ChromaDB `where` syntax: `{"department": "legal"}`,
+    `{"date": {"$gte": 20240101}}`, `{"acl": {"$in": ["eng", "ops"]}}`, and
+    `$and` / `$or` lists combining them.
+
+    The metadata of each row is kept as compact JSON in one shared buffer rather
+    than as a dict per row, and decoded again by `get`. Space freed by updates
+    and deletes is reclaimed once it makes up half of the buffer.
+    """
+
+    def __init__(self):
+        self._bitmaps: Dict[str, Dict[Any, RoaringBitmap]] = defaultdict(dict)
+        self._numeric: Dict[str, np.ndarray] = {}
+        # Row r is _data[_offsets[r]:_offsets[r] + _lengths[r]]; -1 marks rows without metadata.
+        self._data = bytearray()
+        self._offsets = np.zeros(0, dtype=np.int64)
+        self._lengths = np.full(0, -1, dtype=np.int32)
+        self._garbage = 0
+        self._all = RoaringBitmap()
+
+    def _has(self, row: int) -> bool:
+        return row < len(self._lengths) and self._lengths[row] >= 0
+
+    def get(self, row: int) -> Dict[str, Any]:
+        if not self._has(row) or self._lengths[row] == 0:
+            return {}
+        start = int(self._offsets[row])
+        return json.loads(self._data[start : start + int(self._lengths[row])])
+
+    def _store(self, row: int, metadata: Dict[str, Any]) -> None:
+        if row >= len(self._lengths):
+            capacity = max(2 * len(self._lengths), row + 1, 1024)
+            offsets = np.zeros(capacity, dtype=np.int64)
+            offsets[: len(self._offsets)] = self._offsets
+            lengths = np.full(capacity, -1, dtype=np.int32)
+            lengths[: len(self._lengths)] = self._lengths
+            self._offsets, self._lengths = offsets, lengths
+        encoded = (
+            json.dumps(metadata, separators=(",", ":")).encode("utf-8")
+            if metadata
+            else b""
+        )
+        self._offsets[row] = len(self._data)
+        self._lengths[row] = len(encoded)
+        self._data += encoded
+
+    def _compact(self) -> None:
+        rows = np.flatnonzero(self._lengths > 0)
+        data = bytearray()
+        for row in rows.tolist():
+            start = int(self._offsets[row])
+            self._offsets[row] = len(data)
+            data += self._data[start : start + int(self._lengths[row])]
+        self._data = data
+        self._garbage = 0
+
+    def memory_bytes(self) -> int:
+        """Bytes held by the stored metadata, the bitmaps and the numeric columns."""
+        total = len(self._data) + self._offsets.nbytes + self._lengths.nbytes
+        total += self._all.memory_bytes()
+        total += sum(column.nbytes for column in self._numeric.values())
+        for values in self._bitmaps.values():
+            total += sys.getsizeof(values)
+            total += sum(bitmap.memory_bytes() for bitmap in values.values())
+        return total
+
+    def set(self, row: int, metadata: Optional[Dict[str, Any]]) -> None:
+        """Replaces the metadata stored for `row`."""
+        self.remove(row)
+        metadata = dict(metadata or {})
+        self._store(row, metadata)
+        self._all.add(row)
+        for field, value in metadata.items():
+            values = value if isinstance(value, (list, tuple)) else [value]
+            for item in values:
+                key = _bitmap_key(item)
+                bitmap = self._bitmaps[field].get(key)
+                if bitmap is None:
+                    bitmap = self._bitmaps[field][key] = RoaringBitmap()
+                bitmap.add(row)
+            if _is_number(value):
+                column = self._numeric.get(field)
+                if column is None or row >= column.size:
+                    grown = np.full(max(2 * row + 2, 1024), np.nan)
+                    if column is not None:
+                        grown[: column.size] = column
+                    column = self._numeric[field] = grown
+                column[row] = value
+
+    def remove(self, row: int) -> None:
+        """Drops `row` from every bitmap it belongs to."""
+        if not self._has(row):
+            return
+        metadata = self.get(row)
+        self._garbage += int(self._lengths[row])
+        self._lengths[row] = -1
+        if self._garbage > 4096 and 2 * self._garbage > len(self._data):
+            self._compact()
+        self._all.discard(row)
+        for field, value in metadata.items():
+            values = value if isinstance(value, (list, tuple)) else [value]
+            for item in values:
+                key = _bitmap_key(item)
+                bitmap = self._bitmaps[field].get(key)
+                if bitmap is not None:
+                    bitmap.discard(row)
+                    if not bitmap:
+                        del self._bitmaps[field][key]
+            if field in self._numeric and row < self._numeric[field].size:
+                self._numeric[field][row] = np.nan
+
+    def evaluate(self, where: Dict[str, Any]) -> RoaringBitmap:
+        """
+        Resolves a filter expression to the set of matching rows.
+
+        Raises:
+            ValueError: If the expression is malformed or uses an unknown operator.
+        """
+        if not isinstance(where, dict) or not where:
+            raise ValueError(
+                f"Filter must be a non-empty dict, got {where!r}."
+            )
+        result = None
+        for key, condition in where.items():
+            if key in ("$and", "$or"):
+                if not isinstance(condition, list) or not condition:
+                    raise ValueError(
+                        f"{key} expects a non-empty list of filters."
+                    )
+                parts = [self.evaluate(part) for part in condition]
+                bitmap = parts[0]
+                for part in parts[1:]:
+                    bitmap = bitmap & part if key == "$and" else bitmap | part
+            elif key.startswith("$"):
+                raise ValueError(f"Unsupported filter operator {key}.")
+            else:
+                bitmap = self._evaluate_field(key, condition)
+            result = bitmap if result is None else result & bitmap
+        return result
+
+    def _evaluate_field(self, field: str, condition: Any) -> RoaringBitmap:
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        result = None
+        for op, operand in condition.items():
+            if op == "$eq":
+                bitmap = self._equals(field, operand)
+            elif op == "$ne":
+                bitmap = self._all - self._equals(field, operand)
+            elif op in ("$in", "$nin"):
+                if not isinstance(operand, list):
+                    raise ValueError(f"{op} expects a list, got {operand!r}.")
+                bitmap = RoaringBitmap()
+                for value in operand:
+                    bitmap = bitmap | self._equals(field, value)
+                if op == "$nin":
+                    bitmap = self._all - bitmap
+            elif op in _RANGE_OPERATORS:
+                bitmap = self._range(field, _RANGE_OPERATORS[op], operand)
+            else:
+                raise ValueError(f"Unsupported filter operator {op}.")
+            result = bitmap if result is None else result & bitmap
+        if result is None:
+            raise ValueError(f"Empty condition for field {field!r}.")
+        return result
+
+    def _equals(self, field: str, value: Any) -> RoaringBitmap:
+        try:
+            return self._bitmaps.get(field, {}).get(
+                _bitmap_key(value), RoaringBitmap()
+            )
+        except TypeError:
+            raise ValueError(f"Cannot compare field {field!r} with {value!r}.")
+
+    def _range(
+        self, field: str, compare: Callable[[Any, Any], Any], operand: Any
+    ) -> RoaringBitmap:
+        if _is_number(operand):
+            column = self._numeric.get(field)
+            if column is None:
+                return RoaringBitmap()
+            with np.errstate(invalid="ignore"):
+                return RoaringBitmap.from_array(
+                    np.flatnonzero(compare(column, operand))
+                )
+        if not isinstance(operand, str):
+            raise ValueError(
+                f"Range filters need a number or string, got {operand!r}."
+            )
+        # Strings such as ISO dates compare lexicographically; union the
+        # bitmaps of every value on the right side of the bound.
+        bitmap = RoaringBitmap()
+        for value, rows in self._bitmaps.get(field, {}).items():
+            if isinstance(value, str) and compare(value, operand):
+                bitmap = bitmap | rows
+        return bitmap
@@ -0,0 +1,268 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import struct
+import threading
+import numpy as np
+from typing import Iterable, List, Optional, Sequence
+
+_LENGTH = struct.Struct("<I")
+_EMPTY = -1
+
+
+class IdTable:
+    """
+    Interns external document ids as dense int32 keys.
+
+    Indexes store and return keys; strings are only looked up again for the ids that
+    end up in a response. Keys are never reused while the table is open, so a key stays
+    valid for as long as anything holds it and a re-inserted document gets its old key
+    back. One table is shared by every index of the miner, which keeps keys comparable
+    across embedding spaces.
+
+    The ids are kept as one UTF-8 buffer with an offset and a hash per key, and looked up
+    through an open-addressing table of int32 keys. An id costs its bytes plus about 32
+    bytes instead of a Python string, dict entry and list slot, in exchange for slower
+    lookups; `scripts/id_table_report.py` measures both.
+
+    With a `path` the table is persisted as an append-only file of length-prefixed UTF-8
+    ids, so keys are stable across restarts until `compact` drops the ids of deleted
+    documents.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._clear()
+        self._file = None
+        if path is not None:
+            self._load(path)
+            self._file = open(path, "ab")
+
+    def _clear(self) -> None:
+        self._data = bytearray()
+        # Key i is _data[_offsets[i]:_offsets[i + 1]].
+        self._offsets = np.zeros(1024 + 1, dtype=np.int64)
+        self._hashes = np.zeros(1024, dtype=np.int64)
+        self._count = 0
+        self._slots = np.full(2048, _EMPTY, dtype=np.int32)
+
+    def _load(self, path: str) -> None:
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        offset = 0
+        ids = []
+        while offset + _LENGTH.size <= len(data):
+            (length,) = _LENGTH.unpack_from(data, offset)
+            end = offset + _LENGTH.size + length
+            if end > len(data):
+                break
+            ids.append(data[offset + _LENGTH.size : end].decode("utf-8"))
+            offset = end
+        self._extend(ids)
+        if offset < len(data):
+            # A crash while appending left a partial record behind.
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+
+    @staticmethod
+    def _hash(ids: Sequence[str]) -> np.ndarray:
+        return np.fromiter(
+            (hash(doc_id) for doc_id in ids), dtype=np.int64, count=len(ids)
+        )
+
+    def _home(self, hashes: np.ndarray) -> np.ndarray:
+        return (
+            hashes.view(np.uint64) & np.uint64(len(self._slots) - 1)
+        ).astype(np.int64)
+
+    def _find(self, ids: Sequence[str], hashes: np.ndarray) -> np.ndarray:
+        """Keys of `ids` by linear probing, all ids at once; -1 for unknown ids."""
+        keys = np.full(len(ids), -1, dtype=np.int32)
+        slots, stored_hashes = self._slots, self._hashes
+        mask = len(slots) - 1
+        pending = np.arange(len(ids))
+        positions = self._home(hashes)
+        while pending.size:
+            candidates = slots[positions]
+            found = candidates != _EMPTY
+            same = np.flatnonzero(
+                found
+                & (stored_hashes[np.maximum(candidates, 0)] == hashes[pending])
+            )
+            if same.size:
+                # Equal hashes almost always mean equal ids, but only the bytes can tell.
+                data, offsets = self._data, self._offsets
+                matched = candidates[same]
+                equal = np.fromiter(
+                    (
+                        data[start:end] == ids[i].encode("utf-8")
+                        for start, end, i in zip(
+                            offsets[matched].tolist(),
+                            offsets[matched + 1].tolist(),
+                            pending[same].tolist(),
+                        )
+                    ),
+                    dtype=bool,
+                    count=same.size,
+                )
+                keys[pending[same[equal]]] = matched[equal]
+                found[same[equal]] = False
+            pending, positions = pending[found], (positions[found] + 1) & mask
+        return keys
+
+    def _insert_slots(self, keys: np.ndarray) -> None:
+        """Places `keys` in the slot table; ids must not be in it yet."""
+        slots, mask = self._slots, len(self._slots) - 1
+        positions = self._home(self._hashes[keys])
+        while keys.size:
+            free = slots[positions] == _EMPTY
+            # Of several keys probing the same free slot, the first one takes it.
+            taken, first = np.unique(positions[free], return_index=True)
+            placed = np.flatnonzero(free)[first]
+            slots[taken] = keys[placed]
+            rest = np.ones(keys.size, dtype=bool)
+            rest[placed] = False
+            keys, positions = keys[rest], (positions[rest] + 1) & mask
+
+    def _extend(self, ids: List[str]) -> None:
+        """Appends ids that are known to be new and distinct."""
+        count = self._count + len(ids)
+        if count > np.iinfo(np.int32).max:
+            raise OverflowError("The id table is full.")
+        encoded = [doc_id.encode("utf-8") for doc_id in ids]
+        if count >= len(self._hashes):
+            capacity = max(count, 2 * len(self._hashes))
+            offsets = np.zeros(capacity + 1, dtype=np.int64)
+            offsets[: self._count + 1] = self._offsets[: self._count + 1]
+            hashes = np.zeros(capacity, dtype=np.int64)
+            hashes[: self._count] = self._hashes[: self._count]
+            self._offsets, self._hashes = offsets, hashes
+        first = self._count
+        self._offsets[first + 1 : count + 1] = len(self._data) + np.cumsum(
+            [len(raw) for raw in encoded], dtype=np.int64
+        )
+        self._hashes[first:count] = self._hash(ids)
+        self._data.extend(b"".join(encoded))
+        self._count = count
+        if 2 * count > len(self._slots):
+            # Keep the slot table at most half full so probes stay short.
+            size = len(self._slots)
+            while 2 * count > size:
+                size *= 2
+            self._slots = np.full(size, _EMPTY, dtype=np.int32)
+            self._insert_slots(np.arange(count, dtype=np.int32))
+        else:
+            self._insert_slots(np.arange(first, count, dtype=np.int32))
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, doc_id: str) -> bool:
+        return int(self.get([doc_id])[0]) >= 0
+
+    def memory_bytes(self) -> int:
+        return (
+            len(self._data)
+            + self._offsets.nbytes
+            + self._hashes.nbytes
+            + self._slots.nbytes
+        )
+
+    def intern(self, ids: Iterable[str]) -> np.ndarray:
+        """Returns the keys of `ids`, assigning new keys to ids not seen before."""
+        ids = list(ids)
+        hashes = self._hash(ids)
+        with self._lock:
+            keys = self._find(ids, hashes)
+            missing = np.flatnonzero(keys < 0)
+            if missing.size:
+                added = list(dict.fromkeys(ids[i] for i in missing))
+                first = self._count
+                self._extend(added)
+                new_keys = {
+                    doc_id: first + j for j, doc_id in enumerate(added)
+                }
+                keys[missing] = [new_keys[ids[i]] for i in missing]
+                if self._file is not None:
+                    self._file.write(self._records(first))
+                    self._file.flush()
+        return keys
+
+    def _records(self, first: int) -> bytes:
+        """The file records of keys `first` and up."""
+        data, offsets = (
+            self._data,
+            self._offsets[first : self._count + 1].tolist(),
+        )
+        return b"".join(
+            _LENGTH.pack(end - start) + data[start:end]
+            for start, end in zip(offsets, offsets[1:])
+        )
+
+    def get(self, ids: Iterable[str]) -> np.ndarray:
+        """Returns the keys of `ids` without interning them; unknown ids map to -1."""
+        ids = list(ids)
+        hashes = self._hash(ids)
+        with self._lock:
+            return self._find(ids, hashes)
+
+    def decode(self, keys: Sequence[int]) -> List[str]:
+        """Materializes the external ids for `keys`."""
+        data, offsets = self._data, self._offsets
+        keys = np.asarray(keys, dtype=np.int64)
+        return [
+            data[start:end].decode("utf-8")
+            for start, end in zip(
+                offsets[keys].tolist(), offsets[keys + 1].tolist()
+            )
+        ]
+
+    def compact(self, keep: Iterable[str]) -> int:
+        """
+        Drops every id not in `keep` and rewrites the file; returns how many ids were dropped.
+
+        The kept ids keep their relative order but get new keys, so this may only run
+        while nothing holds keys, i.e. before any index has been loaded.
+        """
+        with self._lock:
+            keep = list(keep)
+            keys = np.unique(self._find(keep, self._hash(keep)))
+            keys = keys[keys >= 0]
+            ids = self.decode(keys)
+            dropped = self._count - len(ids)
+            self._clear()
+            self._extend(ids)
+            if self._file is not None:
+                self._file.close()
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(self._records(0))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                self._file = open(self.path, "ab")
+        return dropped
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,626 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import threading
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from cers_subnet.miner.deadline import Deadline
+from cers_subnet.miner.filters import MetadataIndex
+from cers_subnet.miner.ids import IdTable
+
+
+class SearchResult(NamedTuple):
+    """Ranked document keys returned by an index, best first. `IdTable.decode` turns keys into ids."""
+
+    keys: np.ndarray
+    scores: np.ndarray
+    # False when the search stopped early because its deadline ran out.
+    complete: bool
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalizes the last axis so inner products become cosine similarities."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Returns the positions of the k largest scores, sorted best first."""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if scores.size > k:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class BaseIndex(ABC):
+    """
+    Row bookkeeping, metadata filtering and the deadline-aware scan shared by every index backend.
+
+    Document ids are interned as int32 keys in an `IdTable` and assigned dense row
+    numbers; backends only store and score rows, and searches return keys.
+    Rows are scanned in fixed-size blocks and the deadline is checked between
+    blocks, so a search that runs out of time returns the best top-k found so far
+    instead of an answer the validator will no longer accept.
+
+    Document metadata is indexed in a `MetadataIndex`. Filtered searches resolve
+    the filter to a bitmap of rows first and only score those rows, so selective
+    filters are cheaper than an unfiltered search and lose no recall.
+
+    An optional `prefilter` (e.g. a `BinaryPrefilter`) shortlists rows cheaply before
+    the backend scores them, whichever backend it is.
+
+    Backends implement `_resize`, `_write`, `_read` and `_score`. `_score_batch` is
+    optional: `search_batch` only uses it when a backend overrides it, and otherwise
+    scores one query at a time.
+    """
+
+    def __init__(
+        self,
+        block_size: int = 65536,
+        initial_capacity: int = 1024,
+        prefilter=None,
+        id_table: Optional[IdTable] = None,
+    ):
+        self.block_size = block_size
+        self.prefilter = prefilter
+        self.id_table = id_table if id_table is not None else IdTable()
+        self._initial_capacity = initial_capacity
+        self._lock = threading.Lock()
+        self._dim: Optional[int] = None
+        self._live = np.zeros(0, dtype=bool)
+        # row -> key and key -> row, -1 where unused.
+        self._keys = np.full(0, -1, dtype=np.int32)
+        self._rows = np.full(0, -1, dtype=np.int32)
+        self._count = 0
+        self._free: List[int] = []
+        self._size = 0
+        self.metadata = MetadataIndex()
+        # Bumped by every write so that cached search results can tell they are stale.
+        self.version = 0
+        # Called as listener(version, keys, vectors) after every write, in version order. vectors is
+        # None for deletes, and keys is None as well when every result may have changed.
+        self.write_listeners: List[
+            Callable[[int, Optional[np.ndarray], Optional[np.ndarray]], None]
+        ] = []
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self._dim
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _row_of(self, key: int) -> int:
+        return int(self._rows[key]) if 0 <= key < len(self._rows) else -1
+
+    def __contains__(self, doc_id: str) -> bool:
+        return self._row_of(int(self.id_table.get([doc_id])[0])) >= 0
+
+    def contains_key(self, key: int) -> bool:
+        return self._row_of(int(key)) >= 0
+
+    def keys(self) -> np.ndarray:
+        """Returns the keys currently in the index."""
+        keys = self._keys[: self._size]
+        return keys[keys >= 0]
+
+    def ids(self) -> List[str]:
+        """Returns the ids currently in the index."""
+        return self.id_table.decode(self.keys())
+
+    @property
+    def breadth(self) -> Optional[int]:
+        """
+        Candidates per query that are scored beyond the cheapest stage, or None if the index
+        has no such knob. Larger values cost latency and buy recall.
+        """
+        return self.prefilter.shortlist if self.prefilter is not None else None
+
+    @breadth.setter
+    def breadth(self, value: int) -> None:
+        if self.prefilter is None:
+            raise ValueError(
+                f"{type(self).__name__} has no search breadth to set."
+            )
+        self.prefilter.shortlist = value
+
+    @abstractmethod
+    def _resize(self, capacity: int, dim: int) -> None:
+        """Grows the backend storage to `capacity` rows, keeping the first `_size` rows."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _write(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """Stores normalized vectors at the given rows."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def _read(self, rows: np.ndarray) -> np.ndarray:
+        """Returns the full-precision normalized vectors stored at the given rows."""
+        raise NotImplementedError
+
+    def _prepare_query(self, query: np.ndarray):
+        """Turns a normalized query into whatever `_score` needs, e.g. a distance table."""
+        return query
+
+    @abstractmethod
+    def _score(self, block, prepared) -> np.ndarray:
+        """Scores the rows in `block` (a slice or an array of rows) against the prepared query."""
+        raise NotImplementedError
+
+    def _score_batch(self, block, queries: np.ndarray) -> np.ndarray:
+        """
+        Scores the rows in `block` against normalized queries of shape (queries, dim); returns (rows, queries).
+
+        Optional; `search_batch` only calls it when a backend overrides it.
+        """
+        raise NotImplementedError
+
+    def _exact_score(self, block, query: np.ndarray) -> np.ndarray:
+        """Full-precision scores for `exact_search`; the default assumes `_score` is already exact."""
+        return self._score(block, self._prepare_query(query))
+
+    def _shortlist_size(self, k: int) -> int:
+        """How many candidates the scan keeps before `_finalize` picks the final k."""
+        return k
+
+    def _finalize(
+        self, rows: np.ndarray, scores: np.ndarray, query: np.ndarray, k: int
+    ):
+        """Re-ranks the shortlist; the default keeps the scan scores."""
+        return rows[:k], scores[:k]
+
+    def _assigned(self, rows: np.ndarray) -> None:
+        """Called under the lock with rows that were just given to new documents."""
+
+    def _freed(self, rows: np.ndarray) -> None:
+        """Called under the lock with rows whose documents were just deleted."""
+
+    def restore(self) -> int:
+        """
+        Reopens the rows a persistent backend kept from an earlier run and returns how many.
+
+        Must be called before anything is written. The restored rows carry no metadata;
+        the caller upserts every stored document again and deletes the ids it did not
+        see. Backends without persistent state restore nothing.
+        """
+        return 0
+
+    def memory_bytes(self) -> int:
+        """
+        Bytes this index keeps in RAM: row bookkeeping, metadata, the prefilter's codes
+        and the id table, which is shared with the other indexes of the miner.
+
+        Backends add their own storage; memory-mapped files and ChromaDB are not counted.
+        """
+        total = self._live.nbytes + self._keys.nbytes + self._rows.nbytes
+        total += self.metadata.memory_bytes() + self.id_table.memory_bytes()
+        if self.prefilter is not None:
+            total += self.prefilter.memory_bytes()
+        return total
+
+    def _visible(
+        self, live: np.ndarray, exclude: Optional[np.ndarray]
+    ) -> np.ndarray:
+        """`live` without the rows of the `exclude` keys."""
+        if exclude is None or len(exclude) == 0:
+            return live
+        index = self._rows
+        exclude = exclude[(exclude >= 0) & (exclude < len(index))]
+        rows = index[exclude]
+        live = live.copy()
+        live[rows[(rows >= 0) & (rows < len(live))]] = False
+        return live
+
+    def _allocate_row(self, dim: int) -> int:
+        if self._free:
+            return self._free.pop()
+        if self._size == len(self._live):
+            # Doubling keeps appends amortized O(1). Readers keep the arrays they already hold.
+            capacity = max(self._initial_capacity, 2 * len(self._live))
+            live = np.zeros(capacity, dtype=bool)
+            live[: self._size] = self._live[: self._size]
+            keys = np.full(capacity, -1, dtype=np.int32)
+            keys[: self._size] = self._keys[: self._size]
+            self._resize(capacity, dim)
+            if self.prefilter is not None:
+                self.prefilter.resize(capacity, self._size, dim)
+            self._live, self._keys = live, keys
+        self._size += 1
+        return self._size - 1
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        embeddings,
+        metadatas: Optional[Sequence[Optional[Dict[str, Any]]]] = None,
+    ) -> None:
+        """
+        Inserts or replaces the vectors for the given document ids.
+
+        Args:
+            ids (Sequence[str]): Document ids, one per embedding.
+            embeddings: Array-like of shape (len(ids), dim).
+            metadatas (Optional[Sequence[Optional[Dict[str, Any]]]]): Metadata per document, replacing any stored before.
+        """
+        vectors = normalize(np.atleast_2d(embeddings))
+        if len(ids) != len(vectors):
+            raise ValueError(
+                f"Got {len(ids)} ids for {len(vectors)} embeddings."
+            )
+        dim = vectors.shape[1]
+        keys = self.id_table.intern(ids)
+        with self._lock:
+            if self._dim is not None and dim != self._dim:
+                raise ValueError(
+                    f"Embedding dimension {dim} does not match index dimension {self._dim}."
+                )
+            self._dim = dim
+            if len(keys) and keys.max() >= len(self._rows):
+                grown = np.full(
+                    max(int(keys.max()) + 1, 2 * len(self._rows)),
+                    -1,
+                    dtype=np.int32,
+                )
+                grown[: len(self._rows)] = self._rows
+                self._rows = grown
+            rows = np.empty(len(ids), dtype=np.int64)
+            assigned = []
+            for i, key in enumerate(keys):
+                row = int(self._rows[key])
+                if row < 0:
+                    row = self._allocate_row(dim)
+                    self._rows[key] = row
+                    self._keys[row] = key
+                    self._count += 1
+                    assigned.append(row)
+                rows[i] = row
+                self.metadata.set(row, metadatas[i] if metadatas else None)
+            self._write(rows, vectors)
+            if assigned:
+                self._assigned(np.asarray(assigned, dtype=np.int64))
+            if self.prefilter is not None:
+                self.prefilter.write(rows, vectors)
+            self._live[rows] = True
+            self.version += 1
+            for listener in self.write_listeners:
+                listener(self.version, keys, vectors)
+
+    def batches(self, batch_size: int = 10000):
+        """
+        Yields (ids, vectors, metadatas) for every document in the index, `batch_size` rows at a time.
+
+        Each batch is read under the write lock, so it is consistent on its own.
+        """
+        for start in range(0, self._size, batch_size):
+            with self._lock:
+                rows = np.arange(start, min(start + batch_size, self._size))
+                rows = rows[self._live[rows]]
+                if rows.size == 0:
+                    continue
+                ids = self.id_table.decode(self._keys[rows])
+                vectors = np.array(self._read(rows), dtype=np.float32)
+                metadatas = [self.metadata.get(int(row)) for row in rows]
+            yield ids, vectors, metadatas
+
+    def delete(self, ids: Sequence[str]) -> int:
+        """Removes the given ids and returns how many were present."""
+        removed, freed = [], []
+        keys = self.id_table.get(ids)
+        with self._lock:
+            for key in keys:
+                row = self._row_of(int(key))
+                if row < 0:
+                    continue
+                removed.append(key)
+                freed.append(row)
+                self._rows[key] = -1
+                self._live[row] = False
+                self._keys[row] = -1
+                self.metadata.remove(row)
+                self._free.append(row)
+                self._count -= 1
+            if removed:
+                self._freed(np.asarray(freed, dtype=np.int64))
+                self.version += 1
+                for listener in self.write_listeners:
+                    listener(
+                        self.version, np.asarray(removed, dtype=np.int32), None
+                    )
+        return len(removed)
+
+    def search(
+        self,
+        query,
+        k: int,
+        deadline: Optional[Deadline] = None,
+        where: Optional[Dict[str, Any]] = None,
+        exclude: Optional[np.ndarray] = None,
+    ) -> SearchResult:
+        """
+        Finds the k documents most similar to `query`.
+
+        The first block is always scanned. After that the scan stops as soon as
+        `deadline` expires and the best results seen so far are returned with
+        `complete=False`.
+
+        Args:
+            query: Query embedding of shape (dim,).
+            k (int): Number of ids to return.
+            deadline (Optional[Deadline]): Time budget for the scan.
+            where (Optional[Dict[str, Any]]): Metadata filter applied before scoring.
+            exclude (Optional[np.ndarray]): Keys to leave out of the scan.
+
+        Returns:
+            SearchResult: Up to k document keys with their cosine similarities.
+
+        Raises:
+            ValueError: If `where` is not a valid filter expression.
+        """
+        live, size = self._live, self._size
+        if k <= 0 or size == 0:
+            return SearchResult(
+                np.empty(0, dtype=np.int32),
+                np.empty(0, dtype=np.float32),
+                True,
+            )
+
+        live = self._visible(live, exclude)
+        blocks = self._blocks(size, where)
+        q = normalize(query).reshape(-1)
+        complete = True
+        if self.prefilter is not None:
+            # The backend only re-scores the prefilter's shortlist.
+            candidates, complete = self.prefilter.select(
+                q, blocks, live, k, deadline
+            )
+            blocks = [np.sort(candidates)]
+
+        prepared = self._prepare_query(q)
+        best_rows, best_scores, scanned = self._scan(
+            blocks,
+            live,
+            lambda block: self._score(block, prepared),
+            self._shortlist_size(k),
+            deadline,
+        )
+        complete = complete and scanned
+
+        found = np.isfinite(best_scores)
+        best_rows, best_scores = self._finalize(
+            best_rows[found], best_scores[found], q, k
+        )
+        # Skip rows that were deleted while the scan was running.
+        best_keys = self._keys[best_rows]
+        found = best_keys >= 0
+        return SearchResult(best_keys[found], best_scores[found], complete)
+
+    def search_batch(
+        self,
+        queries,
+        k: int,
+        deadline: Optional[Deadline] = None,
+        where: Optional[Dict[str, Any]] = None,
+        exclude: Optional[np.ndarray] = None,
+    ) -> List[SearchResult]:
+        """
+        Runs `search` for several queries, scanning the rows once for all of them.
+
+        Backends that can score a block against a matrix of queries (`_score_batch`) do
+        so in one matrix product per block; with a prefilter, or on other backends, each
+        query is searched on its own.
+
+        Args:
+            queries: Query embeddings of shape (queries, dim).
+            k (int): Number of ids to return per query.
+            deadline (Optional[Deadline]): Time budget for the whole batch.
+            where (Optional[Dict[str, Any]]): Metadata filter applied to every query.
+            exclude (Optional[np.ndarray]): Keys to leave out of the scan.
+
+        Returns:
+            List[SearchResult]: One result per query.
+
+        Raises:
+            ValueError: If `where` is not a valid filter expression.
+        """
+        queries = normalize(
+            np.asarray(queries, dtype=np.float32).reshape(len(queries), -1)
+        )
+        batched = type(self)._score_batch is not BaseIndex._score_batch
+        if self.prefilter is not None or not batched or len(queries) <= 1:
+            return [
+                self.search(
+                    q, k, deadline=deadline, where=where, exclude=exclude
+                )
+                for q in queries
+            ]
+        live, size = self._live, self._size
+        if k <= 0 or size == 0:
+            return [
+                SearchResult(
+                    np.empty(0, dtype=np.int32),
+                    np.empty(0, dtype=np.float32),
+                    True,
+                )
+                for _ in queries
+            ]
+
+        live = self._visible(live, exclude)
+        shortlist = self._shortlist_size(k)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        complete = True
+        for i, block in enumerate(self._blocks(size, where)):
+            if i > 0 and deadline is not None and deadline.expired():
+                complete = False
+                break
+            block_rows = (
+                np.arange(block.start, block.stop)
+                if isinstance(block, slice)
+                else block
+            )
+            # (queries, rows) scores, with the rows of the block appended to each query's best.
+            scores = self._score_batch(block, queries).T
+            scores[:, ~live[block]] = -np.inf
+            rows = np.concatenate(
+                [best_rows, np.broadcast_to(block_rows, scores.shape)], axis=1
+            )
+            scores = np.concatenate([best_scores, scores], axis=1)
+            if scores.shape[1] > shortlist:
+                keep = np.argpartition(-scores, shortlist - 1, axis=1)[
+                    :, :shortlist
+                ]
+                rows, scores = np.take_along_axis(
+                    rows, keep, 1
+                ), np.take_along_axis(scores, keep, 1)
+            best_rows, best_scores = rows, scores
+
+        results = []
+        for q, rows, scores in zip(queries, best_rows, best_scores):
+            order = top_k(scores, shortlist)
+            rows, scores = rows[order], scores[order]
+            found = np.isfinite(scores)
+            rows, scores = self._finalize(rows[found], scores[found], q, k)
+            keys = self._keys[rows]
+            found = keys >= 0
+            results.append(SearchResult(keys[found], scores[found], complete))
+        return results
+
+    def _blocks(self, size: int, where: Optional[Dict[str, Any]]) -> list:
+        """The rows to scan, in blocks: slices of all rows, or arrays of the rows matching `where`."""
+        if where is None:
+            return [
+                slice(start, min(start + self.block_size, size))
+                for start in range(0, size, self.block_size)
+            ]
+        with self._lock:
+            candidates = self.metadata.evaluate(where).to_array()
+        candidates = candidates[candidates < size]
+        return [
+            candidates[start : start + self.block_size]
+            for start in range(0, len(candidates), self.block_size)
+        ]
+
+    def _scan(
+        self,
+        blocks,
+        live: np.ndarray,
+        score,
+        shortlist: int,
+        deadline: Optional[Deadline],
+    ):
+        """Keeps the `shortlist` best live rows across blocks; returns (rows, scores, complete)."""
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for i, block in enumerate(blocks):
+            if i > 0 and deadline is not None and deadline.expired():
+                return best_rows, best_scores, False
+            block_rows = (
+                np.arange(block.start, block.stop)
+                if isinstance(block, slice)
+                else block
+            )
+            scores = score(block)
+            scores[~live[block]] = -np.inf
+            rows = np.concatenate([best_rows, block_rows])
+            scores = np.concatenate([best_scores, scores])
+            keep = top_k(scores, shortlist)
+            best_rows, best_scores = rows[keep], scores[keep]
+        return best_rows, best_scores, True
+
+    def exact_search(
+        self, query, k: int, exclude: Optional[np.ndarray] = None
+    ) -> SearchResult:
+        """
+        Exhaustive full-precision search with no prefilter, compression or deadline.
+
+        Too slow for the query path; used to measure the recall of `search`.
+        """
+        live, size = self._live, self._size
+        if k <= 0 or size == 0:
+            return SearchResult(
+                np.empty(0, dtype=np.int32),
+                np.empty(0, dtype=np.float32),
+                True,
+            )
+        live = self._visible(live, exclude)
+        q = normalize(query).reshape(-1)
+        blocks = [
+            slice(start, min(start + self.block_size, size))
+            for start in range(0, size, self.block_size)
+        ]
+        best_rows, best_scores, _ = self._scan(
+            blocks, live, lambda block: self._exact_score(block, q), k, None
+        )
+        found = np.isfinite(best_scores)
+        best_rows, best_scores = best_rows[found], best_scores[found]
+        best_keys = self._keys[best_rows]
+        alive = best_keys >= 0
+        return SearchResult(best_keys[alive], best_scores[alive], True)
+
+
+class FlatIndex(BaseIndex):
+    """
+    Exact cosine-similarity index held in memory as a float32 matrix.
+
+    ChromaDB remains the durable store; this index mirrors it so the query path
+    can control how much work it does.
+    """
+
+    def __init__(
+        self,
+        block_size: int = 65536,
+        initial_capacity: int = 1024,
+        prefilter=None,
+        id_table: Optional[IdTable] = None,
+    ):
+        super().__init__(
+            block_size=block_size,
+            initial_capacity=initial_capacity,
+            prefilter=prefilter,
+            id_table=id_table,
+        )
+        self._vectors: Optional[np.ndarray] = None
+
+    def _resize(self, capacity: int, dim: int) -> None:
+        vectors = np.zeros((capacity, dim), dtype=np.float32)
+        if self._vectors is not None:
+            vectors[: self._size] = self._vectors[: self._size]
+        self._vectors = vectors
+
+    def _write(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        self._vectors[rows] = vectors
+
+    def _read(self, rows: np.ndarray) -> np.ndarray:
+        return self._vectors[rows]
+
+    def memory_bytes(self) -> int:
+        vectors = self._vectors.nbytes if self._vectors is not None else 0
+        return super().memory_bytes() + vectors
+
+    def _score(self, block, query: np.ndarray) -> np.ndarray:
+        return self._vectors[block] @ query
+
+    def _score_batch(self, block, queries: np.ndarray) -> np.ndarray:
+        return self._vectors[block] @ queries.T
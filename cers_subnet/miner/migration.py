@@ -0,0 +1,240 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import threading
+import bittensor as bt
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from cers_subnet.miner.space import EmbeddingSpace
+
+# (document id, text, metadata) as yielded by a document source.
+Document = Tuple[str, str, Dict[str, Any]]
+
+
+class ModelMigration:
+    """
+    Re-indexes the corpus with a new embedding model while the current one keeps serving.
+
+    The target space is backfilled from `documents` in a background thread. The miner
+    double-writes every upsert and delete to both spaces while the migration runs, and
+    switches traffic once the target holds every document the source holds.
+
+    Document text is not stored by the miner, so the backfill can only re-encode what the
+    document source provides. Documents that only arrived through the API are reported by
+    `missing()` and must be sent again before the migration can complete; a forced
+    cutover drops them.
+
+    Once the migration is over, the space that no longer serves (the source after a
+    cutover, the target after a cancel) is released along with its model and index, and
+    `status()` reports the figures it had at the end.
+
+    The backfill never competes with queries: it waits while `is_busy()` reports queries in
+    flight, and sleeps between batches so it uses at most `duty_cycle` of the time.
+    """
+
+    def __init__(
+        self,
+        source: EmbeddingSpace,
+        target: EmbeddingSpace,
+        documents: Callable[[], Iterable[Document]],
+        write_lock: threading.Lock,
+        on_ready: Callable[["ModelMigration"], None],
+        is_busy: Callable[[], bool] = lambda: False,
+        batch_size: int = 32,
+        duty_cycle: float = 0.5,
+    ):
+        self.source = source
+        self.target = target
+        self.documents = documents
+        self.write_lock = write_lock
+        self.on_ready = on_ready
+        self.is_busy = is_busy
+        self.batch_size = batch_size
+        self.duty_cycle = min(max(duty_cycle, 0.01), 1.0)
+
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.backfilled = 0
+        self.started_at: Optional[float] = None
+        self._cancelled = threading.Event()
+        self._finish_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._final_status: Optional[Dict[str, Any]] = None
+
+    def start(self) -> None:
+        self.state = "backfilling"
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+        self.state = "cancelled"
+        self._release_if_stopped()
+
+    def _release_if_stopped(self) -> None:
+        # A running backfill releases the spaces itself once it stops writing to them.
+        if self._thread is None or not self._thread.is_alive():
+            self._release()
+
+    def _release(self) -> None:
+        """Drops the space the miner no longer uses, keeping its figures for `status`."""
+        with self._finish_lock:
+            if self._final_status is not None:
+                return
+            self._final_status = self._status()
+            if self.state == "done":
+                self.source = None
+            else:
+                self.target = None
+
+    @property
+    def active(self) -> bool:
+        return self.state in ("backfilling", "catching_up")
+
+    def _throttle(self, busy_seconds: float) -> None:
+        """Keeps the backfill inside its duty cycle and out of the way of live queries."""
+        time.sleep(busy_seconds * (1.0 - self.duty_cycle) / self.duty_cycle)
+        while self.is_busy() and not self._cancelled.is_set():
+            time.sleep(0.005)
+
+    def _write_batch(self, batch: List[Document]) -> None:
+        # Only documents that still exist in the source and have not already been
+        # double-written (which would be newer) are backfilled.
+        batch = [
+            doc
+            for doc in batch
+            if doc[0] in self.source.index and doc[0] not in self.target.index
+        ]
+        if not batch:
+            return
+        embeddings = self.target.encode_documents(
+            [text for _, text, _ in batch]
+        )
+        with self.write_lock:
+            keep = [
+                i
+                for i, doc in enumerate(batch)
+                if doc[0] in self.source.index
+                and doc[0] not in self.target.index
+            ]
+            if keep:
+                self.target.upsert(
+                    [batch[i][0] for i in keep],
+                    [batch[i][1] for i in keep],
+                    [batch[i][2] for i in keep],
+                    embeddings=[embeddings[i] for i in keep],
+                )
+        self.backfilled += len(keep)
+
+    def _run(self) -> None:
+        try:
+            self._backfill()
+        finally:
+            if self.state in ("cancelled", "done"):
+                self._release()
+
+    def _backfill(self) -> None:
+        bt.logging.info(
+            f"Migrating embeddings from {self.source.model_name} to {self.target.model_name}."
+        )
+        try:
+            batch: List[Document] = []
+            for document in self.documents():
+                if self._cancelled.is_set():
+                    return
+                batch.append(document)
+                if len(batch) >= self.batch_size:
+                    start = time.monotonic()
+                    self._write_batch(batch)
+                    batch = []
+                    self._throttle(time.monotonic() - start)
+            if batch and not self._cancelled.is_set():
+                self._write_batch(batch)
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            bt.logging.error(
+                f"Model migration to {self.target.model_name} failed: {e}"
+            )
+            return
+
+        if self._cancelled.is_set():
+            return
+        self.state = "catching_up"
+        bt.logging.info(
+            f"Backfill finished with {self.backfilled} documents re-encoded."
+        )
+        self.maybe_finish()
+
+    def missing(self) -> List[str]:
+        """Ids served by the source space that the target space does not hold yet."""
+        if self.source is None or self.target is None:
+            return []
+        return [
+            doc_id
+            for doc_id in self.source.document_ids()
+            if doc_id not in self.target.index
+        ]
+
+    def maybe_finish(self, force: bool = False) -> bool:
+        """
+        Hands over to the miner once the target has caught up with the source.
+
+        Args:
+            force (bool): Switch even if some documents are missing from the target.
+
+        Returns:
+            bool: True if traffic was switched to the target space.
+        """
+        with self._finish_lock:
+            if self.state != "catching_up" and not (force and self.active):
+                return False
+            if not force and (
+                self.target.document_count() < self.source.document_count()
+                or self.missing()
+            ):
+                return False
+            self.state = "done"
+            self._cancelled.set()
+        self.on_ready(self)
+        self._release_if_stopped()
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        with self._finish_lock:
+            if self._final_status is not None:
+                return dict(self._final_status, state=self.state)
+            return self._status()
+
+    def _status(self) -> Dict[str, Any]:
+        missing = self.missing() if self.active else []
+        return {
+            "state": self.state,
+            "error": self.error,
+            "source_model": self.source.model_name,
+            "target_model": self.target.model_name,
+            "backfilled": self.backfilled,
+            "source_documents": self.source.document_count(),
+            "target_documents": self.target.document_count(),
+            "missing": len(missing),
+            "missing_sample": missing[:20],
+            "elapsed": None
+            if self.started_at is None
+            else time.time() - self.started_at,
+        }
@@ -0,0 +1,96 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import base64
+import typing
+import numpy as np
+from pydantic import BaseModel
+
+MetadataValue = typing.Union[str, int, float, bool]
+
+
+class DocumentPayload(BaseModel):
+    id: str
+    document: str
+    # Structured attributes used by query filters, e.g. department, date or access groups.
+    metadata: typing.Optional[
+        typing.Dict[
+            str, typing.Union[MetadataValue, typing.List[MetadataValue]]
+        ]
+    ] = None
+
+
+class BulkDocumentPayload(BaseModel):
+    documents: typing.List[DocumentPayload]
+
+
+def upsert_record(
+    document: DocumentPayload,
+    model_name: typing.Optional[str] = None,
+    embedding: typing.Optional[np.ndarray] = None,
+    chunking: typing.Optional[typing.Tuple[int, int]] = None,
+) -> dict:
+    """
+    The mutation record for an upsert, as written to the write-ahead log.
+
+    A record may carry the document's embedding from `model_name`, so that whoever
+    applies it does not have to encode the document again. A (chunks, dim) matrix holds
+    the embeddings of the document's chunks, split with the (max tokens, overlap) in `chunking`.
+    """
+    record = {
+        "op": "upsert",
+        "id": document.id,
+        "document": document.document,
+        "metadata": document.metadata,
+    }
+    if embedding is not None:
+        embedding = np.asarray(embedding, dtype="<f4")
+        record["model"] = model_name
+        record["embedding"] = base64.b64encode(embedding.tobytes()).decode(
+            "ascii"
+        )
+        record["chunks"] = len(embedding) if embedding.ndim == 2 else 1
+        if chunking is not None:
+            record["chunking"] = list(chunking)
+    return record
+
+
+def delete_record(doc_id: str) -> dict:
+    return {"op": "delete", "id": doc_id}
+
+
+def record_embedding(
+    record: dict,
+    model_name: str,
+    chunking: typing.Optional[typing.Tuple[int, int]] = None,
+) -> typing.Optional[np.ndarray]:
+    """
+    The (chunks, dim) embeddings carried by an upsert record if they were made with `model_name`
+    and, when given, split with the same `chunking`. Otherwise the document has to be encoded again.
+    """
+    if record.get("model") != model_name or "embedding" not in record:
+        return None
+    if (
+        chunking is not None
+        and "chunking" in record
+        and tuple(record["chunking"]) != tuple(chunking)
+    ):
+        return None
+    embedding = np.frombuffer(
+        base64.b64decode(record["embedding"]), dtype="<f4"
+    ).astype(np.float32)
+    return embedding.reshape(record.get("chunks", 1), -1)
@@ -0,0 +1,508 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import json
+import struct
+import threading
+import numpy as np
+import bittensor as bt
+from typing import Any, Dict, List, Optional
+
+from cers_subnet.miner.ids import IdTable
+from cers_subnet.miner.index import BaseIndex, normalize, top_k
+
+# Each sub-vector is encoded as one byte, i.e. one of 256 centroids.
+PQ_CENTROIDS = 256
+
+# rows.log records: the row, then the UTF-8 length of the document id given that row, or _FREED.
+_ROW_RECORD = struct.Struct("<qI")
+_FREED = 0xFFFFFFFF
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_json(path: str, value: Dict[str, Any]) -> None:
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(value, f)
+    os.replace(path + ".tmp", path)
+
+
+def _read_rows_log(path: str) -> Dict[int, Optional[str]]:
+    """The last document id logged for every row, None for rows freed since; a torn last record is ignored."""
+    with open(path, "rb") as f:
+        data = f.read()
+    assignments: Dict[int, Optional[str]] = {}
+    offset = 0
+    while offset + _ROW_RECORD.size <= len(data):
+        row, length = _ROW_RECORD.unpack_from(data, offset)
+        offset += _ROW_RECORD.size
+        if length == _FREED:
+            assignments[row] = None
+            continue
+        if offset + length > len(data):
+            break
+        assignments[row] = data[offset : offset + length].decode("utf-8")
+        offset += length
+    return assignments
+
+
+def kmeans(
+    data: np.ndarray, k: int, iterations: int = 20, seed: int = 0
+) -> np.ndarray:
+    """
+    Lloyd's k-means in NumPy. Returns `k` centroids for the rows of `data`.
+
+    Empty clusters are re-seeded from random points so every code stays in use.
+    """
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    centroids = data[rng.choice(len(data), k, replace=len(data) < k)].copy()
+    squared_norms = (data * data).sum(axis=1)
+    for _ in range(iterations):
+        distances = (
+            squared_norms[:, None]
+            - 2.0 * data @ centroids.T
+            + (centroids * centroids).sum(axis=1)[None, :]
+        )
+        assignment = distances.argmin(axis=1)
+        order = np.argsort(assignment, kind="stable")
+        clusters, starts, counts = np.unique(
+            assignment[order], return_index=True, return_counts=True
+        )
+        sums = np.add.reduceat(data[order], starts, axis=0)
+        centroids[clusters] = sums / counts[:, None]
+        empty = np.setdiff1d(np.arange(k), clusters)
+        if empty.size:
+            centroids[empty] = data[rng.choice(len(data), empty.size)]
+    return centroids
+
+
+class PQIndex(BaseIndex):
+    """
+    Product-quantized cosine index for corpora that do not fit in RAM as float32.
+
+    Each normalized vector is split into `m` sub-vectors and every sub-vector is
+    replaced by the id of its nearest of 256 NumPy-trained centroids, so a
+    384-dimension vector costs `m` bytes (16-64) instead of 1536. Queries are
+    scored with asymmetric distance computation: one (m, 256) table of
+    query/centroid inner products is built per query and each document's score
+    is the sum of `m` table lookups.
+
+    Full-precision vectors are written to a memory-mapped file next to the codes.
+    They are only read to optionally re-rank the best `rerank` candidates exactly,
+    so the operating system keeps just the pages that re-ranking touches in memory.
+
+    Codebooks are trained in a background thread once `train_size` vectors have
+    been added, so writes never wait for k-means. Until they are ready the index
+    scores exactly from the memory-mapped vectors.
+
+    Vectors, codes, codebooks and the document id of every row persist in `path`,
+    and `restore` reopens them after a restart, so the codebooks are not trained
+    again and unchanged vectors are not encoded again. The miner still stores
+    every full vector in ChromaDB as well, whose HNSW index is held in memory;
+    this backend shrinks the miner's own search index, not ChromaDB.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        m: int = 48,
+        rerank: int = 0,
+        train_size: int = 65536,
+        iterations: int = 20,
+        block_size: int = 262144,
+        initial_capacity: int = 1024,
+        prefilter=None,
+        id_table: Optional[IdTable] = None,
+    ):
+        super().__init__(
+            block_size=block_size,
+            initial_capacity=initial_capacity,
+            prefilter=prefilter,
+            id_table=id_table,
+        )
+        if not 1 <= m <= 256:
+            raise ValueError(
+                f"Number of sub-quantizers must be between 1 and 256, got {m}."
+            )
+        self.path = path
+        self.m = m
+        self.rerank = rerank
+        self.train_size = train_size
+        self.iterations = iterations
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._codes_path = os.path.join(path, "codes.u8")
+        self._codebooks_path = os.path.join(path, "codebooks.npy")
+        self._rows_path = os.path.join(path, "rows.log")
+        self._layout_path = os.path.join(path, "layout.json")
+        self._vectors: Optional[np.memmap] = None
+        self._codes: Optional[np.memmap] = None
+        self._rows_log = None
+        self.codebooks: Optional[np.ndarray] = None
+        self._training = threading.Lock()
+        self._trainer: Optional[threading.Thread] = None
+        # Rows written while codebooks are being trained; they are encoded again afterwards.
+        self._written_while_training: Optional[List[np.ndarray]] = None
+        # Restored rows whose vectors have not been written again since the restart.
+        self._unverified: Optional[np.ndarray] = None
+        self._unverified_count = 0
+        os.makedirs(path, exist_ok=True)
+
+    @property
+    def trained(self) -> bool:
+        return self.codebooks is not None
+
+    def memory_bytes(self) -> int:
+        """
+        See `BaseIndex.memory_bytes`; adds the codes, which every query scans and the
+        page cache therefore keeps resident, and the codebooks. The full vectors are
+        read from their memory map only to re-rank and are not counted.
+        """
+        total = super().memory_bytes()
+        if self._codes is not None:
+            total += self._codes.nbytes
+        if self.codebooks is not None:
+            total += self.codebooks.nbytes
+        if self._unverified is not None:
+            total += self._unverified.nbytes
+        return total
+
+    def _map(self, capacity: int, dim: int, mode: str) -> None:
+        self._vectors = np.memmap(
+            self._vectors_path,
+            dtype=np.float32,
+            mode=mode,
+            shape=(capacity, dim),
+        )
+        self._codes = np.memmap(
+            self._codes_path,
+            dtype=np.uint8,
+            mode=mode,
+            shape=(capacity, self.m),
+        )
+        _write_json(
+            self._layout_path, {"capacity": capacity, "dim": dim, "m": self.m}
+        )
+
+    def _resize(self, capacity: int, dim: int) -> None:
+        if dim % self.m:
+            raise ValueError(
+                f"Dimension {dim} is not divisible into {self.m} sub-vectors."
+            )
+        if self._vectors is None:
+            # Nothing was restored, so whatever an earlier run left behind is stale.
+            if os.path.exists(self._codebooks_path):
+                os.remove(self._codebooks_path)
+            self._rows_log = open(self._rows_path, "wb")
+            self._map(capacity, dim, "w+")
+            return
+        self._vectors.flush()
+        self._codes.flush()
+        for path, row_bytes in (
+            (self._vectors_path, dim * 4),
+            (self._codes_path, self.m),
+        ):
+            with open(path, "r+b") as f:
+                f.truncate(capacity * row_bytes)
+        self._map(capacity, dim, "r+")
+        if self._unverified is not None:
+            unverified = np.zeros(capacity, dtype=bool)
+            unverified[: self._size] = self._unverified[: self._size]
+            self._unverified = unverified
+
+    def restore(self) -> int:
+        """See `BaseIndex.restore`; reopens the rows, vectors, codes and codebooks in `path`."""
+        layout = _read_json(self._layout_path)
+        if (
+            layout is None
+            or layout["m"] != self.m
+            or not os.path.exists(self._rows_path)
+        ):
+            return 0
+        capacity, dim = layout["capacity"], layout["dim"]
+        if os.path.getsize(self._vectors_path) != capacity * dim * 4 or (
+            os.path.getsize(self._codes_path) != capacity * self.m
+        ):
+            return 0
+        assignments = _read_rows_log(self._rows_path)
+        assignments = {
+            row: doc_id
+            for row, doc_id in assignments.items()
+            if doc_id is not None and row < capacity
+        }
+        rows = np.fromiter(assignments, dtype=np.int64, count=len(assignments))
+        keys = self.id_table.intern(list(assignments.values()))
+        with self._lock:
+            self._map(capacity, dim, "r+")
+            self._dim = dim
+            self._size = int(rows.max()) + 1 if rows.size else 0
+            self._live = np.zeros(capacity, dtype=bool)
+            self._live[rows] = True
+            self._keys = np.full(capacity, -1, dtype=np.int32)
+            self._keys[rows] = keys
+            self._rows = np.full(
+                max(int(keys.max()) + 1 if keys.size else 0, 1024),
+                -1,
+                dtype=np.int32,
+            )
+            self._rows[keys] = rows
+            self._count = int(rows.size)
+            self._free = np.flatnonzero(~self._live[: self._size]).tolist()[
+                ::-1
+            ]
+            if rows.size:
+                self._unverified = self._live.copy()
+                self._unverified_count = int(rows.size)
+            if self.prefilter is not None:
+                self.prefilter.resize(capacity, 0, dim)
+                for start in range(0, self._size, self.block_size):
+                    stop = min(start + self.block_size, self._size)
+                    block = np.arange(start, stop)
+                    self.prefilter.write(block, self._vectors[start:stop])
+            if os.path.exists(self._codebooks_path):
+                codebooks = np.load(self._codebooks_path)
+                if codebooks.shape == (self.m, PQ_CENTROIDS, dim // self.m):
+                    self.codebooks = codebooks
+            # Rewrite the log with one record per restored row.
+            self._rows_log = open(self._rows_path + ".tmp", "wb")
+            self._log(rows)
+            self._rows_log.close()
+            os.replace(self._rows_path + ".tmp", self._rows_path)
+            self._rows_log = open(self._rows_path, "ab")
+            self.version += 1
+        bt.logging.info(
+            f"Restored {rows.size} rows of the PQ index in {self.path}"
+            f"{'' if self.trained else ' without codebooks'}."
+        )
+        return int(rows.size)
+
+    def _log(self, rows: np.ndarray, freed: bool = False) -> None:
+        ids = (
+            [None] * len(rows)
+            if freed
+            else self.id_table.decode(self._keys[rows])
+        )
+        records = bytearray()
+        for row, doc_id in zip(rows.tolist(), ids):
+            encoded = b"" if doc_id is None else doc_id.encode("utf-8")
+            records += _ROW_RECORD.pack(
+                row, _FREED if doc_id is None else len(encoded)
+            )
+            records += encoded
+        self._rows_log.write(records)
+        self._rows_log.flush()
+
+    def _assigned(self, rows: np.ndarray) -> None:
+        self._log(rows)
+
+    def _freed(self, rows: np.ndarray) -> None:
+        self._log(rows, freed=True)
+        if self._unverified is not None:
+            self._unverified_count -= int(self._unverified[rows].sum())
+            self._unverified[rows] = False
+            if self._unverified_count == 0:
+                self._unverified = None
+
+    def _encode(
+        self, vectors: np.ndarray, codebooks: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """Maps each sub-vector to its nearest centroid."""
+        codebooks = self.codebooks if codebooks is None else codebooks
+        sub = vectors.reshape(len(vectors), self.m, -1)
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            distances = (codebooks[j] * codebooks[j]).sum(axis=1)[
+                None, :
+            ] - 2.0 * sub[:, j] @ codebooks[j].T
+            codes[:, j] = distances.argmin(axis=1)
+        return codes
+
+    def _write(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        if self._unverified is not None:
+            # Reloading after a restart rewrites every restored row, mostly unchanged.
+            unverified = self._unverified[rows]
+            if unverified.any():
+                same = unverified & np.all(
+                    np.asarray(self._vectors[rows]) == vectors, axis=1
+                )
+                self._unverified[rows] = False
+                self._unverified_count -= int(np.unique(rows[unverified]).size)
+                rows, vectors = rows[~same], vectors[~same]
+                if self._unverified_count == 0:
+                    self._unverified = None
+        if not len(rows):
+            return
+        self._vectors[rows] = vectors
+        if self.trained:
+            self._codes[rows] = self._encode(vectors)
+        elif self._written_while_training is not None:
+            self._written_while_training.append(rows)
+
+    def _read(self, rows: np.ndarray) -> np.ndarray:
+        return np.asarray(self._vectors[rows])
+
+    def upsert(self, ids, embeddings, metadatas=None) -> None:
+        super().upsert(ids, embeddings, metadatas)
+        if not self.trained and len(self) >= self.train_size:
+            with self._training:
+                if self._trainer is None or not self._trainer.is_alive():
+                    self._trainer = threading.Thread(
+                        target=self.train, daemon=True
+                    )
+                    self._trainer.start()
+
+    def wait_for_training(self, timeout: Optional[float] = None) -> bool:
+        """Waits for a background training run; returns whether the index is trained."""
+        trainer = self._trainer
+        if trainer is not None:
+            trainer.join(timeout)
+        return self.trained
+
+    def train(self, seed: int = 0) -> None:
+        """
+        Trains the codebooks on a sample of the stored vectors and encodes every row.
+
+        Runs in the background thread that `upsert` starts, and can also be called
+        directly. Training and encoding run outside the write lock; rows written
+        meanwhile are encoded again before the codebooks are published.
+        """
+        with self._lock:
+            if self.trained or self._written_while_training is not None:
+                return
+            self._written_while_training = []
+            live_rows = np.flatnonzero(self._live[: self._size])
+            size = self._size
+        try:
+            if live_rows.size == 0:
+                return
+            rng = np.random.default_rng(seed)
+            sample = np.sort(
+                rng.choice(
+                    live_rows,
+                    min(self.train_size, live_rows.size),
+                    replace=False,
+                )
+            )
+            data = np.asarray(self._vectors[sample], dtype=np.float32)
+            dsub = data.shape[1] // self.m
+            bt.logging.info(
+                f"Training {self.m}x{PQ_CENTROIDS} PQ codebooks on {len(sample)} vectors."
+            )
+            codebooks = np.stack(
+                [
+                    kmeans(
+                        data[:, j * dsub : (j + 1) * dsub],
+                        PQ_CENTROIDS,
+                        self.iterations,
+                        seed + j,
+                    )
+                    for j in range(self.m)
+                ]
+            )
+            codes = np.empty((size, self.m), dtype=np.uint8)
+            for start in range(0, size, self.block_size):
+                stop = min(start + self.block_size, size)
+                codes[start:stop] = self._encode(
+                    np.asarray(self._vectors[start:stop]), codebooks
+                )
+            with self._lock:
+                self._codes[:size] = codes
+                if self._written_while_training:
+                    rows = np.unique(
+                        np.concatenate(self._written_while_training)
+                    )
+                    self._codes[rows] = self._encode(
+                        np.asarray(self._vectors[rows]), codebooks
+                    )
+                # The codebooks are only persisted once the codes they describe are on disk.
+                self._codes.flush()
+                np.save(self._codebooks_path + ".tmp.npy", codebooks)
+                os.replace(
+                    self._codebooks_path + ".tmp.npy", self._codebooks_path
+                )
+                self.codebooks = codebooks
+                self.version += 1
+                # Every approximate score changed.
+                for listener in self.write_listeners:
+                    listener(self.version, None, None)
+            bt.logging.info(
+                f"PQ index trained; {self.memory_bytes() / 2**20:.1f} MiB resident for {len(self)} vectors."
+            )
+        finally:
+            with self._lock:
+                self._written_while_training = None
+
+    def _prepare_query(self, query: np.ndarray):
+        codebooks = self.codebooks
+        if codebooks is None:
+            return query, None
+        # Inner products between every query sub-vector and every centroid: shape (m, 256).
+        table = np.einsum("mkd,md->mk", codebooks, query.reshape(self.m, -1))
+        return query, table
+
+    def _score(self, block, prepared) -> np.ndarray:
+        query, table = prepared
+        if table is None:
+            return np.asarray(self._vectors[block]) @ query
+        codes = self._codes[block]
+        scores = np.zeros(len(codes), dtype=np.float32)
+        for j in range(self.m):
+            scores += table[j][codes[:, j]]
+        return scores
+
+    @property
+    def breadth(self) -> Optional[int]:
+        # Behind a prefilter its shortlist dominates the cost; otherwise the re-rank depth does.
+        if self.prefilter is not None:
+            return self.prefilter.shortlist
+        return self.rerank if self.rerank > 0 else None
+
+    @breadth.setter
+    def breadth(self, value: int) -> None:
+        if self.prefilter is not None:
+            self.prefilter.shortlist = value
+        elif self.rerank > 0:
+            self.rerank = value
+        else:
+            raise ValueError(
+                "PQIndex without re-ranking has no search breadth to set."
+            )
+
+    def _exact_score(self, block, query: np.ndarray) -> np.ndarray:
+        return np.asarray(self._vectors[block]) @ query
+
+    def _shortlist_size(self, k: int) -> int:
+        return max(k, self.rerank) if self.trained else k
+
+    def _finalize(
+        self, rows: np.ndarray, scores: np.ndarray, query: np.ndarray, k: int
+    ):
+        if not self.trained or self.rerank <= 0 or rows.size == 0:
+            return rows[:k], scores[:k]
+        # Exact re-rank: reads only the shortlisted rows from the memory map.
+        order = np.argsort(rows)
+        exact = np.asarray(self._vectors[rows[order]]) @ query
+        rows = rows[order]
+        keep = top_k(exact, k)
+        return rows[keep], exact[keep]
@@ -0,0 +1,437 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import time
+import threading
+import numpy as np
+import bittensor as bt
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+)
+
+from cers_subnet.miner.deadline import Deadline
+from cers_subnet.miner.index import (
+    BaseIndex,
+    FlatIndex,
+    SearchResult,
+    normalize,
+    top_k,
+)
+
+# Extra candidates requested from older segments to make up for hidden or overridden keys.
+# Past this many, those keys are left out of the older segment's scan instead.
+MAX_OVERFETCH = 256
+
+
+class Generation(NamedTuple):
+    """What a query reads: segments newest first, and the keys deleted since each older segment was written."""
+
+    number: int
+    delta: FlatIndex
+    merging: Optional[FlatIndex]
+    main: BaseIndex
+    # Keys deleted after `merging` was frozen; they are hidden in `merging` and `main`.
+    # Writers update this set in place under the lock, and each merge starts a new one.
+    deleted: Set[int]
+    # Keys deleted before that whose removal from `main` is still pending.
+    deleted_before_merge: FrozenSet[int]
+
+
+class SegmentedIndex:
+    """
+    Isolates queries from ingestion by putting writes into a small delta segment in front of the main index.
+
+    Upserts and deletes only touch the in-memory `FlatIndex` delta and a set of deleted keys,
+    so they are cheap and never wait on the main index. A background thread merges the delta
+    into the main index every `merge_interval` seconds, or as soon as it reaches
+    `merge_rows`. The merge freezes the delta, starts a new one, applies the frozen
+    delta to the main index in chunks of `merge_chunk` rows and then publishes a new
+    generation. Deletes only add keys to the set of deleted keys, so `merge_rows`
+    deletes request a merge as well. The main index is only ever written by the
+    merge thread.
+
+    Queries read the current `Generation` once and never take the segmented index's lock.
+    A key is served from the newest segment that holds it, and hidden if it was deleted
+    after that segment was written, so queries see every acknowledged write exactly once.
+    Writers wait only when the delta grows past `max_delta_rows`, to bound its memory
+    during bulk loads. This removes lock waits from the query path, not CPU contention:
+    a bulk load in the same process still raises query latency (see
+    `scripts/segment_report.py`).
+    """
+
+    def __init__(
+        self,
+        main: BaseIndex,
+        merge_rows: int = 10000,
+        merge_interval: float = 30.0,
+        merge_chunk: int = 1024,
+        max_delta_rows: Optional[int] = None,
+    ):
+        self.main = main
+        self.id_table = main.id_table
+        self.merge_rows = merge_rows
+        self.merge_interval = merge_interval
+        self.merge_chunk = merge_chunk
+        self.max_delta_rows = (
+            max_delta_rows if max_delta_rows is not None else 4 * merge_rows
+        )
+        self.version = 0
+        # See `BaseIndex.write_listeners`; merges do not change results and are not reported.
+        self.write_listeners = []
+        self.merges = 0
+        self._lock = threading.Lock()
+        self._merged = threading.Condition(self._lock)
+        self._merge_requested = threading.Event()
+        self._merging = threading.Lock()
+        self._count = len(main)
+        self._generation = Generation(
+            0, self._new_delta(), None, main, set(), frozenset()
+        )
+        self._merger = threading.Thread(target=self._merge_loop, daemon=True)
+        self._merger.start()
+
+    def _new_delta(self) -> FlatIndex:
+        return FlatIndex(id_table=self.id_table)
+
+    @property
+    def generation(self) -> int:
+        return self._generation.number
+
+    @property
+    def dim(self) -> Optional[int]:
+        generation = self._generation
+        return generation.main.dim or generation.delta.dim
+
+    @property
+    def breadth(self) -> Optional[int]:
+        return self.main.breadth
+
+    @breadth.setter
+    def breadth(self, value: int) -> None:
+        self.main.breadth = value
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _holds(self, generation: Generation, key: int) -> bool:
+        """Whether `key` is visible in `generation`."""
+        if generation.delta.contains_key(key):
+            return True
+        if key in generation.deleted:
+            return False
+        if generation.merging is not None and generation.merging.contains_key(
+            key
+        ):
+            return True
+        return (
+            key not in generation.deleted_before_merge
+            and generation.main.contains_key(key)
+        )
+
+    def __contains__(self, doc_id: str) -> bool:
+        key = int(self.id_table.get([doc_id])[0])
+        return key >= 0 and self._holds(self._generation, key)
+
+    def restore(self) -> int:
+        """Restores the main index; see `BaseIndex.restore`."""
+        with self._merging:
+            restored = self.main.restore()
+            with self._lock:
+                self._count = len(self.main)
+                self._publish()
+        return restored
+
+    def memory_bytes(self) -> int:
+        """`BaseIndex.memory_bytes` of every segment; the shared id table is counted once."""
+        generation = self._generation
+        segments = [generation.main, generation.merging, generation.delta]
+        segments = [segment for segment in segments if segment is not None]
+        shared = self.id_table.memory_bytes()
+        return sum(segment.memory_bytes() for segment in segments) - shared * (
+            len(segments) - 1
+        )
+
+    def ids(self) -> List[str]:
+        generation = self._generation
+        keys = set()
+        for segment in (generation.main, generation.merging, generation.delta):
+            if segment is not None:
+                keys.update(self.id_table.get(segment.ids()).tolist())
+        return self.id_table.decode(
+            sorted(key for key in keys if self._holds(generation, key))
+        )
+
+    def upsert(self, ids: Sequence[str], embeddings, metadatas=None) -> None:
+        """Writes to the delta segment; see `BaseIndex.upsert`."""
+        keys = self.id_table.intern(ids)
+        with self._lock:
+            while len(self._generation.delta) >= self.max_delta_rows:
+                # Bulk loads wait for the merge here instead of growing the delta without bound.
+                self._merge_requested.set()
+                self._merged.wait(timeout=1.0)
+            generation = self._generation
+            added = sum(
+                1
+                for key in set(keys.tolist())
+                if not self._holds(generation, key)
+            )
+            # The delta copy is visible before the key stops being deleted.
+            generation.delta.upsert(ids, embeddings, metadatas)
+            generation.deleted.difference_update(keys.tolist())
+            self._count += added
+            self.version += 1
+            self._publish()
+            if self.write_listeners:
+                vectors = normalize(np.atleast_2d(embeddings))
+                for listener in self.write_listeners:
+                    listener(self.version, keys, vectors)
+            self._request_merge(generation)
+
+    def delete(self, ids: Sequence[str]) -> int:
+        """Hides the given ids from every segment and returns how many were present."""
+        keys = self.id_table.get(ids)
+        with self._lock:
+            generation = self._generation
+            present = [
+                int(key)
+                for key in set(keys.tolist())
+                if key >= 0 and self._holds(generation, key)
+            ]
+            if not present:
+                return 0
+            # Hide older copies before dropping the delta's, so none of them reappears.
+            generation.deleted.update(present)
+            generation.delta.delete(ids)
+            self._count -= len(present)
+            self.version += 1
+            self._publish()
+            for listener in self.write_listeners:
+                listener(
+                    self.version, np.asarray(present, dtype=np.int32), None
+                )
+            self._request_merge(generation)
+        return len(present)
+
+    def _request_merge(self, generation: Generation) -> None:
+        """Wakes the merge thread once the delta rows and deleted keys reach `merge_rows`."""
+        if len(generation.delta) + len(generation.deleted) >= self.merge_rows:
+            self._merge_requested.set()
+
+    def _publish(self, **changes) -> None:
+        """Swaps in a new generation; must hold `_lock`."""
+        generation = self._generation._replace(**changes)
+        self._generation = generation._replace(number=generation.number + 1)
+
+    def merge(self) -> int:
+        """
+        Folds the current delta into the main index and returns how many rows it merged.
+
+        Runs on the merge thread; calling it directly is safe but serializes with it.
+        """
+        with self._merging:
+            return self._merge()
+
+    def _merge(self) -> int:
+        with self._lock:
+            generation = self._generation
+            frozen = generation.delta
+            if len(frozen) == 0 and not generation.deleted:
+                return 0
+            pending_deletes = (
+                frozenset(generation.deleted) | generation.deleted_before_merge
+            )
+            self._publish(
+                delta=self._new_delta(),
+                merging=frozen,
+                deleted=set(),
+                deleted_before_merge=pending_deletes,
+            )
+        started = time.monotonic()
+        # Only this thread writes to the main index, so queries keep reading it throughout.
+        deletes = self.id_table.decode(sorted(pending_deletes))
+        for start in range(0, len(deletes), self.merge_chunk):
+            self.main.delete(deletes[start : start + self.merge_chunk])
+        merged = 0
+        for ids, vectors, metadatas in frozen.batches(self.merge_chunk):
+            self.main.upsert(ids, vectors, metadatas)
+            merged += len(ids)
+        with self._lock:
+            self._publish(
+                merging=None,
+                deleted_before_merge=frozenset(self._generation.deleted),
+            )
+            self.merges += 1
+            self._merged.notify_all()
+        bt.logging.debug(
+            f"Merged {merged} rows and {len(deletes)} deletes into the main index in {time.monotonic() - started:.2f}s."
+        )
+        return merged
+
+    def _merge_loop(self) -> None:
+        while True:
+            self._merge_requested.wait(timeout=self.merge_interval)
+            self._merge_requested.clear()
+            try:
+                self.merge()
+            except Exception as e:
+                bt.logging.error(f"Merging the delta segment failed: {e}")
+
+    def _combine(
+        self, generation: Generation, results: List[tuple], k: int
+    ) -> SearchResult:
+        """Merges per-segment results, newest segment first, keeping each visible key once."""
+        keys, scores = [], []
+        complete = True
+        seen = set()
+        for segment, result in results:
+            complete = complete and result.complete
+            for key, score in zip(
+                result.keys.tolist(), result.scores.tolist()
+            ):
+                if key in seen:
+                    continue
+                seen.add(key)
+                # An older segment's copy is stale if a newer segment holds the key or it was deleted.
+                if segment is not generation.delta and (
+                    generation.delta.contains_key(key)
+                    or key in generation.deleted
+                ):
+                    continue
+                if segment is generation.main and (
+                    key in generation.deleted_before_merge
+                    or (
+                        generation.merging is not None
+                        and generation.merging.contains_key(key)
+                    )
+                ):
+                    continue
+                keys.append(key)
+                scores.append(score)
+        keys, scores = np.asarray(keys, dtype=np.int32), np.asarray(
+            scores, dtype=np.float32
+        )
+        order = top_k(scores, k)
+        return SearchResult(keys[order], scores[order], complete)
+
+    def _segments(self, generation: Generation, k: int):
+        """
+        (segment, k, exclude) triples to search, newest segment first.
+
+        Older segments over-fetch by the number of keys that newer segments override or
+        deletes hide, so k visible results remain. Past `MAX_OVERFETCH` such keys they
+        are passed as `exclude` instead, and the segment's scan skips them.
+        """
+        newer = [generation.delta]
+        hidden = [generation.deleted]
+        segments = [(generation.delta, k, None)]
+        for segment in (generation.merging, generation.main):
+            if segment is None:
+                continue
+            if segment is generation.main:
+                hidden.append(generation.deleted_before_merge)
+            overfetch = sum(len(s) for s in newer) + sum(
+                len(h) for h in hidden
+            )
+            if overfetch <= MAX_OVERFETCH:
+                segments.append((segment, k + overfetch, None))
+            else:
+                # Copying a set does not release the GIL, so a concurrent writer cannot change it midway.
+                exclude = np.concatenate(
+                    [s.keys() for s in newer]
+                    + [
+                        np.array(list(h.copy()), dtype=np.int32)
+                        for h in hidden
+                    ]
+                )
+                segments.append((segment, k, exclude))
+            newer.append(segment)
+        return segments
+
+    def search(
+        self,
+        query,
+        k: int,
+        deadline: Optional[Deadline] = None,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> SearchResult:
+        """Searches every segment of the current generation; see `BaseIndex.search`."""
+        generation = self._generation
+        results = [
+            (
+                segment,
+                segment.search(
+                    query,
+                    segment_k,
+                    deadline=deadline,
+                    where=where,
+                    exclude=exclude,
+                ),
+            )
+            for segment, segment_k, exclude in self._segments(generation, k)
+        ]
+        return self._combine(generation, results, k)
+
+    def search_batch(
+        self,
+        queries,
+        k: int,
+        deadline: Optional[Deadline] = None,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> List[SearchResult]:
+        """Searches every segment for all queries at once; see `BaseIndex.search_batch`."""
+        generation = self._generation
+        results = [
+            (
+                segment,
+                segment.search_batch(
+                    queries,
+                    segment_k,
+                    deadline=deadline,
+                    where=where,
+                    exclude=exclude,
+                ),
+            )
+            for segment, segment_k, exclude in self._segments(generation, k)
+        ]
+        return [
+            self._combine(
+                generation,
+                [(segment, batch[i]) for segment, batch in results],
+                k,
+            )
+            for i in range(len(queries))
+        ]
+
+    def exact_search(self, query, k: int) -> SearchResult:
+        generation = self._generation
+        results = [
+            (segment, segment.exact_search(query, segment_k, exclude))
+            for segment, segment_k, exclude in self._segments(generation, k)
+        ]
+        return self._combine(generation, results, k)
+
+    def batches(self, batch_size: int = 10000):
+        """Yields (ids, vectors, metadatas) for every visible document after merging pending writes."""
+        self.merge()
+        yield from self.main.batches(batch_size)
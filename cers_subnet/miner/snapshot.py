@@ -0,0 +1,353 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import urllib.request
+import numpy as np
+import bittensor as bt
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from cers_subnet.miner.ids import IdTable
+
+SNAPSHOT_FORMAT = 1
+MANIFEST = "manifest.json"
+VECTORS = "vectors.f32"
+IDS = "ids.bin"
+METADATA = "metadata.jsonl"
+# The near-duplicate registry of `Deduplicator`, included when the miner keeps one.
+DUPLICATES = "duplicates.jsonl"
+SNAPSHOT_FILES = frozenset({VECTORS, IDS, METADATA})
+OPTIONAL_FILES = frozenset({DUPLICATES})
+
+# (ids, float32 embeddings, metadatas), as yielded by `EmbeddingSpace.pages` or `BaseIndex.batches`.
+Batch = Tuple[List[str], np.ndarray, List[Dict[str, Any]]]
+
+
+class _HashingWriter:
+    """Writes a file while computing its SHA-256."""
+
+    def __init__(self, path: str):
+        self.file = open(path, "wb")
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data: bytes) -> None:
+        self.file.write(data)
+        self.sha256.update(data)
+        self.bytes += len(data)
+
+    def close(self) -> Dict[str, Any]:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        return {"sha256": self.sha256.hexdigest(), "bytes": self.bytes}
+
+
+def _sha256(path: str, chunk_size: int = 2**20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_snapshot(
+    batches: Iterable[Batch],
+    directory: str,
+    model_name: str,
+    version: Optional[int] = None,
+    duplicates: Optional[str] = None,
+    chunking: Tuple[int, int] = (0, 0),
+) -> Dict[str, Any]:
+    """
+    Writes a snapshot of an embedding space to `directory`.
+
+    The snapshot is a manifest plus three files: the embeddings as a raw little-endian
+    float32 matrix, the ids in the `IdTable` file format and one JSON metadata object per
+    line, all in the same row order. The manifest records the embedding model, the
+    chunking, the dimension, the row count and a SHA-256 per file. The files are written to a temporary
+    directory that replaces `directory` only when complete.
+
+    Args:
+        batches (Iterable[Batch]): The documents to export.
+        directory (str): Where to write the snapshot.
+        model_name (str): Embedding model the vectors were made with.
+        version (Optional[int]): Version of the index the snapshot was taken from.
+        duplicates (Optional[str]): Path of a near-duplicate registry to include as `duplicates.jsonl`.
+        chunking (Tuple[int, int]): (max tokens, overlap) the documents were split with, see
+            `EmbeddingSpace.chunking`; (0, 0) for whole documents.
+
+    Returns:
+        Dict[str, Any]: The manifest.
+    """
+    tmp_directory = directory.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    vectors = _HashingWriter(os.path.join(tmp_directory, VECTORS))
+    metadata = _HashingWriter(os.path.join(tmp_directory, METADATA))
+    ids = IdTable(os.path.join(tmp_directory, IDS))
+    count, dim = 0, None
+    for batch_ids, embeddings, metadatas in batches:
+        embeddings = np.ascontiguousarray(embeddings, dtype="<f4")
+        if dim is None:
+            dim = embeddings.shape[1]
+        vectors.write(embeddings.tobytes())
+        metadata.write(
+            "".join(json.dumps(md or {}) + "\n" for md in metadatas).encode(
+                "utf-8"
+            )
+        )
+        ids.intern(batch_ids)
+        count += len(batch_ids)
+    ids.close()
+    if len(ids) != count:
+        raise ValueError("The exported batches contain duplicate ids.")
+    files = {VECTORS: vectors.close(), METADATA: metadata.close()}
+    ids_path = os.path.join(tmp_directory, IDS)
+    files[IDS] = {
+        "sha256": _sha256(ids_path),
+        "bytes": os.path.getsize(ids_path),
+    }
+    if duplicates is not None and os.path.exists(duplicates):
+        registry = _HashingWriter(os.path.join(tmp_directory, DUPLICATES))
+        with open(duplicates, "rb") as f:
+            for chunk in iter(lambda: f.read(2**20), b""):
+                registry.write(chunk)
+        files[DUPLICATES] = registry.close()
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "model": model_name,
+        "chunk_tokens": chunking[0],
+        "chunk_overlap": chunking[1],
+        "dim": dim,
+        "count": count,
+        "version": version,
+        "created_at": time.time(),
+        "files": files,
+    }
+    with open(
+        os.path.join(tmp_directory, MANIFEST), "w", encoding="utf-8"
+    ) as f:
+        json.dump(manifest, f, indent=2)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+    return manifest
+
+
+def check_manifest(manifest: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validates a manifest before any of its files are read or written.
+
+    Only the snapshot's own file names are accepted, so a manifest from another miner
+    cannot name paths outside the snapshot directory, and the vector file must be exactly
+    `count * dim` float32 values.
+
+    Raises:
+        ValueError: If the format is unknown or the file list, count or dimension is invalid.
+    """
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(
+            f"Unsupported snapshot format {manifest.get('format')}."
+        )
+    files = manifest.get("files")
+    if (
+        not isinstance(files, dict)
+        or not SNAPSHOT_FILES <= set(files) <= SNAPSHOT_FILES | OPTIONAL_FILES
+    ):
+        raise ValueError(
+            f"Snapshot files must be {sorted(SNAPSHOT_FILES)}, optionally with {sorted(OPTIONAL_FILES)}."
+        )
+    count, dim = manifest.get("count"), manifest.get("dim")
+    if not isinstance(count, int) or count < 0:
+        raise ValueError(f"Invalid snapshot document count {count!r}.")
+    if count and (not isinstance(dim, int) or dim <= 0):
+        raise ValueError(f"Invalid snapshot dimension {dim!r}.")
+    for name, expected in files.items():
+        if (
+            not isinstance(expected, dict)
+            or not isinstance(expected.get("bytes"), int)
+            or expected["bytes"] < 0
+        ):
+            raise ValueError(f"Invalid size for snapshot file {name}.")
+    if files[VECTORS]["bytes"] != count * (dim or 0) * 4:
+        raise ValueError(
+            f"Snapshot vectors hold {files[VECTORS]['bytes']} bytes, not {count} x {dim} float32 values."
+        )
+    return manifest
+
+
+def verify_snapshot(directory: str) -> Dict[str, Any]:
+    """
+    Checks every file of a snapshot against its manifest and returns the manifest.
+
+    Raises:
+        ValueError: If the manifest is invalid or a file is missing or has the wrong size or checksum.
+    """
+    with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as f:
+        manifest = check_manifest(json.load(f))
+    for name, expected in manifest["files"].items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            raise ValueError(f"Snapshot file {name} is missing.")
+        if (
+            os.path.getsize(path) != expected["bytes"]
+            or _sha256(path) != expected["sha256"]
+        ):
+            raise ValueError(
+                f"Snapshot file {name} does not match its checksum."
+            )
+    ids = IdTable(os.path.join(directory, IDS))
+    ids.close()
+    if len(ids) != manifest["count"]:
+        raise ValueError(
+            f"Snapshot holds {len(ids)} ids, but its manifest counts {manifest['count']} documents."
+        )
+    return manifest
+
+
+def read_snapshot(directory: str, batch_size: int = 10000) -> Iterator[Batch]:
+    """Yields the documents of a verified snapshot in batches."""
+    with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as f:
+        manifest = check_manifest(json.load(f))
+    count, dim = manifest["count"], manifest["dim"]
+    if count == 0:
+        return
+    # The memory map below must not read past, or stop short of, the vector file.
+    if os.path.getsize(os.path.join(directory, VECTORS)) != count * dim * 4:
+        raise ValueError(
+            f"Snapshot vectors do not hold {count} x {dim} float32 values."
+        )
+    ids = IdTable(os.path.join(directory, IDS))
+    ids.close()
+    vectors = np.memmap(
+        os.path.join(directory, VECTORS),
+        dtype="<f4",
+        mode="r",
+        shape=(count, dim),
+    )
+    with open(
+        os.path.join(directory, METADATA), "r", encoding="utf-8"
+    ) as metadata:
+        for start in range(0, count, batch_size):
+            stop = min(start + batch_size, count)
+            metadatas = [
+                json.loads(next(metadata)) for _ in range(start, stop)
+            ]
+            yield ids.decode(range(start, stop)), np.array(
+                vectors[start:stop], dtype=np.float32
+            ), metadatas
+
+
+def fetch_snapshot(
+    url: str,
+    directory: str,
+    api_key: Optional[str] = None,
+    chunk_size: int = 2**20,
+) -> Dict[str, Any]:
+    """
+    Streams a snapshot from another miner's `GET /snapshot` API into `directory` and verifies it.
+
+    Args:
+        url (str): Base URL of the other miner's API, e.g. `http://10.0.0.5:8001`.
+        directory (str): Where to store the snapshot.
+        api_key (Optional[str]): The other miner's API key.
+
+    Returns:
+        Dict[str, Any]: The verified manifest.
+    """
+    headers = {"X-API-Key": api_key} if api_key else {}
+
+    def get(path: str):
+        return urllib.request.urlopen(
+            urllib.request.Request(url.rstrip("/") + path, headers=headers)
+        )
+
+    with get("/snapshot") as response:
+        # The file names come from the other miner; they are checked before anything is written.
+        manifest = check_manifest(json.load(response))
+    tmp_directory = directory.rstrip("/") + ".download"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    for name in manifest["files"]:
+        bt.logging.info(
+            f"Downloading snapshot file {name} ({manifest['files'][name]['bytes'] / 2**20:.1f} MiB)."
+        )
+        with get(f"/snapshot/files/{name}") as response, open(
+            os.path.join(tmp_directory, name), "wb"
+        ) as f:
+            for chunk in iter(lambda: response.read(chunk_size), b""):
+                f.write(chunk)
+    with open(
+        os.path.join(tmp_directory, MANIFEST), "w", encoding="utf-8"
+    ) as f:
+        json.dump(manifest, f, indent=2)
+    verify_snapshot(tmp_directory)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+    return manifest
+
+
+def check_chunking(
+    manifest: Dict[str, Any], chunking: Tuple[int, int]
+) -> None:
+    """
+    Checks that a snapshot was chunked like a space with the given (max tokens, overlap).
+
+    Snapshots exported before the manifest recorded its chunking are accepted with a warning.
+
+    Raises:
+        ValueError: If the snapshot was chunked differently.
+    """
+    recorded = (manifest.get("chunk_tokens"), manifest.get("chunk_overlap"))
+    if recorded == (None, None):
+        bt.logging.warning(
+            "The snapshot does not record its chunking; it is assumed to match the space."
+        )
+    elif recorded != tuple(chunking):
+        # Chunk ids and vectors would not match what the space writes for the same documents.
+        raise ValueError(
+            f"Snapshot was chunked with {recorded[0]} tokens and an overlap of {recorded[1]}, "
+            f"but the space uses {chunking[0]} and {chunking[1]}."
+        )
+
+
+def import_snapshot(space, directory: str, batch_size: int = 10000) -> int:
+    """
+    Verifies a snapshot and writes its documents to an embedding space's collection and index.
+
+    Raises:
+        ValueError: If the snapshot is corrupt or was made with another embedding model or
+            chunking.
+
+    Returns:
+        int: The number of documents imported.
+    """
+    manifest = verify_snapshot(directory)
+    if manifest["model"] != space.model_name:
+        raise ValueError(
+            f"Snapshot was made with {manifest['model']}, but the space uses {space.model_name}."
+        )
+    check_chunking(manifest, space.chunking)
+    imported = 0
+    for ids, embeddings, metadatas in read_snapshot(directory, batch_size):
+        space.upsert(ids, None, metadatas, embeddings=embeddings)
+        imported += len(ids)
+    return imported
@@ -0,0 +1,355 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import json
+import functools
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from cers_subnet.miner.chunking import (
+    CHUNK_SEPARATOR,
+    Chunker,
+    ChunkMap,
+    chunk_id,
+    split_chunk_id,
+)
+from cers_subnet.miner.index import BaseIndex, FlatIndex
+
+# The serving space of a miner database, as written by the miner for itself and a separate ingest process.
+SPACE_FILE = "embedding_space.json"
+
+
+class EmbeddingSpace:
+    """
+    An embedding model together with the ChromaDB collection and search index built with it.
+
+    Vectors from different models are not comparable, so the model, its collection and its
+    index always change together. The miner serves queries from one space at a time and a
+    model migration builds a second one next to it.
+
+    With a `chunker`, long documents are stored as several chunk embeddings. The first
+    chunk is stored under the document id and the others under `chunk_id(doc_id, n)`, so
+    searches return chunks that `collapse` maps back to documents.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        model,
+        collection,
+        index: Optional[BaseIndex] = None,
+        query_cache_size: int = 1024,
+        chunker: Optional[Chunker] = None,
+    ):
+        self.model_name = model_name
+        self.model = model
+        self.collection = collection
+        self.index = index if index is not None else FlatIndex()
+        self.chunker = chunker
+        self.chunks = ChunkMap()
+        # Validators repeat benchmark queries, so keep their embeddings around.
+        self.encode_query = functools.lru_cache(maxsize=query_cache_size)(
+            self._encode_query
+        )
+
+    @staticmethod
+    def encode_metadata(metadata: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """ChromaDB metadata values must be scalars, so the document metadata is stored as one JSON field."""
+        return {"metadata": json.dumps(metadata or {})}
+
+    @staticmethod
+    def decode_metadata(stored: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return json.loads((stored or {}).get("metadata", "{}"))
+
+    def _encode_query(self, query: str) -> np.ndarray:
+        """Encodes a query into a read-only embedding that can be shared between requests."""
+        embedding = self.model.encode(query, convert_to_numpy=True).astype(
+            np.float32
+        )
+        embedding.setflags(write=False)
+        return embedding
+
+    def encode_queries(self, queries: Sequence[str]) -> np.ndarray:
+        """Encodes a batch of queries in one model call, returning read-only (queries, dim) embeddings."""
+        embeddings = self.model.encode(
+            list(queries), convert_to_numpy=True
+        ).astype(np.float32)
+        embeddings.setflags(write=False)
+        return embeddings
+
+    def encode(self, documents: Sequence[str]) -> np.ndarray:
+        return self.model.encode(
+            list(documents), convert_to_numpy=True
+        ).astype(np.float32)
+
+    def encode_documents(self, documents: Sequence[str]) -> List[np.ndarray]:
+        """
+        Encodes documents into one (chunks, dim) matrix each.
+
+        The chunks of all documents are encoded in a single call, so the model batches
+        them together no matter how they are spread over the documents.
+        """
+        if self.chunker is None:
+            return list(self.encode(documents)[:, None, :])
+        chunks = [self.chunker.split(document) for document in documents]
+        embeddings = self.encode(
+            [chunk for document_chunks in chunks for chunk in document_chunks]
+        )
+        bounds = np.cumsum(
+            [len(document_chunks) for document_chunks in chunks]
+        )[:-1]
+        return np.split(embeddings, bounds)
+
+    def document_ids(self) -> List[str]:
+        """Ids of the documents in the index, without their extra chunks."""
+        return [
+            stored_id
+            for stored_id in self.index.ids()
+            if CHUNK_SEPARATOR not in stored_id
+        ]
+
+    def document_count(self) -> int:
+        return len(self.index) - self.chunks.extra_chunks
+
+    def collapse(self, keys: np.ndarray, k: int) -> np.ndarray:
+        """Maps chunk keys ranked by score to the top-k unique document keys."""
+        return self.chunks.collapse(self.index.id_table, keys, k)
+
+    def chunk_status(self) -> Dict[str, Any]:
+        documents = self.document_count()
+        return {
+            "documents": documents,
+            "chunks": len(self.index),
+            "expansion": len(self.index) / documents if documents else None,
+            "max_tokens": self.chunker.max_tokens
+            if self.chunker is not None
+            else None,
+            "overlap": self.chunker.overlap
+            if self.chunker is not None
+            else None,
+        }
+
+    @property
+    def chunking(self) -> Tuple[int, int]:
+        """The effective (max tokens, overlap) of the chunker, (0, 0) for whole documents."""
+        return (
+            (self.chunker.max_tokens, self.chunker.overlap)
+            if self.chunker is not None
+            else (0, 0)
+        )
+
+    def settings(self) -> Dict[str, Any]:
+        """What a writer needs to produce embeddings this space accepts: the model and the effective chunking."""
+        chunk_tokens, chunk_overlap = self.chunking
+        return {
+            "model": self.model_name,
+            "collection": self.collection.name,
+            "chunk_tokens": chunk_tokens,
+            "chunk_overlap": chunk_overlap,
+        }
+
+    def pages(self, page_size: int = 10000):
+        """Yields (ids, embeddings, metadatas) for everything stored in the collection."""
+        total = self.collection.count()
+        for offset in range(0, total, page_size):
+            page = self.collection.get(
+                include=["embeddings", "metadatas"],
+                limit=page_size,
+                offset=offset,
+            )
+            if page["ids"]:
+                yield (
+                    page["ids"],
+                    np.asarray(page["embeddings"], dtype=np.float32),
+                    [
+                        self.decode_metadata(stored)
+                        for stored in page["metadatas"]
+                    ],
+                )
+
+    def stored_ids(self, page_size: int = 10000):
+        """Yields every id stored in the collection, chunk ids included, without reading the embeddings."""
+        total = self.collection.count()
+        for offset in range(0, total, page_size):
+            yield from self.collection.get(
+                include=[], limit=page_size, offset=offset
+            )["ids"]
+
+    def load(self, page_size: int = 10000) -> None:
+        """
+        Loads every embedding stored in the collection into the search index.
+
+        An index that restored rows from an earlier run is brought in line with the
+        collection: its rows get their metadata back, and rows of documents the
+        collection no longer holds are deleted.
+        """
+        restored = self.index.restore()
+        seen = set()
+        for ids, embeddings, metadatas in self.pages(page_size):
+            self.index.upsert(ids, embeddings, metadatas)
+            self.chunks.add(ids)
+            if restored:
+                seen.update(ids)
+        if restored:
+            stale = [
+                stored_id
+                for stored_id in self.index.ids()
+                if stored_id not in seen
+            ]
+            if stale:
+                self.index.delete(stale)
+
+    def upsert(
+        self,
+        ids: List[str],
+        documents: Optional[Sequence[str]],
+        metadatas: Optional[Sequence[Optional[Dict[str, Any]]]] = None,
+        embeddings: Optional[Union[np.ndarray, List[np.ndarray]]] = None,
+    ) -> None:
+        """
+        Encodes documents with this space's model and writes them to the collection and the index.
+
+        The document text itself is never stored, only its embedding. `documents` may be None
+        when `embeddings` are given. `embeddings` is either one vector per id, stored under
+        the id as given, or one (chunks, dim) matrix per document as from `encode_documents`.
+        """
+        metadatas = (
+            list(metadatas) if metadatas is not None else [None] * len(ids)
+        )
+        if embeddings is None:
+            embeddings = self.encode_documents(documents)
+        if isinstance(embeddings, np.ndarray):
+            self._write(list(ids), embeddings, metadatas)
+            return
+        if any(CHUNK_SEPARATOR in doc_id for doc_id in ids):
+            raise ValueError(
+                "Document ids must not contain the chunk separator \\x1f."
+            )
+        stored_ids, stored_metadatas, stale = [], [], []
+        for doc_id, metadata, matrix in zip(ids, metadatas, embeddings):
+            stored_ids.extend(
+                chunk_id(doc_id, number) for number in range(len(matrix))
+            )
+            stored_metadatas.extend([metadata] * len(matrix))
+            # A shorter new version of a document leaves chunks of the old one behind.
+            stale.extend(
+                stored_id
+                for stored_id in self.chunks.chunk_ids(doc_id)
+                if split_chunk_id(stored_id)[1] >= len(matrix)
+            )
+        if stale:
+            self._remove(stale)
+        self._write(stored_ids, np.concatenate(embeddings), stored_metadatas)
+
+    def _write(
+        self,
+        stored_ids: List[str],
+        embeddings: np.ndarray,
+        metadatas: List[Optional[Dict[str, Any]]],
+    ) -> None:
+        self.collection.upsert(
+            ids=stored_ids,
+            embeddings=embeddings.tolist(),
+            metadatas=[
+                self.encode_metadata(metadata) for metadata in metadatas
+            ],
+        )
+        self.index.upsert(stored_ids, embeddings, metadatas)
+        self.chunks.add(stored_ids)
+
+    def _remove(self, stored_ids: List[str]) -> None:
+        self.collection.delete(ids=stored_ids)
+        self.index.delete(stored_ids)
+        self.chunks.remove(stored_ids)
+
+    def delete(self, ids: List[str]) -> None:
+        """Deletes documents together with all of their chunks."""
+        self._remove(
+            [
+                stored_id
+                for doc_id in ids
+                for stored_id in self.chunks.chunk_ids(doc_id)
+            ]
+        )
+
+    def rename(self, old_id: str, new_id: str) -> None:
+        """Moves a document's stored embeddings and metadata to another id, e.g. when a duplicate takes over."""
+        old_ids = self.chunks.chunk_ids(old_id)
+        stored = self.collection.get(
+            ids=old_ids, include=["embeddings", "metadatas"]
+        )
+        if not stored["ids"]:
+            return
+        new_ids = [
+            chunk_id(new_id, split_chunk_id(stored_id)[1])
+            for stored_id in stored["ids"]
+        ]
+        embeddings = np.asarray(stored["embeddings"], dtype=np.float32)
+        self.collection.upsert(
+            ids=new_ids,
+            embeddings=embeddings.tolist(),
+            metadatas=stored["metadatas"],
+        )
+        self.index.upsert(
+            new_ids,
+            embeddings,
+            [
+                self.decode_metadata(metadata)
+                for metadata in stored["metadatas"]
+            ],
+        )
+        self.chunks.add(new_ids)
+        self._remove(old_ids)
+
+
+def read_space_file(path: str) -> Optional[Dict[str, Any]]:
+    """The settings in a space file, or None before one was written. Older files only hold the model and collection."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            settings = json.load(f)
+    except FileNotFoundError:
+        return None
+    settings.setdefault("chunk_tokens", 0)
+    settings.setdefault("chunk_overlap", 0)
+    return settings
+
+
+def startup_migration(
+    settings: Optional[Dict[str, Any]], configured_model: str
+) -> Optional[str]:
+    """
+    The model a restarting miner should migrate to, or None to keep the recorded one.
+
+    Only a change of the configured model since it was last recorded starts a migration.
+    A model switched to through the API or by importing a snapshot stays active across
+    restarts even though the configuration still names the previous one. Files written
+    before the configured model was recorded are assumed to match the configuration.
+    """
+    if settings is None or settings["model"] == configured_model:
+        return None
+    if settings.get("configured_model", configured_model) == configured_model:
+        return None
+    return configured_model
+
+
+def write_space_file(path: str, settings: Dict[str, Any]) -> None:
+    """Atomically replaces a space file, so a reader never sees a partial one."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(settings, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,175 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import math
+import queue
+import random
+import threading
+import collections
+import numpy as np
+import bittensor as bt
+from typing import Any, Dict, Optional
+
+from cers_subnet.miner.index import BaseIndex
+
+
+class BreadthTuner:
+    """
+    Adjusts an index's search breadth online so that p99 search latency stays under a target.
+
+    Latencies are collected in windows of `window` searches. After each window the
+    breadth shrinks if p99 is over the target; it grows again while p99 has headroom
+    (below `headroom * target`) and sampled recall is still under `target_recall`, so
+    recall is only given up when latency requires it.
+
+    A `sample_rate` fraction of unfiltered searches is re-run with `exact_search` on a
+    background thread to estimate recall@k of the current setting. Samples that cannot
+    be queued are dropped rather than slowing the query path.
+    """
+
+    def __init__(
+        self,
+        target_p99: float,
+        min_breadth: int = 16,
+        max_breadth: int = 4096,
+        window: int = 200,
+        headroom: float = 0.7,
+        step: float = 1.25,
+        target_recall: float = 0.99,
+        sample_rate: float = 0.02,
+        recall_window: int = 100,
+    ):
+        self.target_p99 = target_p99
+        self.min_breadth = min_breadth
+        self.max_breadth = max_breadth
+        self.window = window
+        self.headroom = headroom
+        self.step = step
+        self.target_recall = target_recall
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self._index: Optional[BaseIndex] = None
+        self._latencies = []
+        self._recalls = collections.deque(maxlen=recall_window)
+        self._last_p99: Optional[float] = None
+        self._adjustments = 0
+        self._samples: "queue.Queue" = queue.Queue(maxsize=16)
+        self._worker = threading.Thread(target=self._verify_loop, daemon=True)
+        self._worker.start()
+
+    def recall(self) -> Optional[float]:
+        """Mean sampled recall@k since the last breadth change, or None before any sample."""
+        with self._lock:
+            return float(np.mean(self._recalls)) if self._recalls else None
+
+    def observe(
+        self,
+        index: BaseIndex,
+        query,
+        keys: np.ndarray,
+        k: int,
+        latency: float,
+        filtered: bool = False,
+    ) -> None:
+        """
+        Records one search and adjusts the breadth at the end of a window.
+
+        Args:
+            index (BaseIndex): The index that served the search.
+            query: The query embedding.
+            keys (np.ndarray): Keys the search returned.
+            k (int): Number of results requested.
+            latency (float): Search time in seconds.
+            filtered (bool): Whether a metadata filter was applied; filtered searches are not recall-sampled.
+        """
+        if index.breadth is None:
+            return
+        with self._lock:
+            if index is not self._index:
+                # A new index (e.g. after a model migration) starts from its own breadth.
+                self._index = index
+                self._latencies = []
+                self._recalls.clear()
+            self._latencies.append(latency)
+            if len(self._latencies) >= self.window:
+                self._adjust(index)
+        if not filtered and random.random() < self.sample_rate:
+            try:
+                self._samples.put_nowait(
+                    (index, index.breadth, query, keys, k)
+                )
+            except queue.Full:
+                pass
+
+    def _adjust(self, index: BaseIndex) -> None:
+        p99 = float(np.percentile(self._latencies, 99))
+        self._latencies = []
+        self._last_p99 = p99
+        breadth = index.breadth
+        recall = float(np.mean(self._recalls)) if self._recalls else None
+        if p99 > self.target_p99:
+            new = max(self.min_breadth, int(breadth / self.step))
+            if (
+                recall is not None
+                and recall < self.target_recall
+                and new == self.min_breadth
+            ):
+                bt.logging.warning(
+                    f"Search p99 {p99 * 1000:.1f}ms is over the {self.target_p99 * 1000:.0f}ms target at the minimum breadth."
+                )
+        elif p99 < self.headroom * self.target_p99 and (
+            recall is None or recall < self.target_recall
+        ):
+            new = min(self.max_breadth, int(math.ceil(breadth * self.step)))
+        else:
+            return
+        if new != breadth:
+            index.breadth = new
+            self._recalls.clear()
+            self._adjustments += 1
+            recall_text = "n/a" if recall is None else f"{recall:.3f}"
+            bt.logging.info(
+                f"Search breadth {breadth} -> {new} (p99 {p99 * 1000:.1f}ms, recall {recall_text})."
+            )
+
+    def _verify_loop(self) -> None:
+        while True:
+            index, breadth, query, keys, k = self._samples.get()
+            try:
+                exact = index.exact_search(query, k).keys
+            except Exception as e:
+                bt.logging.warning(f"Recall check failed: {e}")
+                continue
+            if len(exact) == 0:
+                continue
+            recall = len(np.intersect1d(keys, exact)) / len(exact)
+            with self._lock:
+                # Samples taken before the last breadth change no longer apply.
+                if index is self._index and breadth == index.breadth:
+                    self._recalls.append(recall)
+
+    def status(self) -> Dict[str, Any]:
+        index = self._index
+        return {
+            "breadth": None if index is None else index.breadth,
+            "target_p99_ms": self.target_p99 * 1000,
+            "last_p99_ms": None
+            if self._last_p99 is None
+            else self._last_p99 * 1000,
+            "sampled_recall": self.recall(),
+            "adjustments": self._adjustments,
+        }
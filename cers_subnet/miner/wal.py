@@ -0,0 +1,403 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import json
+import zlib
+import time
+import struct
+import threading
+import bittensor as bt
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# length, crc32 of the payload, log sequence number
+_HEADER = struct.Struct("<IIQ")
+_SEGMENT = "wal-{:020d}.log"
+
+
+def _fsync_directory(directory: str) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _remove(path: str) -> None:
+    # The writer and a consumer in another process may both delete an applied segment.
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class WriteAheadLog:
+    """
+    Append-only, checksummed log of document mutations with group commit.
+
+    `append` returns once its records are on disk. Concurrent appends are written and
+    fsynced together by a single commit thread, so an acknowledged mutation costs one
+    shared sequential write instead of an index update. Records get increasing log
+    sequence numbers (LSNs) and are stored in segment files named after their first LSN.
+
+    Consumers read records after the last LSN they applied and report progress with
+    `mark_applied`; fully applied segments are deleted. The segment being written is
+    deleted by the writer once everything in it has been applied, and the next write
+    starts a new one. The applied LSN is persisted, so after a crash consumers resume
+    from it. Records are JSON, and upserts include the document text, which therefore
+    stays on disk only until it has been applied.
+
+    If writing or syncing the log fails, the log stops accepting records and `append`
+    raises instead of acknowledging them.
+
+    Only one process may write a log, but other processes may `read` it while it grows.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 64 * 2**20,
+        group_commit_ms: float = 2.0,
+        writer: bool = True,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.group_commit = group_commit_ms / 1000
+        os.makedirs(directory, exist_ok=True)
+        self._applied_path = os.path.join(directory, "applied")
+        self._lock = threading.Lock()
+        self._committed = threading.Condition(self._lock)
+        self._pending: List[Tuple[int, bytes]] = []
+        self._file = None
+        self._closed = False
+        self.error: Optional[Exception] = None
+        self._writer = writer
+        self.last_lsn = self.applied_lsn()
+        self.durable_lsn = self.last_lsn
+        if writer:
+            self._recover()
+            self._committer = threading.Thread(
+                target=self._commit_loop, daemon=True
+            )
+            self._committer.start()
+
+    def segments(self) -> List[Tuple[int, str]]:
+        """(first LSN, path) of every segment, oldest first."""
+        names = sorted(
+            name
+            for name in os.listdir(self.directory)
+            if name.startswith("wal-") and name.endswith(".log")
+        )
+        return [
+            (int(name[4:-4]), os.path.join(self.directory, name))
+            for name in names
+        ]
+
+    @staticmethod
+    def _scan(path: str, start: int = 0):
+        """Yields (lsn, record, end offset) for every intact record from `start`; stops at a torn or corrupt one."""
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            # Deleted by the writer after everything in it was applied.
+            return
+        with f:
+            f.seek(start)
+            offset = start
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    return
+                length, checksum, lsn = _HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    return
+                offset += _HEADER.size + length
+                yield lsn, payload, offset
+
+    def _recover(self) -> None:
+        """Finds the last intact record and cuts off anything a crash left half-written after it."""
+        segments = self.segments()
+        if not segments:
+            return
+        _, path = segments[-1]
+        end = 0
+        for lsn, _, offset in self._scan(path):
+            self.last_lsn, end = max(self.last_lsn, lsn), offset
+        if end < os.path.getsize(path):
+            bt.logging.warning(
+                f"Truncating {os.path.getsize(path) - end} bytes of a torn write at the end of {path}."
+            )
+            with open(path, "r+b") as f:
+                f.truncate(end)
+        self.durable_lsn = self.last_lsn
+
+    def append(self, records: List[Dict[str, Any]]) -> int:
+        """Durably appends `records` and returns the LSN of the last one."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The write-ahead log is closed.")
+            self._raise_error()
+            for record in records:
+                self.last_lsn += 1
+                self._pending.append(
+                    (self.last_lsn, json.dumps(record).encode("utf-8"))
+                )
+            lsn = self.last_lsn
+            self._committed.notify_all()
+            while self.durable_lsn < lsn:
+                self._raise_error()
+                self._committed.wait()
+        return lsn
+
+    def _raise_error(self) -> None:
+        if self.error is not None:
+            raise RuntimeError(
+                f"The write-ahead log failed and accepts no more records: {self.error}"
+            ) from self.error
+
+    def _segment_for_write(self, first_lsn: int):
+        if self._file is None or self._file.tell() >= self.segment_bytes:
+            if self._file is not None:
+                self._file.close()
+            segments = self.segments()
+            if (
+                segments
+                and self._file is None
+                and os.path.getsize(segments[-1][1]) < self.segment_bytes
+            ):
+                path = segments[-1][1]
+            else:
+                path = os.path.join(self.directory, _SEGMENT.format(first_lsn))
+            self._file = open(path, "ab")
+            _fsync_directory(self.directory)
+        return self._file
+
+    def _drop_applied(self) -> None:
+        """Deletes the segments, including the one being written, whose records have all been applied."""
+        if self.durable_lsn == 0 or self.applied_lsn() < self.durable_lsn:
+            return
+        segments = self.segments()
+        if not segments:
+            return
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        for _, path in segments:
+            _remove(path)
+        _fsync_directory(self.directory)
+
+    def _commit_loop(self) -> None:
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    # Only this thread touches the segment being written, so it also deletes it.
+                    try:
+                        self._drop_applied()
+                    except OSError as e:
+                        bt.logging.warning(
+                            f"Could not delete applied write-ahead log segments: {e}"
+                        )
+                    self._committed.wait(timeout=1.0)
+                if self._closed and not self._pending:
+                    return
+            # Let concurrent appenders join this commit.
+            time.sleep(self.group_commit)
+            with self._lock:
+                batch, self._pending = self._pending, []
+            try:
+                f = self._segment_for_write(batch[0][0])
+                f.write(
+                    b"".join(
+                        _HEADER.pack(len(payload), zlib.crc32(payload), lsn)
+                        + payload
+                        for lsn, payload in batch
+                    )
+                )
+                f.flush()
+                os.fsync(f.fileno())
+            except Exception as e:
+                # After a failed write or fsync it is unknown what reached the disk, so stop here:
+                # waiting and later appends raise instead of acknowledging records.
+                bt.logging.error(f"Writing the write-ahead log failed: {e}")
+                with self._lock:
+                    self.error = e
+                    self._pending = []
+                    self._committed.notify_all()
+                return
+            with self._lock:
+                self.durable_lsn = batch[-1][0]
+                self._committed.notify_all()
+
+    def read(
+        self, after_lsn: int, limit: int = 1024
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """Returns up to `limit` committed records with an LSN above `after_lsn`, oldest first."""
+        records = []
+        # The writing process only hands out records that are already on disk.
+        last = self.durable_lsn if self._writer else None
+        segments = self.segments()
+        for i, (first, path) in enumerate(segments):
+            if i + 1 < len(segments) and segments[i + 1][0] <= after_lsn + 1:
+                continue
+            for lsn, payload, _ in self._scan(path):
+                if lsn <= after_lsn:
+                    continue
+                if last is not None and lsn > last:
+                    return records
+                records.append((lsn, json.loads(payload)))
+                if not self._writer:
+                    self.durable_lsn = max(self.durable_lsn, lsn)
+                if len(records) >= limit:
+                    return records
+        return records
+
+    def applied_lsn(self) -> int:
+        try:
+            with open(self._applied_path, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def mark_applied(self, lsn: int) -> None:
+        """Persists that every record up to `lsn` has been applied and drops segments that are fully applied."""
+        tmp_path = self._applied_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(lsn))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._applied_path)
+        segments = self.segments()
+        for (first, path), (next_first, _) in zip(segments, segments[1:]):
+            # A segment is fully applied when the next one starts at or before lsn + 1.
+            if next_first <= lsn + 1:
+                _remove(path)
+        if self._writer:
+            # The commit thread deletes the last segment once it sees everything was applied.
+            with self._lock:
+                self._committed.notify_all()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._committed.notify_all()
+
+
+class LogApplier:
+    """
+    Applies write-ahead log records to the miner in batches on a background thread.
+
+    Records are read from the last applied LSN, passed to `apply` up to `batch_size` at a
+    time, and then marked applied. Re-applying a record is harmless (upserts and deletes
+    are idempotent), so replay after a crash simply starts from the persisted LSN.
+
+    A batch that fails is retried. After `max_attempts` failures its records are applied
+    one at a time, and those that still fail are moved to `quarantine.jsonl` in the log
+    directory with their error, so one bad record cannot hold up every later mutation.
+    """
+
+    def __init__(
+        self,
+        wal: WriteAheadLog,
+        apply: Callable[[List[Dict[str, Any]]], None],
+        batch_size: int = 256,
+        poll_interval: float = 0.05,
+        max_attempts: int = 5,
+    ):
+        self.wal = wal
+        self.apply = apply
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.applied_lsn = wal.applied_lsn()
+        self.applied = 0
+        self.error: Optional[str] = None
+        # Consecutive failures of the batch at `applied_lsn`.
+        self.attempts = 0
+        self.quarantine_path = os.path.join(wal.directory, "quarantine.jsonl")
+        self.quarantined: List[int] = []
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def catch_up(self) -> int:
+        """
+        Applies every committed record now and returns how many were applied.
+
+        Raises the error of a failing batch until it has failed `max_attempts` times.
+        """
+        total = 0
+        while True:
+            records = self.wal.read(self.applied_lsn, self.batch_size)
+            if not records:
+                return total
+            try:
+                self.apply([record for _, record in records])
+            except Exception as e:
+                self.attempts += 1
+                if self.attempts < self.max_attempts:
+                    raise
+                bt.logging.error(
+                    f"Giving up on a batch of {len(records)} records after {self.attempts} attempts: {e}"
+                )
+                self._apply_singly(records)
+            self.attempts = 0
+            self.applied_lsn = records[-1][0]
+            self.wal.mark_applied(self.applied_lsn)
+            self.applied += len(records)
+            total += len(records)
+
+    def _apply_singly(self, records: List[Tuple[int, Dict[str, Any]]]) -> None:
+        for lsn, record in records:
+            try:
+                self.apply([record])
+            except Exception as e:
+                self._quarantine(lsn, record, e)
+
+    def _quarantine(
+        self, lsn: int, record: Dict[str, Any], error: Exception
+    ) -> None:
+        bt.logging.error(
+            f"Quarantining write-ahead log record {lsn} ({record.get('op')} {record.get('id')}): {error}"
+        )
+        with open(self.quarantine_path, "a", encoding="utf-8") as f:
+            f.write(
+                json.dumps({"lsn": lsn, "error": str(error), "record": record})
+                + "\n"
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        self.quarantined.append(lsn)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                if not self.catch_up():
+                    time.sleep(self.poll_interval)
+                self.error = None
+            except Exception as e:
+                # Keep the records; they are retried on the next pass.
+                self.error = str(e)
+                bt.logging.error(
+                    f"Applying write-ahead log records failed (attempt {self.attempts}): {e}"
+                )
+                time.sleep(1.0)
+
+    def lag(self) -> int:
+        """Committed records that have not been applied yet."""
+        return max(self.wal.durable_lsn - self.applied_lsn, 0)
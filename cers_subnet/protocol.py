@@ -23,9 +23,30 @@ class EnterpriseRAG(bt.Synapse):
     A secure RAG synapse protocol for enterprise use.
     It transports a query string and returns a list of document IDs,
     ensuring that sensitive document content is never exposed.
+
+    An optional `filter` restricts the search to documents whose metadata matches,
+    using the ChromaDB `where` syntax, e.g.
+    `{"$and": [{"department": "legal"}, {"date": {"$gte": 20240101}}]}`.
     """
     query: str
+    filter: typing.Optional[typing.Dict[str, typing.Any]] = None
     document_ids: typing.List[str] = []
 
     def deserialize(self) -> typing.List[str]:
-        return self.document_ids
\ No newline at end of file
+        return self.document_ids
+
+class EnterpriseRAGBatch(bt.Synapse):
+    """
+    Several `EnterpriseRAG` queries in one request, so they share one round trip and one signature.
+
+    `k` gives the number of document IDs wanted for each query; queries without one get the
+    miner's default. `document_ids` holds one ranked list per query, in the order of `queries`.
+    The optional `filter` applies to every query.
+    """
+    queries: typing.List[str]
+    k: typing.List[int] = []
+    filter: typing.Optional[typing.Dict[str, typing.Any]] = None
+    document_ids: typing.List[typing.List[str]] = []
+
+    def deserialize(self) -> typing.List[typing.List[str]]:
+        return self.document_ids
@@ -0,0 +1,142 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT of OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import bittensor as bt
+import numpy as np
+from typing import List, NamedTuple, Optional
+
+
+class UidAvailability(NamedTuple):
+    """Which UIDs may be queried, computed once per metagraph sync."""
+
+    block: int
+    vpermit_tao_limit: float
+    available: np.ndarray
+
+    @classmethod
+    def of(
+        cls, metagraph: "bt.metagraph.Metagraph", vpermit_tao_limit: float
+    ) -> "UidAvailability":
+        """
+        A UID is available if its axon is serving and it is not a validator holding more than
+        `vpermit_tao_limit` stake.
+        """
+        n = len(metagraph.axons)
+        serving = np.fromiter(
+            (axon.is_serving for axon in metagraph.axons), dtype=bool, count=n
+        )
+        permit = np.asarray(metagraph.validator_permit, dtype=bool)[:n]
+        stake = np.asarray(metagraph.S, dtype=np.float64)[:n]
+        available = serving & ~(permit & (stake > vpermit_tao_limit))
+        available.setflags(write=False)
+        return cls(_block(metagraph), vpermit_tao_limit, available)
+
+
+def _block(metagraph) -> int:
+    block = getattr(metagraph, "block", None)
+    return -1 if block is None else int(block)
+
+
+# The availability of the most recently used metagraph. A validator has one, and it changes once per sync;
+# the pair is replaced in one assignment, so forwards and the resync thread can share it.
+_cache: Optional[tuple] = None
+_rng = np.random.default_rng()
+
+
+def uid_availability(
+    metagraph: "bt.metagraph.Metagraph", vpermit_tao_limit: float
+) -> UidAvailability:
+    """Returns the availability of every UID, recomputing it only when the metagraph was synced."""
+    global _cache
+    cached = _cache
+    if cached is not None:
+        graph, availability = cached
+        if (
+            graph is metagraph
+            and availability.block == _block(metagraph)
+            and availability.vpermit_tao_limit == vpermit_tao_limit
+            and len(availability.available) == len(metagraph.axons)
+        ):
+            return availability
+    availability = UidAvailability.of(metagraph, vpermit_tao_limit)
+    _cache = (metagraph, availability)
+    return availability
+
+
+def check_uid_availability(
+    metagraph: "bt.metagraph.Metagraph", uid: int, vpermit_tao_limit: int
+) -> bool:
+    """Check if uid is available. The UID should be available if it is serving and has less than vpermit_tao_limit stake
+    Args:
+        metagraph (:obj: bt.metagraph.Metagraph): Metagraph object
+        uid (int): uid to be checked
+        vpermit_tao_limit (int): Validator permit tao limit
+    Returns:
+        bool: True if uid is available, False otherwise
+    """
+    return bool(uid_availability(metagraph, vpermit_tao_limit).available[uid])
+
+
+def sample_uids(
+    available: np.ndarray,
+    k: int,
+    exclude: Optional[List[int]] = None,
+    rng: Optional[np.random.Generator] = None,
+) -> np.ndarray:
+    """
+    Samples k distinct UIDs where `available` is set, preferring those not in `exclude`.
+
+    Excluded UIDs are only drawn when too few others are available; at most as many UIDs as
+    are available are returned.
+    """
+    rng = rng or _rng
+    k = min(k, int(np.count_nonzero(available)))
+    candidates = available
+    if exclude is not None and len(exclude):
+        candidates = available.copy()
+        candidates[np.asarray(exclude, dtype=np.int64)] = False
+    candidate_uids = np.flatnonzero(candidates)
+    if candidate_uids.size >= k:
+        return rng.choice(candidate_uids, size=k, replace=False)
+    # Not enough candidates: query every one of them and top up with excluded UIDs.
+    excluded_uids = np.flatnonzero(available & ~candidates)
+    uids = np.concatenate(
+        [
+            candidate_uids,
+            rng.choice(
+                excluded_uids, size=k - candidate_uids.size, replace=False
+            ),
+        ]
+    )
+    rng.shuffle(uids)
+    return uids
+
+
+def get_random_uids(self, k: int, exclude: List[int] = None) -> np.ndarray:
+    """Returns k available random uids from the metagraph.
+    Args:
+        k (int): Number of uids to return.
+        exclude (List[int]): List of uids to exclude from the random sampling.
+    Returns:
+        uids (np.ndarray): Randomly sampled available uids.
+    Notes:
+        If `k` is larger than the number of available `uids`, set `k` to the number of available `uids`.
+    """
+    availability = uid_availability(
+        self.metagraph, self.config.neuron.vpermit_tao_limit
+    )
+    return sample_uids(availability.available, k, exclude)
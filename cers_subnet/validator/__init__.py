@@ -15,4 +15,11 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 from . import reward
-from . import forward
\ No newline at end of file
+from . import forward
+from . import metrics
+from . import dataset
+from . import latency
+from . import scheduler
+from . import checkpoint
+from . import metagraph
+from . import sampler
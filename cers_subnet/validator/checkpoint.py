@@ -0,0 +1,197 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT of OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import io
+import os
+import time
+import struct
+import hashlib
+import threading
+import numpy as np
+import bittensor as bt
+from typing import Callable, Dict, Optional
+
+CHECKPOINT_FORMAT = 1
+_MAGIC = b"CERSCKPT"
+# Magic, format version, payload length and SHA-256 of the payload.
+_HEADER = struct.Struct("<8sIQ32s")
+
+
+def encode_checkpoint(state: Dict[str, np.ndarray]) -> bytes:
+    """Serializes arrays as an uncompressed .npz payload behind a versioned, checksummed header."""
+    buffer = io.BytesIO()
+    np.savez(buffer, **state)
+    payload = buffer.getvalue()
+    return (
+        _HEADER.pack(
+            _MAGIC,
+            CHECKPOINT_FORMAT,
+            len(payload),
+            hashlib.sha256(payload).digest(),
+        )
+        + payload
+    )
+
+
+def decode_checkpoint(data: bytes) -> Dict[str, np.ndarray]:
+    """
+    Parses a checkpoint written by `encode_checkpoint`.
+
+    Raises:
+        ValueError: If the data is truncated, corrupt or of an unknown format.
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("Checkpoint is truncated.")
+    magic, version, length, digest = _HEADER.unpack_from(data)
+    if magic != _MAGIC:
+        raise ValueError("Not a checkpoint file.")
+    if version != CHECKPOINT_FORMAT:
+        raise ValueError(f"Unsupported checkpoint format {version}.")
+    payload = data[_HEADER.size :]
+    if len(payload) != length or hashlib.sha256(payload).digest() != digest:
+        raise ValueError("Checkpoint does not match its checksum.")
+    with np.load(io.BytesIO(payload), allow_pickle=False) as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+
+class Checkpointer:
+    """
+    Writes validator state to disk in a background thread, atomically, and reads back the newest good copy.
+
+    `maybe_save` is cheap to call every step: it only takes a snapshot when the state has
+    changed and at least `interval` seconds have passed since the last write. Writing goes
+    to a temporary file that is fsynced and renamed over `<name>.ckpt`; the checkpoint it
+    replaces is kept as `<name>.ckpt.prev`. `load` verifies the checksum and falls back to
+    the previous checkpoint if the newest one is damaged.
+    """
+
+    def __init__(
+        self, directory: str, name: str = "state", interval: float = 60.0
+    ):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{name}.ckpt")
+        self.previous_path = self.path + ".prev"
+        self.interval = interval
+        self.saved_version: Optional[int] = None
+        self.last_saved = 0.0
+        self.error: Optional[str] = None
+        self._pending: Optional[Dict[str, np.ndarray]] = None
+        self._pending_version: Optional[int] = None
+        self._condition = threading.Condition()
+        self._writing = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def maybe_save(
+        self,
+        version: int,
+        snapshot: Callable[[], Dict[str, np.ndarray]],
+        force: bool = False,
+    ) -> bool:
+        """
+        Queues a checkpoint of `snapshot()` if `version` is new and the interval has passed.
+
+        Args:
+            version (int): A counter the caller bumps whenever the state changes.
+            snapshot (Callable[[], Dict[str, np.ndarray]]): Returns copies of the arrays to save.
+            force (bool): Ignore the interval, e.g. on shutdown.
+
+        Returns:
+            bool: Whether a checkpoint was queued.
+        """
+        with self._condition:
+            if version in (self.saved_version, self._pending_version):
+                return False
+            if (
+                not force
+                and time.monotonic() - self.last_saved < self.interval
+            ):
+                return False
+            # A newer snapshot replaces one that has not been written yet.
+            self._pending, self._pending_version = snapshot(), version
+            self.last_saved = time.monotonic()
+            self._condition.notify_all()
+            return True
+
+    def _write_loop(self) -> None:
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closed:
+                    self._condition.wait()
+                if self._pending is None:
+                    return
+                state, version = self._pending, self._pending_version
+                self._pending, self._pending_version = None, None
+                self._writing = True
+            try:
+                self._write(encode_checkpoint(state))
+                self.saved_version, self.error = version, None
+            except Exception as e:
+                self.error = str(e)
+                bt.logging.error(
+                    f"Failed to write checkpoint {self.path}: {e}"
+                )
+            finally:
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+
+    def _write(self, data: bytes) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(self.path):
+            os.replace(self.path, self.previous_path)
+        os.replace(tmp_path, self.path)
+        directory = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits until queued checkpoints are written; returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._pending is None and not self._writing, timeout
+            )
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def load(self) -> Optional[Dict[str, np.ndarray]]:
+        """Returns the newest checkpoint that passes its checksum, or None if there is none."""
+        for path in (self.path, self.previous_path):
+            try:
+                with open(path, "rb") as f:
+                    state = decode_checkpoint(f.read())
+            except FileNotFoundError:
+                continue
+            except (ValueError, OSError) as e:
+                bt.logging.warning(f"Ignoring damaged checkpoint {path}: {e}")
+                continue
+            bt.logging.info(f"Loaded checkpoint {path}.")
+            return state
+        return None
@@ -0,0 +1,268 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT of OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import csv
+import json
+import array
+import shutil
+import numpy as np
+import bittensor as bt
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+DATASET_FORMAT = 1
+
+
+def _iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _iter_parquet(path: str) -> Iterator[Dict[str, Any]]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "Reading Parquet benchmarks requires pyarrow: pip install pyarrow"
+        ) from e
+    for batch in pq.ParquetFile(path).iter_batches():
+        yield from batch.to_pylist()
+
+
+def _iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    return (
+        _iter_parquet(path) if path.endswith(".parquet") else _iter_jsonl(path)
+    )
+
+
+def _read_qrels(path: str) -> Dict[str, List[str]]:
+    """Reads a BEIR-style `query-id<TAB>corpus-id<TAB>score` file; rows with score 0 are not relevant."""
+    qrels: Dict[str, List[str]] = {}
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.reader(f, delimiter="\t"):
+            if len(row) < 2 or row[0] == "query-id":
+                continue
+            if len(row) < 3 or float(row[2]) > 0:
+                qrels.setdefault(row[0], []).append(row[1])
+    return qrels
+
+
+def iter_benchmark(
+    path: str, qrels: Optional[str] = None
+) -> Iterator[Tuple[str, List[str]]]:
+    """
+    Yields (query, relevant document ids) from a benchmark file.
+
+    Without `qrels`, every record has `query` and `relevant_docs` fields. With `qrels`, the
+    records are BEIR queries with `_id` and `text`, and the relevant documents come from
+    the qrels file; queries without any relevant document are skipped.
+    """
+    judgements = _read_qrels(qrels) if qrels is not None else None
+    for record in _iter_records(path):
+        if judgements is None:
+            yield record["query"], [
+                str(doc_id) for doc_id in record["relevant_docs"]
+            ]
+        elif str(record["_id"]) in judgements:
+            yield record["text"], judgements[str(record["_id"])]
+
+
+class _StringWriter:
+    """Appends UTF-8 strings to one file and records where each starts."""
+
+    def __init__(self, path: str):
+        self.file = open(path, "wb")
+        self.offsets = array.array("q", [0])
+
+    def append(self, value: str) -> None:
+        self.offsets.append(
+            self.offsets[-1] + self.file.write(value.encode("utf-8"))
+        )
+
+    def close(self, offsets_path: str) -> None:
+        self.file.close()
+        np.save(offsets_path, np.frombuffer(self.offsets, dtype=np.int64))
+
+
+class _Strings:
+    """Random access to strings stored by `_StringWriter`, without loading them."""
+
+    def __init__(self, path: str, offsets_path: str):
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        self.data = (
+            np.memmap(path, dtype=np.uint8, mode="r")
+            if self.offsets[-1]
+            else np.zeros(0, dtype=np.uint8)
+        )
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return (
+            self.data[self.offsets[i] : self.offsets[i + 1]]
+            .tobytes()
+            .decode("utf-8")
+        )
+
+
+class BenchmarkDataset:
+    """
+    Benchmark queries and their relevant documents, stored in a compact, memory-mapped form.
+
+    Query texts and document ids are concatenated into one byte file each, addressed by an
+    offsets array. Document ids are interned, and the relevant documents of query `i` are
+    `keys[indptr[i]:indptr[i + 1]]` (compressed sparse rows). Opening a dataset only maps
+    these files, so a benchmark with millions of queries loads instantly, and `dataset[i]`
+    decodes just one query.
+
+    `dataset[i]` returns `{"query": ..., "relevant_docs": [...]}`, so the dataset can be used
+    like the list of dicts the validator's forward pass samples from.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(
+            os.path.join(directory, "manifest.json"), "r", encoding="utf-8"
+        ) as f:
+            self.manifest = json.load(f)
+        self.queries = _Strings(
+            os.path.join(directory, "queries.bin"),
+            os.path.join(directory, "query_offsets.npy"),
+        )
+        self.doc_ids = _Strings(
+            os.path.join(directory, "doc_ids.bin"),
+            os.path.join(directory, "doc_offsets.npy"),
+        )
+        self.indptr = np.load(
+            os.path.join(directory, "indptr.npy"), mmap_mode="r"
+        )
+        self.keys = np.load(os.path.join(directory, "keys.npy"), mmap_mode="r")
+
+    @staticmethod
+    def _source(path: Optional[str]) -> Optional[Dict[str, Any]]:
+        if path is None:
+            return None
+        stat = os.stat(path)
+        return {
+            "path": os.path.abspath(path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+        }
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        qrels: Optional[str] = None,
+        directory: Optional[str] = None,
+    ) -> "BenchmarkDataset":
+        """
+        Opens the compiled form of a benchmark file, compiling it first if it is missing or outdated.
+
+        Args:
+            path (str): A JSONL or Parquet benchmark file.
+            qrels (Optional[str]): A BEIR qrels file when `path` holds BEIR queries.
+            directory (Optional[str]): Where to keep the compiled form; defaults to `<path>.index`.
+        """
+        directory = directory or path + ".index"
+        sources = {"benchmark": cls._source(path), "qrels": cls._source(qrels)}
+        try:
+            dataset = cls(directory)
+            if (
+                dataset.manifest.get("format") == DATASET_FORMAT
+                and dataset.manifest.get("sources") == sources
+            ):
+                return dataset
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        cls.compile(iter_benchmark(path, qrels), directory, sources)
+        return cls(directory)
+
+    @staticmethod
+    def compile(
+        rows, directory: str, sources: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """Writes (query, relevant ids) rows in the compiled form; the directory is replaced atomically."""
+        tmp_directory = directory.rstrip("/") + ".tmp"
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        os.makedirs(tmp_directory)
+        queries = _StringWriter(os.path.join(tmp_directory, "queries.bin"))
+        doc_ids = _StringWriter(os.path.join(tmp_directory, "doc_ids.bin"))
+        vocabulary: Dict[str, int] = {}
+        indptr, keys = array.array("q", [0]), array.array("i")
+        for query, relevant in rows:
+            queries.append(query)
+            for doc_id in dict.fromkeys(relevant):
+                key = vocabulary.get(doc_id)
+                if key is None:
+                    key = vocabulary[doc_id] = len(vocabulary)
+                    doc_ids.append(doc_id)
+                keys.append(key)
+            indptr.append(len(keys))
+        queries.close(os.path.join(tmp_directory, "query_offsets.npy"))
+        doc_ids.close(os.path.join(tmp_directory, "doc_offsets.npy"))
+        np.save(
+            os.path.join(tmp_directory, "indptr.npy"),
+            np.frombuffer(indptr, dtype=np.int64),
+        )
+        np.save(
+            os.path.join(tmp_directory, "keys.npy"),
+            np.frombuffer(keys, dtype=np.int32),
+        )
+        manifest = {
+            "format": DATASET_FORMAT,
+            "sources": sources,
+            "queries": len(indptr) - 1,
+            "documents": len(vocabulary),
+        }
+        with open(
+            os.path.join(tmp_directory, "manifest.json"), "w", encoding="utf-8"
+        ) as f:
+            json.dump(manifest, f)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_directory, directory)
+        bt.logging.info(
+            f"Compiled a benchmark of {manifest['queries']} queries over {manifest['documents']} relevant documents."
+        )
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    def query(self, i: int) -> str:
+        return self.queries[i]
+
+    def relevant_keys(self, i: int) -> np.ndarray:
+        return np.asarray(self.keys[self.indptr[i] : self.indptr[i + 1]])
+
+    def relevant(self, i: int) -> List[str]:
+        return [self.doc_ids[key] for key in self.relevant_keys(i)]
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("benchmark query index out of range")
+        return {"query": self.query(i), "relevant_docs": self.relevant(i)}
+
+    def sample(
+        self, size: int, rng: Optional[np.random.Generator] = None
+    ) -> np.ndarray:
+        """Indices of `size` random queries."""
+        return (rng or np.random.default_rng()).integers(0, len(self), size)
@@ -18,9 +18,9 @@
 import bittensor as bt
 import random
 
-from cers_subnet.protocol import EnterpriseRAG
-from cers_subnet.validator.reward import get_rewards
-from cers_subnet.utils.uids import get_random_uids
+from cers_subnet.protocol import EnterpriseRAG, EnterpriseRAGBatch
+from cers_subnet.validator.reward import get_batch_rewards, get_rewards, process_times
+from cers_subnet.utils.uids import uid_availability
 
 
 async def forward(self):
@@ -28,32 +28,54 @@ async def forward(self):
     The forward pass queries the network and scores the responses.
     """
 
-    miner_uids = get_random_uids(self, k=self.config.neuron.sample_size)
-
     # The validator should have a benchmark dataset of queries and their expected results.
     # This should be loaded in the validator's __init__ method.
     if not self.benchmark_dataset:
         bt.logging.error("No benchmark dataset loaded. Cannot proceed with forward pass.")
         return
 
-    # Select a random query and its ground truth from the dataset
-    benchmark_item = random.choice(self.benchmark_dataset)
-    query_text = benchmark_item['query']
-    expected_doc_ids = set(benchmark_item['relevant_docs']) # Use a set for efficient lookups
+    availability = uid_availability(self.metagraph, self.config.neuron.vpermit_tao_limit)
+    miner_uids = self.uid_sampler.sample(availability.available, k=self.config.neuron.sample_size)
+
+    # With `validator.batch_queries` above 1, several benchmark queries share one request.
+    batch_queries = self.config.get('validator.batch_queries', 1)
+    if batch_queries > 1:
+        items = [self.benchmark_dataset[int(i)] for i in self.benchmark_dataset.sample(batch_queries)]
+        expected_doc_ids = [set(item['relevant_docs']) for item in items]
+        synapse = EnterpriseRAGBatch(
+            queries=[item['query'] for item in items],
+            k=[self.config.get('validator.reward_k', 10)] * len(items),
+        )
+        bt.logging.info(f"Sending a batch of {len(items)} queries to miners: {miner_uids}")
+    else:
+        # Select a random query and its ground truth from the dataset
+        benchmark_item = random.choice(self.benchmark_dataset)
+        query_text = benchmark_item['query']
+        expected_doc_ids = set(benchmark_item['relevant_docs']) # Use a set for efficient lookups
+        synapse = EnterpriseRAG(query=query_text)
 
-    bt.logging.info(f"Sending query: '{query_text}' to miners: {miner_uids}")
-    bt.logging.info(f"Expected document IDs: {expected_doc_ids}")
+        bt.logging.info(f"Sending query: '{query_text}' to miners: {miner_uids}")
+        bt.logging.info(f"Expected document IDs: {expected_doc_ids}")
 
     # The dendrite client queries the network.
     responses = await self.dendrite(
         axons=[self.metagraph.axons[uid] for uid in miner_uids],
-        synapse=EnterpriseRAG(query=query_text),
+        synapse=synapse,
         deserialize=False, # We need the full synapse object for scoring
         timeout=self.config.neuron.timeout, # Add a timeout for robustness
     )
 
     # The reward function now needs the expected IDs to score responses.
-    rewards = get_rewards(self, expected_doc_ids=expected_doc_ids, responses=responses)
+    if batch_queries > 1:
+        rewards = get_batch_rewards(self, expected_doc_ids=expected_doc_ids, responses=responses)
+    else:
+        rewards = get_rewards(self, expected_doc_ids=expected_doc_ids, responses=responses)
 
     bt.logging.info(f"Scored responses: {rewards}")
-    self.update_scores(rewards, miner_uids)
\ No newline at end of file
+    self.update_scores(rewards, miner_uids)
+    self.uid_sampler.observe(miner_uids, rewards)
+    # The metagraph resync resets and resizes the latency statistics from a worker thread.
+    with self.scores_lock:
+        self.latency_stats.update(miner_uids, process_times(responses))
+        latencies = self.latency_stats.summary(miner_uids)
+    bt.logging.debug(f"Miner latencies: {latencies}")
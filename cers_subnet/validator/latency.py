@@ -0,0 +1,163 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT of OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+from typing import Dict, Sequence
+
+
+def latency_scores(
+    process_times: np.ndarray,
+    eligible: np.ndarray,
+    timeout: float,
+    mode: str = "rank",
+    exponent: float = 2.0,
+) -> np.ndarray:
+    """
+    Scores response latencies between 0 (slowest) and 1 (fastest).
+
+    Args:
+        process_times (np.ndarray): Seconds each miner took; NaN for failed responses.
+        eligible (np.ndarray): Responses that take part in the ranking, e.g. those with a relevant document.
+        timeout (float): The request timeout.
+        mode (str): `rank` ranks the eligible responses of the step from fastest to slowest;
+            `timeout` scores each response by `1 - (time / timeout) ** exponent`.
+        exponent (float): Shape of the `timeout` curve; larger values are more lenient.
+
+    Returns:
+        np.ndarray: One score per response; ineligible or failed responses score 0.
+    """
+    times = np.asarray(process_times, dtype=np.float64)
+    eligible = np.asarray(eligible, dtype=bool) & np.isfinite(times)
+    scores = np.zeros(times.shape, dtype=np.float32)
+    if mode == "timeout":
+        curve = 1.0 - np.clip(times / timeout, 0.0, 1.0) ** exponent
+        scores[eligible] = curve[eligible]
+    elif mode == "rank":
+        n = int(eligible.sum())
+        if n == 1:
+            scores[eligible] = 1.0
+        elif n > 1:
+            subset = times[eligible]
+            # Average the ranks of ties so equally fast miners score the same.
+            order = subset.argsort(kind="stable")
+            ranks = np.empty(n, dtype=np.float64)
+            ranks[order] = np.arange(n)
+            _, inverse = np.unique(subset, return_inverse=True)
+            ranks = np.bincount(inverse, weights=ranks) / np.bincount(inverse)
+            scores[eligible] = 1.0 - ranks[inverse] / (n - 1)
+    else:
+        raise ValueError(
+            f"Unknown latency mode {mode!r}; expected 'rank' or 'timeout'."
+        )
+    return scores
+
+
+class LatencyStats:
+    """
+    Exponential moving averages of each miner's response time, indexed by UID.
+
+    Only successful responses are recorded; `failures` counts the others. The arrays grow
+    with the metagraph and a UID's statistics are reset when its hotkey is replaced.
+    """
+
+    def __init__(self, alpha: float = 0.1):
+        self.alpha = alpha
+        self.mean = np.full(0, np.nan, dtype=np.float32)
+        self.mean_square = np.full(0, np.nan, dtype=np.float32)
+        self.responses = np.zeros(0, dtype=np.int64)
+        self.failures = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.mean)
+
+    def resize(self, n: int) -> None:
+        if n <= len(self):
+            return
+        grow = n - len(self)
+        self.mean = np.concatenate(
+            [self.mean, np.full(grow, np.nan, dtype=np.float32)]
+        )
+        self.mean_square = np.concatenate(
+            [self.mean_square, np.full(grow, np.nan, dtype=np.float32)]
+        )
+        self.responses = np.concatenate(
+            [self.responses, np.zeros(grow, dtype=np.int64)]
+        )
+        self.failures = np.concatenate(
+            [self.failures, np.zeros(grow, dtype=np.int64)]
+        )
+
+    def reset(self, uids: Sequence[int]) -> None:
+        uids = np.asarray(uids, dtype=np.int64)
+        uids = uids[uids < len(self)]
+        self.mean[uids] = np.nan
+        self.mean_square[uids] = np.nan
+        self.responses[uids] = 0
+        self.failures[uids] = 0
+
+    def update(self, uids: Sequence[int], process_times: np.ndarray) -> None:
+        """Records one step's response times; NaN marks a failed response."""
+        uids = np.asarray(uids, dtype=np.int64)
+        times = np.asarray(process_times, dtype=np.float32)
+        if uids.size:
+            self.resize(int(uids.max()) + 1)
+        ok = np.isfinite(times)
+        self.failures[uids[~ok]] += 1
+        uids, times = uids[ok], times[ok]
+        self.responses[uids] += 1
+        first = np.isnan(self.mean[uids])
+        mean, square = self.mean[uids], self.mean_square[uids]
+        self.mean[uids] = np.where(
+            first, times, self.alpha * times + (1 - self.alpha) * mean
+        )
+        self.mean_square[uids] = np.where(
+            first,
+            times**2,
+            self.alpha * times**2 + (1 - self.alpha) * square,
+        )
+
+    def std(self) -> np.ndarray:
+        return np.sqrt(np.maximum(self.mean_square - self.mean**2, 0.0))
+
+    def summary(self, uids: Sequence[int]) -> Dict[int, Dict[str, float]]:
+        std = self.std()
+        return {
+            int(uid): {
+                "mean": float(self.mean[uid]),
+                "std": float(std[uid]),
+                "responses": int(self.responses[uid]),
+                "failures": int(self.failures[uid]),
+            }
+            for uid in uids
+            if uid < len(self)
+        }
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {
+            "latency_mean": self.mean,
+            "latency_mean_square": self.mean_square,
+            "latency_responses": self.responses,
+            "latency_failures": self.failures,
+        }
+
+    def load(self, state) -> None:
+        self.mean = np.asarray(state["latency_mean"], dtype=np.float32)
+        self.mean_square = np.asarray(
+            state["latency_mean_square"], dtype=np.float32
+        )
+        self.responses = np.asarray(state["latency_responses"], dtype=np.int64)
+        self.failures = np.asarray(state["latency_failures"], dtype=np.int64)
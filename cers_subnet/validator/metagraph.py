@@ -0,0 +1,114 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT of OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+from typing import NamedTuple, Sequence
+
+_PRIME = np.uint64(0x100000001B3)
+_SEED = np.uint64(0xCBF29CE484222325)
+
+
+def _mix(h: np.ndarray) -> np.ndarray:
+    """The splitmix64 finalizer, so that every input bit affects every output bit."""
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def _hash_strings(values: Sequence[str]) -> np.ndarray:
+    """64-bit hashes of strings, computed a column of 8 bytes at a time across all of them."""
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    encoded = np.char.encode(np.asarray(values, dtype=str), "utf-8")
+    width = encoded.dtype.itemsize
+    data = np.zeros((len(encoded), -(-width // 8) * 8), dtype=np.uint8)
+    data[:, :width] = encoded.view(np.uint8).reshape(len(encoded), width)
+    # Shorter strings are padded with NULs, which numpy strips from strings anyway.
+    h = np.full(len(encoded), _SEED, dtype=np.uint64)
+    for word in data.view("<u8").T:
+        h = _mix((h ^ word) * _PRIME)
+    return h
+
+
+def _hash_endpoints(axons: Sequence) -> np.ndarray:
+    ips = _hash_strings([axon.ip for axon in axons])
+    ports = np.fromiter(
+        (axon.port for axon in axons), dtype=np.uint64, count=len(axons)
+    )
+    ip_types = np.fromiter(
+        (axon.ip_type for axon in axons), dtype=np.uint64, count=len(axons)
+    )
+    protocols = np.fromiter(
+        (axon.protocol for axon in axons), dtype=np.uint64, count=len(axons)
+    )
+    fields = (ports << np.uint64(16)) | (ip_types << np.uint64(8)) | protocols
+    return _mix((ips ^ fields) * _PRIME)
+
+
+class MetagraphFingerprint(NamedTuple):
+    """
+    64-bit hashes of each UID's hotkey and axon endpoint.
+
+    The hashing runs on whole arrays; only reading the axon fields off the metagraph's
+    objects is a Python loop per UID.
+    """
+
+    hotkeys: np.ndarray
+    endpoints: np.ndarray
+
+    @classmethod
+    def of(
+        cls, hotkeys: Sequence[str], axons: Sequence
+    ) -> "MetagraphFingerprint":
+        return cls(_hash_strings(hotkeys), _hash_endpoints(axons))
+
+    @classmethod
+    def from_metagraph(cls, metagraph) -> "MetagraphFingerprint":
+        return cls.of(metagraph.hotkeys, metagraph.axons)
+
+    def __len__(self) -> int:
+        return len(self.hotkeys)
+
+
+class MetagraphDiff(NamedTuple):
+    """UIDs whose hotkey changed, that are new, or whose hotkey kept its UID but moved to another endpoint."""
+
+    replaced: np.ndarray
+    added: np.ndarray
+    moved: np.ndarray
+    size: int
+
+    @property
+    def empty(self) -> bool:
+        return not (self.replaced.size or self.added.size or self.moved.size)
+
+
+def diff_metagraph(
+    previous: MetagraphFingerprint, current: MetagraphFingerprint
+) -> MetagraphDiff:
+    """Compares two fingerprints UID by UID."""
+    common = min(len(previous), len(current))
+    same_hotkey = previous.hotkeys[:common] == current.hotkeys[:common]
+    return MetagraphDiff(
+        replaced=np.flatnonzero(~same_hotkey),
+        added=np.arange(common, len(current)),
+        moved=np.flatnonzero(
+            same_hotkey
+            & (previous.endpoints[:common] != current.endpoints[:common])
+        ),
+        size=len(current),
+    )
@@ -0,0 +1,206 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT of OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import numpy as np
+from typing import Dict, Iterable, NamedTuple, Optional, Sequence
+
+# Padding for ranks a response did not fill, and the key of returned ids that are relevant to no query.
+PAD = -1
+UNKNOWN = -2
+
+
+class Metrics(NamedTuple):
+    """Retrieval metrics with one row per query and one column per miner."""
+
+    mrr: np.ndarray
+    recall: np.ndarray
+    precision: np.ndarray
+    ndcg: np.ndarray
+
+
+class RelevanceTable:
+    """
+    Relevance judgements in compressed sparse row form over interned document ids.
+
+    `keys[indptr[q]:indptr[q + 1]]` are the keys of the documents relevant to query `q`,
+    and `vocabulary` maps document ids to keys.
+    """
+
+    def __init__(
+        self, vocabulary: Dict[str, int], indptr: np.ndarray, keys: np.ndarray
+    ):
+        self.vocabulary = vocabulary
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.keys = np.asarray(keys, dtype=np.int32)
+
+    @classmethod
+    def from_sets(cls, relevant: Sequence[Iterable[str]]) -> "RelevanceTable":
+        """Interns the relevant ids of each query."""
+        vocabulary: Dict[str, int] = {}
+        keys, indptr = [], [0]
+        for doc_ids in relevant:
+            query_keys = {
+                vocabulary.setdefault(doc_id, len(vocabulary))
+                for doc_id in doc_ids
+            }
+            keys.extend(sorted(query_keys))
+            indptr.append(len(keys))
+        return cls(vocabulary, np.asarray(indptr), np.asarray(keys))
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    def counts(self) -> np.ndarray:
+        """Number of relevant documents per query."""
+        return np.diff(self.indptr)
+
+    def intern(
+        self,
+        responses: Sequence[Sequence[Optional[Sequence[str]]]],
+        depth: int,
+    ) -> np.ndarray:
+        """
+        Maps the ranked ids returned for each query and miner to a padded (queries, miners, depth) key matrix.
+
+        Missing responses and ranks past the end of a response are `PAD`; ids that are not
+        relevant to any query are `UNKNOWN`. Ranks past `depth` are ignored.
+        """
+        miners = max((len(row) for row in responses), default=0)
+        ranked = np.full((len(responses), miners, depth), PAD, dtype=np.int32)
+        get = self.vocabulary.get
+        for q, row in enumerate(responses):
+            for m, doc_ids in enumerate(row):
+                if doc_ids:
+                    doc_ids = doc_ids[:depth]
+                    ranked[q, m, : len(doc_ids)] = [
+                        get(doc_id, UNKNOWN) for doc_id in doc_ids
+                    ]
+        return ranked
+
+
+def relevance_hits(
+    table: RelevanceTable,
+    ranked: np.ndarray,
+    queries: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Marks the ranks of `ranked` that hold a document relevant to their query.
+
+    Each (query, key) pair is encoded as one int64 so a single `np.isin` checks every rank of
+    every miner for every query. A document returned twice by one miner only counts once.
+
+    Args:
+        table (RelevanceTable): The relevance judgements.
+        ranked (np.ndarray): (queries, miners, depth) keys from `RelevanceTable.intern`.
+        queries (Optional[np.ndarray]): Row of `table` for each query of `ranked`; defaults to all rows in order.
+
+    Returns:
+        np.ndarray: A (queries, miners, depth) boolean array.
+    """
+    n_queries, n_miners, depth = ranked.shape
+    if queries is None:
+        queries = np.arange(n_queries)
+    queries = np.asarray(queries, dtype=np.int64)
+    stride = np.int64(max(len(table.vocabulary), 1))
+    counts = table.counts()[queries]
+    # The relevant (query, key) pairs of the batch.
+    starts = np.repeat(table.indptr[queries], counts)
+    offsets = np.arange(counts.sum()) - np.repeat(
+        np.cumsum(counts) - counts, counts
+    )
+    relevant = (
+        np.repeat(np.arange(n_queries, dtype=np.int64), counts) * stride
+        + table.keys[starts + offsets]
+    )
+    codes = (
+        np.arange(n_queries, dtype=np.int64)[:, None, None] * stride + ranked
+    )
+    hits = (ranked >= 0) & np.isin(codes, relevant)
+
+    # Drop repeats of a document within one response: keep each (query, miner, key) once.
+    flat = hits.reshape(-1, depth)
+    rows, ranks = np.nonzero(flat)
+    if rows.size:
+        pair = (
+            rows.astype(np.int64) * stride
+            + ranked.reshape(-1, depth)[rows, ranks]
+        )
+        _, first = np.unique(pair, return_index=True)
+        deduplicated = np.zeros_like(flat)
+        deduplicated[rows[first], ranks[first]] = True
+        hits = deduplicated.reshape(hits.shape)
+    return hits
+
+
+def compute_metrics(
+    hits: np.ndarray, relevant_counts: np.ndarray, k: int
+) -> Metrics:
+    """
+    Computes MRR, recall@k, precision@k and nDCG@k with binary relevance for every query and miner.
+
+    Args:
+        hits (np.ndarray): (queries, miners, depth) booleans from `relevance_hits`.
+        relevant_counts (np.ndarray): Number of relevant documents per query.
+        k (int): Cut-off for recall, precision and nDCG. MRR uses the full depth.
+    """
+    depth = hits.shape[-1]
+    counts = np.asarray(relevant_counts, dtype=np.float32)[:, None]
+    first = hits.argmax(axis=-1)
+    mrr = np.where(hits.any(axis=-1), 1.0 / (first + 1), 0.0).astype(
+        np.float32
+    )
+
+    top = hits[..., :k]
+    found = top.sum(axis=-1, dtype=np.float32)
+    recall = np.divide(
+        found, counts, out=np.zeros_like(found), where=counts > 0
+    )
+    precision = found / np.float32(k)
+
+    discounts = (1.0 / np.log2(np.arange(2, max(k, depth) + 2))).astype(
+        np.float32
+    )
+    dcg = (top * discounts[: top.shape[-1]]).sum(axis=-1, dtype=np.float32)
+    ideal_cumulative = np.concatenate(
+        [[0.0], np.cumsum(discounts[:k])]
+    ).astype(np.float32)
+    idcg = ideal_cumulative[np.minimum(counts, k).astype(np.int64)]
+    ndcg = np.divide(dcg, idcg, out=np.zeros_like(dcg), where=idcg > 0)
+    return Metrics(mrr, recall, precision, ndcg)
+
+
+def score_batch(
+    responses: Sequence[Sequence[Optional[Sequence[str]]]],
+    relevant: Sequence[Iterable[str]],
+    k: int = 10,
+    depth: Optional[int] = None,
+) -> Metrics:
+    """
+    Scores the ranked ids every miner returned for every query of a batch.
+
+    Args:
+        responses: For each query, the ranked document ids of each miner, or None for a failed response.
+        relevant: For each query, the ids of the relevant documents.
+        k (int): Cut-off for recall, precision and nDCG.
+        depth (Optional[int]): Number of ranks considered for MRR; defaults to `k`.
+
+    Returns:
+        Metrics: (queries, miners) arrays.
+    """
+    table = RelevanceTable.from_sets(relevant)
+    ranked = table.intern(responses, depth or k)
+    return compute_metrics(relevance_hits(table, ranked), table.counts(), k)
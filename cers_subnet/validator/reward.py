@@ -15,51 +15,138 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT of OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
-import torch
+import numpy as np
 import bittensor as bt
-from typing import List, Set
+from typing import List, Optional, Sequence, Set
+
+from cers_subnet.validator.latency import latency_scores
+from cers_subnet.validator.metrics import Metrics, score_batch
+
+
+def response_ids(response: bt.Synapse) -> Optional[List[str]]:
+    """The ranked document ids of a response, or None if the request failed."""
+    if not response.dendrite.is_success or not response.document_ids:
+        return None
+    return response.document_ids
+
+
+def batch_response_ids(response: bt.Synapse, query: int) -> Optional[List[str]]:
+    """The ranked document ids a batched response gave for one of its queries, or None."""
+    if not response.dendrite.is_success or query >= len(response.document_ids or []):
+        return None
+    return response.document_ids[query] or None
+
+
+def process_times(responses: Sequence[bt.Synapse]) -> np.ndarray:
+    """Seconds each miner took to answer; NaN for failed responses."""
+    return np.array(
+        [
+            response.dendrite.process_time
+            if response.dendrite.is_success and response.dendrite.process_time is not None
+            else np.nan
+            for response in responses
+        ],
+        dtype=np.float64,
+    )
+
+
+def score_responses(
+    self,
+    expected_doc_ids: Sequence[Set[str]],
+    responses: Sequence[Sequence[bt.Synapse]],
+) -> Metrics:
+    """
+    Computes the retrieval metrics of a batch of queries, each sent to the same miners.
+
+    Args:
+    - expected_doc_ids (Sequence[Set[str]]): The relevant document IDs of each query.
+    - responses (Sequence[Sequence[bt.Synapse]]): For each query, the responses of the miners.
+
+    Returns:
+    - Metrics: (queries, miners) arrays of MRR, recall@k, precision@k and nDCG@k.
+    """
+    # MRR looks at up to `validator.reward_depth` ranks; the other metrics at the top `validator.reward_k`.
+    return score_batch(
+        [[response_ids(response) for response in row] for row in responses],
+        expected_doc_ids,
+        k=self.config.get('validator.reward_k', 10),
+        depth=self.config.get('validator.reward_depth', 100),
+    )
+
 
 def get_rewards(
     self,
     expected_doc_ids: Set[str],
     responses: List[bt.Synapse],
-) -> torch.FloatTensor:
+) -> np.ndarray:
     """
-    Returns a tensor of rewards for the given query and responses.
+    Returns an array of rewards for the given query and responses.
+
+    The retrieval quality is the metric named by `validator.reward_metric`, by default the
+    Mean Reciprocal Rank: 1/rank of the first relevant document, or 0 if none was returned.
+    A share `validator.latency_weight` of it depends on how fast the miner answered
+    (see `latency_scores`), so a fast miner earns more, and a fast but wrong one still earns nothing.
 
     Args:
     - expected_doc_ids (Set[str]): A set of relevant document IDs for the query.
     - responses (List[bt.Synapse]): A list of responses from the miner synapses.
 
     Returns:
-    - torch.FloatTensor: A tensor of rewards for the responses.
+    - np.ndarray: An array of rewards for the responses.
     """
-    # Get the scores for the responses.
-    scores = torch.FloatTensor(
-        [
-            score_response(response, expected_doc_ids)
-            for response in responses
-        ]
-    ).to(self.device)
-    return scores
+    metrics = score_responses(self, [expected_doc_ids], [responses])
+    log_metrics(metrics)
+    quality = getattr(metrics, self.config.get('validator.reward_metric', 'mrr'))[0]
+    return apply_latency(self, quality, responses)
+
 
-def score_response(response: bt.Synapse, expected_doc_ids: Set[str]) -> float:
+def get_batch_rewards(
+    self,
+    expected_doc_ids: Sequence[Set[str]],
+    responses: List[bt.Synapse],
+) -> np.ndarray:
     """
-    Scores a single response based on the Mean Reciprocal Rank (MRR) of the returned document IDs.
-    The score is 1/rank of the first relevant document found.
+    Returns an array of rewards for responses to an `EnterpriseRAGBatch` of queries.
+
+    All queries and miners are scored in one `score_batch` call. A miner's quality is its
+    `validator.reward_metric` averaged over the queries, blended with its latency for the
+    whole batch as in `get_rewards`.
+
+    Args:
+    - expected_doc_ids (Sequence[Set[str]]): The relevant document IDs of each query in the batch.
+    - responses (List[bt.Synapse]): A list of responses from the miner synapses.
+
+    Returns:
+    - np.ndarray: An array of rewards for the responses.
     """
-    # Penalize responses that are not successful or have no document_ids
-    if not response.dendrite.is_success or not response.document_ids:
-        return 0.0
-
-    # Find the rank of the first relevant document.
-    for i, doc_id in enumerate(response.document_ids):
-        if doc_id in expected_doc_ids:
-            # Rank is i + 1. MRR score is 1 / rank.
-            mrr_score = 1.0 / (i + 1)
-            bt.logging.trace(f"Scored response for hotkey {response.axon.hotkey}: {mrr_score} (found relevant doc at rank {i+1})")
-            return mrr_score
-            
-    # No relevant documents found in the response.
-    bt.logging.trace(f"Scored response for hotkey {response.axon.hotkey}: 0.0 (no relevant docs found)")
-    return 0.0
\ No newline at end of file
+    metrics = score_batch(
+        [[batch_response_ids(response, query) for response in responses] for query in range(len(expected_doc_ids))],
+        expected_doc_ids,
+        k=self.config.get('validator.reward_k', 10),
+        depth=self.config.get('validator.reward_depth', 100),
+    )
+    log_metrics(metrics)
+    quality = getattr(metrics, self.config.get('validator.reward_metric', 'mrr')).mean(axis=0)
+    return apply_latency(self, quality, responses)
+
+
+def log_metrics(metrics: Metrics) -> None:
+    bt.logging.debug(
+        "Mean metrics: "
+        + ", ".join(f"{name}={values.mean():.3f}" for name, values in metrics._asdict().items() if values.size)
+    )
+
+
+def apply_latency(self, quality: np.ndarray, responses: Sequence[bt.Synapse]) -> np.ndarray:
+    """Blends each miner's speed into its quality with weight `validator.latency_weight`."""
+    weight = self.config.get('validator.latency_weight', 0.2)
+    if not weight:
+        return quality
+    speed = latency_scores(
+        process_times(responses),
+        eligible=quality > 0,
+        timeout=self.config.neuron.timeout,
+        mode=self.config.get('validator.latency_mode', 'rank'),
+        exponent=self.config.get('validator.latency_exponent', 2.0),
+    )
+    return quality * ((1.0 - weight) + weight * speed)
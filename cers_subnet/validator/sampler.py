@@ -0,0 +1,255 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT of OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import collections
+import math
+import bittensor as bt
+import numpy as np
+from typing import Dict, Iterable, Optional, Sequence
+
+
+class CoverageSampler:
+    """
+    Chooses which miners to query by walking shuffled permutations of the available UIDs.
+
+    Every available miner is queried once per cycle before any is queried again, so each
+    miner's moving average gets updates at the same rate. UIDs passed to `prioritize`, such
+    as new hotkeys found by a resync, are queried in the next forward.
+    """
+
+    def __init__(self, rng: Optional[np.random.Generator] = None):
+        self.rng = rng or np.random.default_rng()
+        # Queries per UID since its hotkey registered.
+        self.counts = np.zeros(0, dtype=np.int64)
+        # UIDs queried in the current cycle.
+        self.queried = np.zeros(0, dtype=bool)
+        # The rest of the current cycle's permutation.
+        self.pending = np.zeros(0, dtype=np.int64)
+        self.priority = collections.deque()
+        self.cycle = 0
+        self.cycle_forwards = 0
+
+    def resize(self, n: int):
+        if n > len(self.counts):
+            self.counts = np.concatenate(
+                [self.counts, np.zeros(n - len(self.counts), dtype=np.int64)]
+            )
+            self.queried = np.concatenate(
+                [self.queried, np.zeros(n - len(self.queried), dtype=bool)]
+            )
+
+    def prioritize(self, uids: Iterable[int]):
+        """Queries these UIDs next and restarts their query counts; called from the resync thread."""
+        self.priority.extend(int(uid) for uid in uids)
+
+    def forget(self, uid: int):
+        """Drops what was learned about a UID whose hotkey changed."""
+        self.counts[uid] = 0
+
+    def observe(self, uids: Sequence[int], rewards: np.ndarray):
+        """Called with each forward's rewards; coverage sampling does not use them."""
+
+    def sample(self, available: np.ndarray, k: int) -> np.ndarray:
+        """Returns up to k distinct UIDs where `available` is set."""
+        self.resize(len(available))
+        k = min(k, int(np.count_nonzero(available)))
+        chosen = []
+        while self.priority and len(chosen) < k:
+            uid = self.priority.popleft()
+            if uid < len(available) and available[uid] and uid not in chosen:
+                self.forget(uid)
+                self.queried[uid] = True
+                chosen.append(uid)
+        uids = np.asarray(chosen, dtype=np.int64)
+        if len(chosen) < k:
+            uids = np.concatenate(
+                [uids, self._next(available, k - len(chosen), uids)]
+            )
+        self.counts[uids] += 1
+        self.cycle_forwards += 1
+        return uids
+
+    def _next(
+        self, available: np.ndarray, k: int, chosen: np.ndarray
+    ) -> np.ndarray:
+        # UIDs that stopped serving, or that were prioritized, are skipped for the rest of the cycle.
+        pending = self.pending[self.pending < len(available)]
+        pending = pending[available[pending] & ~self.queried[pending]]
+        if pending.size >= k:
+            self.pending = pending[k:]
+            self.queried[pending[:k]] = True
+            return pending[:k]
+        # Finish this cycle and start the next, which visits this forward's UIDs last.
+        self._log_cycle(available)
+        self.queried[:] = False
+        fresh = available.copy()
+        fresh[pending] = False
+        fresh[chosen] = False
+        fresh = self.rng.permutation(np.flatnonzero(fresh))
+        rest = self.rng.permutation(np.concatenate([pending, chosen]))
+        take = k - pending.size
+        self.queried[fresh[:take]] = True
+        self.pending = np.concatenate([fresh[take:], rest])
+        return np.concatenate([pending, fresh[:take]])
+
+    def coverage(self, available: np.ndarray) -> Dict[str, float]:
+        """How evenly the available miners have been queried."""
+        counts = self.counts[: len(available)][available[: len(self.counts)]]
+        if counts.size == 0:
+            return {
+                "available": 0,
+                "never_queried": 0,
+                "min_queries": 0,
+                "mean_queries": 0.0,
+                "max_queries": 0,
+            }
+        return {
+            "available": int(counts.size),
+            "never_queried": int(np.count_nonzero(counts == 0)),
+            "min_queries": int(counts.min()),
+            "mean_queries": float(counts.mean()),
+            "max_queries": int(counts.max()),
+        }
+
+    def _log_cycle(self, available: np.ndarray):
+        if self.cycle_forwards:
+            covered = int(
+                np.count_nonzero(self.queried[: len(available)] & available)
+            )
+            bt.logging.info(
+                f"Sampling cycle {self.cycle} covered {covered} miners in {self.cycle_forwards} forwards: "
+                f"{self.coverage(available)}"
+            )
+        self.cycle += 1
+        self.cycle_forwards = 0
+
+
+class UncertaintySampler(CoverageSampler):
+    """
+    Spends most queries on the miners whose scores are least certain.
+
+    Each miner's reward mean and variance are tracked over roughly its last `window` queries.
+    A `floor` fraction of every forward (at least one UID) still walks the coverage cycle, so
+    each available miner is queried at least once every `available / ceil(floor * k)`
+    forwards. The rest go to the miners whose place in the ranking is least certain: each
+    miner's standard error, weighted by how much its reward interval overlaps those of the
+    miners ranked just above and below it. Miners with few queries or noisy rewards score
+    high while their neighbours are close; a miner whose score has settled, or that is
+    clearly ahead of or behind everyone near it, scores low.
+    """
+
+    def __init__(
+        self,
+        floor: float = 0.25,
+        window: int = 100,
+        prior_variance: float = 0.25,
+        rng: Optional[np.random.Generator] = None,
+    ):
+        super().__init__(rng=rng)
+        self.floor = floor
+        self.window = window
+        # Rewards lie in [0, 1], so 0.25 is the largest variance they can have.
+        self.prior_variance = prior_variance
+        self.observations = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros(0, dtype=np.float64)
+        self.variance = np.zeros(0, dtype=np.float64)
+
+    def resize(self, n: int):
+        if n > len(self.observations):
+            grow = n - len(self.observations)
+            self.observations = np.concatenate(
+                [self.observations, np.zeros(grow, dtype=np.int64)]
+            )
+            self.mean = np.concatenate([self.mean, np.zeros(grow)])
+            self.variance = np.concatenate([self.variance, np.zeros(grow)])
+        super().resize(n)
+
+    def forget(self, uid: int):
+        super().forget(uid)
+        self.observations[uid] = 0
+        self.mean[uid] = 0
+        self.variance[uid] = 0
+
+    def observe(self, uids: Sequence[int], rewards: np.ndarray):
+        uids = np.asarray(uids, dtype=np.int64)
+        rewards = np.nan_to_num(np.asarray(rewards, dtype=np.float64))
+        self.resize(int(uids.max()) + 1 if uids.size else 0)
+        # Running mean and variance, which become moving averages once `window` rewards were seen.
+        n = np.minimum(self.observations[uids] + 1, self.window)
+        delta = rewards - self.mean[uids]
+        self.mean[uids] += delta / n
+        self.variance[uids] = (1 - 1 / n) * (
+            self.variance[uids] + delta**2 / n
+        )
+        self.observations[uids] += 1
+
+    def uncertainty(self) -> np.ndarray:
+        """Standard error of each miner's mean reward, with its variance shrunk toward the prior."""
+        n = np.minimum(self.observations, self.window)
+        variance = (n * self.variance + self.prior_variance) / (n + 1)
+        return np.sqrt(variance / (n + 1))
+
+    def rank_uncertainty(self, available: np.ndarray) -> np.ndarray:
+        """
+        Standard error of each available miner's mean reward, weighted by the chance that it
+        is ranked wrongly against a neighbour.
+
+        Neighbours are the available miners just above and below in mean reward. For a gap
+        of z combined standard errors the weight is exp(-z**2 / 2): 1 for a tie, falling
+        toward 0 as the two separate. Unavailable miners get 0.
+        """
+        error = self.uncertainty()[: len(available)]
+        uids = np.flatnonzero(available)
+        priority = np.zeros(len(available))
+        if uids.size == 0:
+            return priority
+        order = uids[np.argsort(self.mean[uids], kind="stable")]
+        mean, se = self.mean[order], error[order]
+        z = np.abs(np.diff(mean)) / np.sqrt(se[:-1] ** 2 + se[1:] ** 2)
+        overlap = np.exp(-0.5 * z**2)
+        # A miner with no neighbours has nothing to be ranked against, so keeps its full error.
+        weight = (
+            np.ones(order.size) if order.size == 1 else np.zeros(order.size)
+        )
+        weight[:-1] = np.maximum(weight[:-1], overlap)
+        weight[1:] = np.maximum(weight[1:], overlap)
+        priority[order] = se * weight
+        return priority
+
+    def sample(self, available: np.ndarray, k: int) -> np.ndarray:
+        self.resize(len(available))
+        k = min(k, int(np.count_nonzero(available)))
+        if k == 0:
+            return np.zeros(0, dtype=np.int64)
+        covered = super().sample(
+            available,
+            max(1, math.ceil(self.floor * k)) if self.floor > 0 else 0,
+        )
+        rest = k - covered.size
+        if rest <= 0:
+            return covered[:k]
+        uncertainty = self.rank_uncertainty(available)
+        # A little noise breaks ties, such as between miners that were never queried.
+        priority = np.where(
+            available,
+            uncertainty + self.rng.random(len(available)) * 1e-9,
+            -np.inf,
+        )
+        priority[covered] = -np.inf
+        chosen = np.argpartition(-priority, rest - 1)[:rest]
+        self.counts[chosen] += 1
+        return np.concatenate([covered, chosen])
@@ -0,0 +1,118 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT of OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import asyncio
+import traceback
+import bittensor as bt
+from typing import Awaitable, Callable, Optional, Set
+
+
+class ForwardScheduler:
+    """
+    Keeps a sliding window of forward passes in flight.
+
+    A new forward starts as soon as any running one finishes, so one slow miner round no
+    longer holds up the others. `maintenance` (metagraph sync, weight setting and state
+    saving) runs in a worker thread every `maintenance_every` completed forwards, while
+    forwards keep going; a new round only starts once the previous one has finished.
+
+    Maintenance therefore overlaps forwards. In the validator, `self.metagraph.sync` replaces
+    the metagraph's hotkeys and axons while forwards read `self.metagraph.axons`, and
+    anything both sides mutate, such as the scores and latency statistics, must be changed
+    under `scores_lock` on both sides.
+
+    Args:
+        forward (Callable[[], Awaitable]): Runs one forward pass.
+        window (int): Number of forward passes kept in flight.
+        maintenance (Callable[[], None]): Blocking maintenance work.
+        maintenance_every (int): Completed forwards between maintenance rounds.
+        should_exit (Callable[[], bool]): Polled after every completed forward.
+        on_forward (Callable[[], None]): Called after every completed forward, e.g. to count steps.
+    """
+
+    def __init__(
+        self,
+        forward: Callable[[], Awaitable],
+        window: int,
+        maintenance: Callable[[], None],
+        maintenance_every: Optional[int] = None,
+        should_exit: Callable[[], bool] = lambda: False,
+        on_forward: Callable[[], None] = lambda: None,
+    ):
+        self.forward = forward
+        self.window = max(1, window)
+        self.maintenance = maintenance
+        self.maintenance_every = maintenance_every or self.window
+        self.should_exit = should_exit
+        self.on_forward = on_forward
+        self.completed = 0
+        self.failed = 0
+        self._since_maintenance = 0
+        self._maintenance_task: Optional[asyncio.Task] = None
+
+    def _maintain(self) -> None:
+        try:
+            self.maintenance()
+        except Exception as err:
+            bt.logging.error(f"Error during validator maintenance: {err}")
+            bt.logging.debug(traceback.format_exc())
+
+    def _maybe_start_maintenance(self) -> None:
+        if self._since_maintenance < self.maintenance_every:
+            return
+        if (
+            self._maintenance_task is not None
+            and not self._maintenance_task.done()
+        ):
+            return
+        self._since_maintenance = 0
+        self._maintenance_task = asyncio.ensure_future(
+            asyncio.to_thread(self._maintain)
+        )
+
+    async def run(self) -> None:
+        """Runs forwards until `should_exit`, then waits for the ones in flight and any running maintenance."""
+        in_flight: Set[asyncio.Task] = set()
+        while not self.should_exit():
+            while len(in_flight) < self.window:
+                in_flight.add(asyncio.ensure_future(self.forward()))
+            done, in_flight = await asyncio.wait(
+                in_flight, return_when=asyncio.FIRST_COMPLETED
+            )
+            self._finish(done)
+        if in_flight:
+            self._finish((await asyncio.wait(in_flight))[0])
+        if self._maintenance_task is not None:
+            await self._maintenance_task
+
+    def _finish(self, done: Set[asyncio.Task]) -> None:
+        for task in done:
+            error = task.exception()
+            if error is not None:
+                self.failed += 1
+                bt.logging.error(f"Error during forward: {error}")
+                bt.logging.debug(
+                    "".join(
+                        traceback.format_exception(
+                            type(error), error, error.__traceback__
+                        )
+                    )
+                )
+            self.completed += 1
+            self._since_maintenance += 1
+            self.on_forward()
+        self._maybe_start_maintenance()
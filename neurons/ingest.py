@@ -0,0 +1,254 @@
+# The MIT License (MIT)
+# Copyright © 2024 Cohere
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the “Software”), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of
+# the Software.
+
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO
+# THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+# DEALINGS IN THE SOFTWARE.
+
+import os
+import typing
+import asyncio
+import argparse
+import secrets
+import threading
+
+import bittensor as bt
+import fastapi
+import numpy as np
+import torch
+import uvicorn
+from sentence_transformers import SentenceTransformer
+
+from cers_subnet.miner.chunking import Chunker
+from cers_subnet.miner.payloads import (
+    BulkDocumentPayload,
+    DocumentPayload,
+    delete_record,
+    upsert_record,
+)
+from cers_subnet.miner.space import SPACE_FILE, read_space_file
+from cers_subnet.miner.wal import WriteAheadLog
+
+
+def get_config() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Document ingest API that runs apart from the miner. Start the miner with --miner.ingest_process."
+    )
+    parser.add_argument(
+        "--miner.db_path",
+        dest="db_path",
+        default="./chroma_db",
+        help="The miner's database directory.",
+    )
+    parser.add_argument(
+        "--miner.wal_group_commit_ms",
+        dest="group_commit_ms",
+        type=float,
+        default=2.0,
+        help="How long to gather concurrent writes into one fsync.",
+    )
+    parser.add_argument(
+        "--ingest.port",
+        dest="port",
+        type=int,
+        default=8002,
+        help="Port of the ingest API.",
+    )
+    parser.add_argument(
+        "--neuron.device",
+        dest="device",
+        default="cuda" if torch.cuda.is_available() else "cpu",
+        help="Device to run the embedding model on.",
+    )
+    return parser.parse_args()
+
+
+class Ingest:
+    """
+    Accepts document upserts and deletes, encodes documents and appends them to the miner's write-ahead log.
+
+    The miner process, started with `--miner.ingest_process`, tails the log and applies
+    the records as they arrive, using the embeddings in them instead of encoding again.
+    Encoding therefore never competes with validator queries for the miner's GIL, thread
+    pool or model. Documents are encoded and chunked exactly like the miner's serving space,
+    whose model and chunk settings the miner records in `embedding_space.json` when it starts
+    and after a migration. The file is re-read when it changes, so neither needs a restart.
+    """
+
+    def __init__(self, config: argparse.Namespace):
+        self.config = config
+        self.api_key = os.getenv("MINER_API_KEY")
+        if not self.api_key:
+            bt.logging.error(
+                "MINER_API_KEY environment variable not set. The ingest API will reject every request."
+            )
+        self.space_file = os.path.join(config.db_path, SPACE_FILE)
+        self.wal = WriteAheadLog(
+            os.path.join(config.db_path, "wal"),
+            group_commit_ms=config.group_commit_ms,
+        )
+        self.model_name: typing.Optional[str] = None
+        self.model = None
+        self.chunking: typing.Tuple[int, int] = (0, 0)
+        self.chunker: typing.Optional[Chunker] = None
+        self._space_mtime: typing.Optional[float] = None
+        self._model_lock = threading.Lock()
+        self.app = fastapi.FastAPI()
+        self.api_key_header = fastapi.security.APIKeyHeader(
+            name="X-API-Key", auto_error=False
+        )
+        self.setup_api_routes()
+
+    def active_space(
+        self,
+    ) -> typing.Tuple[
+        str,
+        SentenceTransformer,
+        typing.Tuple[int, int],
+        typing.Optional[Chunker],
+    ]:
+        """
+        The model name, model, chunking and chunker of the space the miner serves, reloaded
+        after the miner recorded a different one. Fails with 503 until the miner has started.
+        """
+        with self._model_lock:
+            try:
+                mtime = os.path.getmtime(self.space_file)
+            except FileNotFoundError:
+                mtime = None
+            if mtime is None and self.model is None:
+                raise fastapi.HTTPException(
+                    status_code=fastapi.status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="The miner has not recorded its embedding space yet.",
+                )
+            if mtime is not None and mtime != self._space_mtime:
+                settings = read_space_file(self.space_file)
+                if settings["model"] != self.model_name:
+                    self.model = SentenceTransformer(settings["model"])
+                    self.model.to(self.config.device)
+                    self.model_name = settings["model"]
+                    self.chunking = None
+                    bt.logging.info(
+                        f"Encoding documents with {self.model_name} on {self.config.device}."
+                    )
+                chunking = (
+                    settings["chunk_tokens"],
+                    settings["chunk_overlap"],
+                )
+                if chunking != self.chunking:
+                    # The miner records the chunker's effective settings, so they are used as they are.
+                    self.chunker = (
+                        Chunker(
+                            getattr(self.model, "tokenizer", None), *chunking
+                        )
+                        if chunking[0]
+                        else None
+                    )
+                    self.chunking = chunking
+                    bt.logging.info(
+                        f"Chunking documents into {chunking[0] or 'unlimited'} tokens with {chunking[1]} overlap."
+                    )
+                self._space_mtime = mtime
+            return self.model_name, self.model, self.chunking, self.chunker
+
+    def ingest(self, documents: typing.List[DocumentPayload]) -> int:
+        """Encodes the documents together and durably logs them; returns the last log sequence number."""
+        model_name, model, chunking, chunker = self.active_space()
+        chunks = [
+            chunker.split(doc.document)
+            if chunker is not None
+            else [doc.document]
+            for doc in documents
+        ]
+        embeddings = model.encode(
+            [chunk for doc_chunks in chunks for chunk in doc_chunks],
+            convert_to_numpy=True,
+        ).astype(np.float32)
+        # One (chunks, dim) matrix per document; the miner stores the rows as the document's chunks.
+        matrices = np.split(
+            embeddings,
+            np.cumsum([len(doc_chunks) for doc_chunks in chunks])[:-1],
+        )
+        return self.wal.append(
+            [
+                upsert_record(doc, model_name, matrix, chunking)
+                for doc, matrix in zip(documents, matrices)
+            ]
+        )
+
+    def get_api_key(self, api_key: typing.Optional[str]) -> str:
+        if (
+            api_key
+            and self.api_key
+            and secrets.compare_digest(api_key, self.api_key)
+        ):
+            return api_key
+        raise fastapi.HTTPException(
+            status_code=fastapi.status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or missing API Key",
+        )
+
+    def setup_api_routes(self) -> None:
+        def authenticate(api_key: str = fastapi.Security(self.api_key_header)):
+            return self.get_api_key(api_key)
+
+        @self.app.post("/documents", status_code=201)
+        async def upsert_endpoint(
+            payload: DocumentPayload,
+            api_key: str = fastapi.Depends(authenticate),
+        ):
+            lsn = await asyncio.to_thread(self.ingest, [payload])
+            return {"status": "success", "id": payload.id, "lsn": lsn}
+
+        @self.app.post("/documents/bulk", status_code=201)
+        async def bulk_upsert_endpoint(
+            payload: BulkDocumentPayload,
+            api_key: str = fastapi.Depends(authenticate),
+        ):
+            lsn = await asyncio.to_thread(self.ingest, payload.documents)
+            return {
+                "status": "success",
+                "count": len(payload.documents),
+                "lsn": lsn,
+            }
+
+        @self.app.delete("/documents/{doc_id}")
+        async def delete_endpoint(
+            doc_id: str, api_key: str = fastapi.Depends(authenticate)
+        ):
+            lsn = await asyncio.to_thread(
+                self.wal.append, [delete_record(doc_id)]
+            )
+            return {"status": "success", "id": doc_id, "lsn": lsn}
+
+        @self.app.get("/health", status_code=200)
+        def health_check():
+            return {
+                "status": "ok",
+                "model": self.model_name,
+                "chunking": self.chunking,
+                "durable_lsn": self.wal.durable_lsn,
+            }
+
+
+if __name__ == "__main__":
+    config = get_config()
+    ingest = Ingest(config)
+    if os.path.exists(ingest.space_file):
+        ingest.active_space()
+    else:
+        bt.logging.warning(
+            "The miner has not recorded its embedding space yet; documents are refused until it starts."
+        )
+    bt.logging.info(f"Running ingest API on port {config.port}")
+    uvicorn.run(ingest.app, host="0.0.0.0", port=config.port)
@@ -15,6 +15,7 @@
 # OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 # DEALINGS IN THE SOFTWARE.
 
+import re
 import time
 import typing
 import bittensor as bt
@@ -23,6 +24,7 @@ import bittensor as bt
 import cers_subnet
 
 import torch
+import numpy as np
 from sentence_transformers import SentenceTransformer
 
 import asyncio
@@ -30,9 +32,33 @@ import secrets
 import chromadb
 import csv
 import os
+import shutil
 
 # import base miner class which takes care of most of the boilerplate
 from cers_subnet.base.miner import BaseMinerNeuron
+from cers_subnet.miner.binary import BinaryPrefilter
+from cers_subnet.miner.cache import SemanticCache
+from cers_subnet.miner.chunking import Chunker
+from cers_subnet.miner.deadline import Deadline
+from cers_subnet.miner.dedup import Deduplicator
+from cers_subnet.miner.filters import parse_metadata_value
+from cers_subnet.miner.ids import IdTable
+from cers_subnet.miner.index import BaseIndex, FlatIndex
+from cers_subnet.miner.migration import ModelMigration
+from cers_subnet.miner.payloads import (
+    BulkDocumentPayload,
+    DocumentPayload,
+    delete_record,
+    record_embedding,
+    upsert_record,
+)
+from cers_subnet.miner.pq import PQIndex
+from cers_subnet.miner.segments import SegmentedIndex
+from cers_subnet.miner.snapshot import DUPLICATES as SNAPSHOT_DUPLICATES
+from cers_subnet.miner.snapshot import check_chunking, export_snapshot, fetch_snapshot, import_snapshot, verify_snapshot
+from cers_subnet.miner.space import SPACE_FILE, EmbeddingSpace, read_space_file, startup_migration, write_space_file
+from cers_subnet.miner.tuning import BreadthTuner
+from cers_subnet.miner.wal import LogApplier, WriteAheadLog
 
 # New imports for the API
 import fastapi
@@ -41,9 +67,10 @@ import threading, os, csv
 from pydantic import BaseModel
 
 
-class DocumentPayload(BaseModel):
-    id: str
-    document: str
+DEFAULT_EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+class MigrationPayload(BaseModel):
+    model_name: str
 
 class Miner(BaseMinerNeuron):
     """
@@ -61,20 +88,15 @@ class Miner(BaseMinerNeuron):
         # For example, loading a search model, a vector database, etc.
         bt.logging.info("Miner for Cohere Enterprise RAG Subnet initialized.")
 
-        # For this example, we'll use a sentence-transformer model for embeddings.
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        bt.logging.info("Sentence Transformer model loaded.")
-
-        # Explicitly move the model to the configured device (e.g., "cuda" or "cpu")
+        # Models are explicitly moved to the configured device (e.g., "cuda" or "cpu")
         self.device = self.config.get("neuron.device", "cuda" if torch.cuda.is_available() else "cpu")
-        self.embedding_model.to(self.device)
-        bt.logging.info(f"Embedding model moved to device: {self.device}")
 
         # --- Configuration for API and Database ---
         self.api_port = self.config.get('miner.api_port', 8001)
         self.api_key = os.getenv('MINER_API_KEY')
-        db_path = self.config.get('miner.db_path', './chroma_db')
-        collection_name = self.config.get('miner.collection_name', 'enterprise-rag')
+        self.db_path = db_path = self.config.get('miner.db_path', './chroma_db')
+        self.collection_name = self.config.get('miner.collection_name', 'enterprise-rag')
+        self.deadline_margin = self.config.get('miner.deadline_margin', 1.0)
 
         if not self.api_key:
             bt.logging.error(
@@ -83,19 +105,105 @@ class Miner(BaseMinerNeuron):
 
         # Setup ChromaDB. We'll use a persistent client to store data on disk.
         self.chroma_client = chromadb.PersistentClient(path=db_path)
-        self.collection = self.chroma_client.get_or_create_collection(
-            name=collection_name,
-            # It's good practice to specify the embedding function for the collection
-            # although we are providing the embeddings manually in this case.
-            metadata={"hnsw:space": "cosine"} # Use cosine similarity
+        self.space_file = os.path.join(db_path, SPACE_FILE)
+        # Document ids interned as int32 keys, shared by every index so keys agree across spaces.
+        self.id_table = IdTable(os.path.join(db_path, "document_ids.bin"))
+
+        # The embedding space (model, collection and in-memory index) that serves queries.
+        # ChromaDB persists the vectors; the in-memory index serves queries so the
+        # search path can stop on the validator's deadline.
+        self.configured_model = self.config.get('miner.embedding_model', DEFAULT_EMBEDDING_MODEL)
+        recorded = read_space_file(self.space_file)
+        model_change = startup_migration(recorded, self.configured_model)
+        # The configured model is recorded once it serves, so a restart during its migration starts it again.
+        self.recorded_model = recorded['configured_model'] if model_change else self.configured_model
+        model_name, collection_name = self.read_active_space()
+        self.space = self.create_space(model_name, collection_name)
+        self.compact_ids(self.space)
+        self.space.load()
+        # The chunk settings may have changed since the last run; an ingest process follows them.
+        self.write_active_space()
+        bt.logging.info(f"Loaded {len(self.space.index)} embeddings into the search index: {self.space.chunk_status()}")
+
+        # Writes go to every live space; during a model migration that includes the new one.
+        self.write_lock = threading.Lock()
+        self.migration: typing.Optional[ModelMigration] = None
+        self.queries_in_flight = 0
+
+        # Near-duplicate documents are stored once and kept as aliases of that copy.
+        self.dedup: typing.Optional[Deduplicator] = None
+        if self.config.get('miner.dedup', False):
+            self.dedup = self.open_dedup()
+            bt.logging.info(f"Near-duplicate registry: {self.dedup.status()}")
+
+        # Snapshots of the index are exported on request and can bootstrap a new miner.
+        self.snapshot_dir = os.path.join(db_path, "snapshots")
+        self.snapshot_lock = threading.Lock()
+        self.snapshot_manifest: typing.Optional[dict] = None
+
+        # If the collection is empty, we populate it from a snapshot if one is configured,
+        # otherwise with initial documents from a CSV file in batches.
+        if self.space.collection.count() == 0:
+            snapshot_source = self.config.get('miner.snapshot_source', None)
+            if snapshot_source:
+                bt.logging.info(f"ChromaDB collection is empty. Importing the snapshot at {snapshot_source}...")
+                self.load_snapshot(snapshot_source)
+            else:
+                bt.logging.info("ChromaDB collection is empty. Populating with initial documents...")
+                self.load_documents_from_csv()
+
+        # Acknowledged mutations are logged durably first and applied to the index in batches.
+        self.wal: typing.Optional[WriteAheadLog] = None
+        self.wal_applier: typing.Optional[LogApplier] = None
+        # With `miner.ingest_process` a separate process (neurons/ingest.py) writes the log and this one only tails it.
+        ingest_process = self.config.get('miner.ingest_process', False)
+        if self.config.get('miner.wal', False) or ingest_process:
+            self.wal = WriteAheadLog(
+                os.path.join(db_path, "wal"),
+                group_commit_ms=self.config.get('miner.wal_group_commit_ms', 2.0),
+                writer=not ingest_process,
+            )
+            self.wal_applier = LogApplier(self.wal, self.apply_mutations, batch_size=self.config.get('miner.wal_batch_size', 256))
+            # Replay whatever was acknowledged but not applied before the last shutdown or crash.
+            try:
+                replayed = self.wal_applier.catch_up()
+            except Exception as e:
+                # The background thread keeps retrying, and eventually quarantines the failing records.
+                bt.logging.error(f"Replaying the write-ahead log failed: {e}")
+                replayed = 0
+            if replayed:
+                bt.logging.info(f"Replayed {replayed} mutations from the write-ahead log.")
+            self.wal_applier.start()
+
+        # Serves paraphrased queries from the results of earlier, similar ones.
+        self.query_cache: typing.Optional[SemanticCache] = None
+        if self.config.get('miner.semantic_cache_size', 0):
+            self.query_cache = SemanticCache(
+                capacity=self.config.get('miner.semantic_cache_size', 0),
+                threshold=self.config.get('miner.semantic_cache_threshold', 0.95),
+            )
+
+        # Keeps p99 search latency under the target by adjusting the index's search breadth.
+        self.tuner: typing.Optional[BreadthTuner] = None
+        target_ms = self.config.get('miner.search_p99_ms', 0)
+        if target_ms:
+            self.tuner = BreadthTuner(
+                target_p99=target_ms / 1000,
+                sample_rate=self.config.get('miner.recall_sample_rate', 0.02),
+            )
+
+        # Only a changed `miner.embedding_model` migrates; models switched to through the API or a snapshot are kept.
+        if model_change is not None and model_change != self.space.model_name:
+            bt.logging.info(f"Configured embedding model {model_change} differs from the active {self.space.model_name}.")
+            self.start_migration(model_change)
+
+        # Validators can also send several queries in one request.
+        self.axon.attach(
+            forward_fn=self.forward_batch,
+            blacklist_fn=self.blacklist_batch,
+            priority_fn=self.priority_batch,
         )
-        bt.logging.info("ChromaDB client and collection initialized.")
 
-        # If the collection is empty, we populate it with initial documents from a CSV file in batches.
-        if self.collection.count() == 0:
-            bt.logging.info("ChromaDB collection is empty. Populating with initial documents...")
-            self.load_documents_from_csv()
-        
         # Setup and run the API server in a background thread
         self.app = fastapi.FastAPI()
         self.api_key_header = fastapi.security.APIKeyHeader(name="X-API-Key", auto_error=False)
@@ -107,42 +215,264 @@ class Miner(BaseMinerNeuron):
         )
         self.api_thread.start()
 
-    def load_documents_from_csv(self):
-        """Loads documents from a CSV file and adds them to the ChromaDB collection."""
+    def read_active_space(self) -> typing.Tuple[str, str]:
+        """Returns the (model, collection) pair the miner served last, if any."""
+        active = read_space_file(self.space_file)
+        if active is None:
+            return self.configured_model, self.collection_name
+        return active['model'], active['collection']
+
+    def write_active_space(self):
+        """
+        Records the serving space so a restart keeps using the migrated model, and so a
+        separate ingest process encodes and chunks documents exactly like this miner.
+
+        The configured model is recorded too, so that only a change to it migrates on restart.
+        """
+        write_space_file(self.space_file, dict(self.space.settings(), configured_model=self.recorded_model))
+
+    def compact_ids(self, space: EmbeddingSpace) -> None:
+        """Drops the ids of deleted documents from the id table; only safe before any index holds keys."""
+        stored = space.collection.count()
+        if len(self.id_table) <= 2 * stored:
+            return
+        dropped = self.id_table.compact(space.stored_ids())
+        bt.logging.info(f"Dropped {dropped} ids of deleted documents from the id table; {len(self.id_table)} remain.")
+
+    def create_space(self, model_name: str, collection_name: str) -> EmbeddingSpace:
+        """Loads an embedding model and opens the ChromaDB collection that holds its vectors."""
+        model = SentenceTransformer(model_name)
+        model.to(self.device)
+        bt.logging.info(f"Sentence Transformer model {model_name} loaded on device: {self.device}")
+        collection = self.chroma_client.get_or_create_collection(
+            name=collection_name,
+            # It's good practice to specify the embedding function for the collection
+            # although we are providing the embeddings manually in this case.
+            metadata={"hnsw:space": "cosine"} # Use cosine similarity
+        )
+        # Long documents are split into overlapping chunks that fit the model's input limit.
+        chunker = None
+        if self.config.get('miner.chunk_tokens', 0):
+            chunker = Chunker.for_model(
+                model, self.config.get('miner.chunk_tokens', 0), overlap=self.config.get('miner.chunk_overlap', 32)
+            )
+        return EmbeddingSpace(
+            model_name, model, collection,
+            index=self.create_index(collection_name),
+            chunker=chunker,
+            query_cache_size=self.config.get('miner.query_cache_size', 1024),
+        )
+
+    def create_index(self, collection_name: str) -> SegmentedIndex:
+        """
+        Builds the in-memory search index selected by `miner.index_backend`.
+
+        The backend is the main segment of a `SegmentedIndex`: writes land in a small
+        delta segment that is merged into it in the background, so queries never wait
+        for ingestion.
+
+        `flat` keeps float32 vectors in RAM and searches exactly. `pq` keeps 16-64 byte
+        product-quantized codes in RAM and the full vectors in a memory-mapped file, for
+        corpora too large to hold as float32.
+
+        With `miner.binary_prefilter`, either backend only scores the shortlist found by a
+        Hamming scan over 1-bit codes.
+        """
+        prefilter = None
+        if self.config.get('miner.binary_prefilter', False):
+            prefilter = BinaryPrefilter(shortlist=self.config.get('miner.binary_shortlist', 256))
+        return SegmentedIndex(
+            self.create_backend(collection_name, prefilter),
+            merge_rows=self.config.get('miner.merge_rows', 10000),
+            merge_interval=self.config.get('miner.merge_interval', 30.0),
+        )
+
+    def create_backend(self, collection_name: str, prefilter: typing.Optional[BinaryPrefilter]) -> BaseIndex:
+        backend = self.config.get('miner.index_backend', 'flat')
+        if backend == 'flat':
+            return FlatIndex(prefilter=prefilter, id_table=self.id_table)
+        if backend == 'pq':
+            return PQIndex(
+                path=os.path.join(self.db_path, "pq", collection_name),
+                m=self.config.get('miner.pq_subquantizers', 48),
+                rerank=self.config.get('miner.pq_rerank', 100),
+                train_size=self.config.get('miner.pq_train_size', 65536),
+                prefilter=prefilter,
+                id_table=self.id_table,
+            )
+        raise ValueError(f"Unknown index backend '{backend}'. Use 'flat' or 'pq'.")
+
+    def write_spaces(self) -> typing.List[EmbeddingSpace]:
+        """The spaces every mutation must be applied to."""
+        migration = self.migration
+        if migration is not None and migration.active:
+            # A cancel in the meantime releases the target.
+            target = migration.target
+            if target is not None:
+                return [self.space, target]
+        return [self.space]
+
+    def start_migration(self, model_name: str) -> ModelMigration:
+        """
+        Starts building an index with `model_name` in the background while the current model keeps serving.
+        """
+        if self.migration is not None and self.migration.active:
+            raise RuntimeError(f"A migration to {self.migration.target.model_name} is already running.")
+        slug = re.sub(r"[^a-z0-9]+", "-", model_name.lower()).strip("-")
+        collection_name = f"{self.collection_name}-{slug}"[:63].rstrip("-")
+        if collection_name == self.space.collection.name:
+            raise ValueError(f"{model_name} is already the active embedding model.")
+        # Start from an empty collection; a leftover one may hold stale vectors.
+        if collection_name in [c.name for c in self.chroma_client.list_collections()]:
+            self.chroma_client.delete_collection(collection_name)
+        target = self.create_space(model_name, collection_name)
+
+        self.migration = ModelMigration(
+            source=self.space,
+            target=target,
+            documents=self.iter_csv_documents,
+            write_lock=self.write_lock,
+            on_ready=self.complete_migration,
+            is_busy=lambda: self.queries_in_flight > 0,
+            batch_size=self.config.get('miner.batch_size', 100),
+            duty_cycle=self.config.get('miner.migration_duty_cycle', 0.5),
+        )
+        self.migration.start()
+        return self.migration
+
+    def complete_migration(self, migration: ModelMigration):
+        """Atomically switches queries and writes to the migrated space."""
+        with self.write_lock:
+            previous = self.space
+            self.space = migration.target
+            if self.space.model_name == self.configured_model:
+                self.recorded_model = self.configured_model
+            self.write_active_space()
+        bt.logging.success(
+            f"Switched embedding model from {previous.model_name} to {self.space.model_name}. "
+            f"The previous collection '{previous.collection.name}' is kept and can be deleted."
+        )
+
+    def documents_path(self) -> str:
         documents_file = self.config.get('miner.documents_file', 'data/documents.csv')
-        documents_path = os.path.join(
+        return os.path.join(
             os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
             documents_file
         )
-        
+
+    def iter_csv_documents(self) -> typing.Iterator[typing.Tuple[str, str, dict]]:
+        """
+        Yields (id, text, metadata) for every row of the configured documents CSV file.
+
+        The file needs `id` and `text` columns; any other non-empty column is stored as document metadata.
+        Numbers and booleans are converted from text, so range filters match them.
+        """
+        with open(self.documents_path(), "r", newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                metadata = {
+                    key: parse_metadata_value(value)
+                    for key, value in row.items()
+                    if key not in ('id', 'text') and value
+                }
+                yield row['id'], row['text'], metadata
+
+    def load_documents_from_csv(self):
+        """Loads documents from a CSV file and adds them to the ChromaDB collection."""
         batch_size = self.config.get('miner.batch_size', 100)
-        bt.logging.info(f"Starting to load documents from {documents_path} with batch size {batch_size}.")
+        bt.logging.info(f"Starting to load documents from {self.documents_path()} with batch size {batch_size}.")
 
         try:
-            documents_to_add, ids_to_add = [], []
-            with open(documents_path, "r", newline="", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    ids_to_add.append(row['id'])
-                    documents_to_add.append(row['text'])
-
-                    if len(ids_to_add) >= batch_size:
-                        embeddings = self.embedding_model.encode(documents_to_add).tolist()
-                        self.collection.add(embeddings=embeddings, ids=ids_to_add)
-                        bt.logging.info(f"Added batch of {len(documents_to_add)} documents to ChromaDB.")
-                        documents_to_add, ids_to_add = [], []
+            documents_to_add, ids_to_add, metadatas_to_add = [], [], []
+            for doc_id, text, metadata in self.iter_csv_documents():
+                ids_to_add.append(doc_id)
+                documents_to_add.append(text)
+                metadatas_to_add.append(metadata)
+
+                if len(ids_to_add) >= batch_size:
+                    self._blocking_upsert(ids_to_add, documents_to_add, metadatas_to_add)
+                    bt.logging.info(f"Added batch of {len(documents_to_add)} documents to ChromaDB.")
+                    documents_to_add, ids_to_add, metadatas_to_add = [], [], []
             
             # Add any remaining documents
             if documents_to_add:
-                embeddings = self.embedding_model.encode(documents_to_add).tolist()
-                self.collection.add(embeddings=embeddings, ids=ids_to_add)
+                self._blocking_upsert(ids_to_add, documents_to_add, metadatas_to_add)
                 bt.logging.info(f"Added final batch of {len(documents_to_add)} documents to ChromaDB.")
 
         except FileNotFoundError:
-            bt.logging.error(f"Documents file not found at {documents_path}. Cannot populate miner knowledge base.")
+            bt.logging.error(f"Documents file not found at {self.documents_path()}. Cannot populate miner knowledge base.")
         except Exception as e:
             bt.logging.error(f"Failed to load documents from CSV: {e}")
 
+    def open_dedup(self) -> Deduplicator:
+        return Deduplicator(
+            threshold=self.config.get('miner.dedup_threshold', 0.9),
+            path=os.path.join(self.db_path, "duplicates.jsonl"),
+        )
+
+    def load_snapshot(self, source: str):
+        """
+        Imports a snapshot directory, or downloads one from another miner's API if `source` is a URL.
+
+        A snapshot made with another embedding model replaces the active space with one
+        using that model, since its vectors cannot be searched with the configured one.
+        """
+        if source.startswith(("http://", "https://")):
+            directory = os.path.join(self.snapshot_dir, "imported")
+            fetch_snapshot(source, directory, api_key=os.getenv('SNAPSHOT_API_KEY'))
+        else:
+            directory = source
+        manifest = verify_snapshot(directory)
+        # Checked before switching models, since the new space is chunked like this one.
+        check_chunking(manifest, self.space.chunking)
+        if manifest["model"] != self.space.model_name:
+            bt.logging.info(f"Snapshot was made with {manifest['model']}; switching the active space to it.")
+            self.space = self.create_space(manifest["model"], self.space.collection.name)
+            self.write_active_space()
+        with self.write_lock:
+            imported = import_snapshot(self.space, directory, batch_size=self.config.get('miner.snapshot_batch_size', 10000))
+            if SNAPSHOT_DUPLICATES in manifest["files"]:
+                if self.dedup is not None:
+                    # The aliases of the imported documents replace the (empty) registry.
+                    self.dedup.close()
+                    shutil.copyfile(os.path.join(directory, SNAPSHOT_DUPLICATES), self.dedup.path)
+                    self.dedup = self.open_dedup()
+                    bt.logging.info(f"Imported the near-duplicate registry: {self.dedup.status()}")
+                else:
+                    bt.logging.warning("The snapshot has near-duplicate aliases; enable --miner.dedup to keep them.")
+        bt.logging.info(f"Imported {imported} documents from the snapshot ({manifest['dim']} dimensions, {manifest['model']}).")
+
+    def export_snapshot(self) -> dict:
+        """
+        Exports the serving index to `<db_path>/snapshots/latest`, unless the last export is still current.
+
+        Writes wait for the export so the snapshot is a consistent view of one index version.
+        """
+        with self.snapshot_lock:
+            directory = os.path.join(self.snapshot_dir, "latest")
+            with self.write_lock:
+                index = self.space.index
+                current = self.snapshot_manifest
+                # Aliases are added without touching the index, so a grown registry also needs a new export.
+                registry = self.dedup.path if self.dedup is not None else None
+                registry_bytes = os.path.getsize(registry) if registry is not None and os.path.exists(registry) else None
+                if (
+                    current is None
+                    or current["version"] != index.version
+                    or current["model"] != self.space.model_name
+                    or current["files"].get(SNAPSHOT_DUPLICATES, {}).get("bytes") != registry_bytes
+                ):
+                    self.snapshot_manifest = export_snapshot(
+                        index.batches(self.config.get('miner.snapshot_batch_size', 10000)),
+                        directory,
+                        self.space.model_name,
+                        version=index.version,
+                        duplicates=registry,
+                        chunking=self.space.chunking,
+                    )
+                    bt.logging.info(f"Exported a snapshot of {self.snapshot_manifest['count']} documents.")
+            return self.snapshot_manifest
+
     def get_api_key(self, api_key_header: str = fastapi.Security(api_key_header)):
         # Use secrets.compare_digest for constant-time comparison to help prevent timing attacks
         if api_key_header and self.api_key and secrets.compare_digest(api_key_header, self.api_key):
@@ -159,17 +489,117 @@ class Miner(BaseMinerNeuron):
 
     def setup_api_routes(self) -> None:
         """Sets up the API routes for the miner."""
-        @self.app.post("/documents", status_code=201)
-        async def upsert_endpoint(payload: DocumentPayload, api_key: str = fastapi.Security(self.get_api_key)):
-            if not await self.upsert_document(payload.id, payload.document):
-                raise fastapi.HTTPException(status_code=500, detail="Failed to upsert document")
-            return {"status": "success", "id": payload.id, "message": "Document upserted successfully."}
-
-        @self.app.delete("/documents/{doc_id}")
-        async def delete_endpoint(doc_id: str, api_key: str = fastapi.Security(self.get_api_key)):
-            if not await self.delete_document(doc_id):
-                raise fastapi.HTTPException(status_code=404, detail="Document not found or failed to delete")
-            return {"status": "success", "id": doc_id, "message": "Document deleted successfully."}
+        # With a separate ingest process, documents are sent to neurons/ingest.py instead.
+        if not self.config.get('miner.ingest_process', False):
+            @self.app.post("/documents", status_code=201)
+            async def upsert_endpoint(payload: DocumentPayload, api_key: str = fastapi.Security(self.get_api_key)):
+                if not await self.upsert_document(payload.id, payload.document, payload.metadata):
+                    raise fastapi.HTTPException(status_code=500, detail="Failed to upsert document")
+                return {"status": "success", "id": payload.id, "message": "Document upserted successfully."}
+
+            @self.app.post("/documents/bulk", status_code=201)
+            async def bulk_upsert_endpoint(payload: BulkDocumentPayload, api_key: str = fastapi.Security(self.get_api_key)):
+                summary = await self.upsert_documents(payload.documents)
+                if summary is None:
+                    raise fastapi.HTTPException(status_code=500, detail="Failed to upsert documents")
+                return {"status": "success", **summary}
+
+            @self.app.delete("/documents/{doc_id}")
+            async def delete_endpoint(doc_id: str, api_key: str = fastapi.Security(self.get_api_key)):
+                if not await self.delete_document(doc_id):
+                    raise fastapi.HTTPException(status_code=404, detail="Document not found or failed to delete")
+                return {"status": "success", "id": doc_id, "message": "Document deleted successfully."}
+
+        @self.app.post("/migration", status_code=202)
+        async def start_migration_endpoint(payload: MigrationPayload, api_key: str = fastapi.Security(self.get_api_key)):
+            """
+            Starts re-indexing the corpus with another embedding model in the background.
+
+            Only documents in `miner.documents_file` are re-encoded, since the miner keeps no
+            document text. Documents that arrived through the API or the write-ahead log must be
+            sent again while the migration runs (`GET /migration` lists them), or a forced
+            cutover drops them from the new index.
+            """
+            try:
+                migration = await asyncio.to_thread(self.start_migration, payload.model_name)
+            except (RuntimeError, ValueError) as e:
+                raise fastapi.HTTPException(status_code=409, detail=str(e))
+            return migration.status()
+
+        @self.app.get("/migration")
+        def migration_status_endpoint(api_key: str = fastapi.Security(self.get_api_key)):
+            if self.migration is None:
+                return {"state": "idle", "model": self.space.model_name}
+            return self.migration.status()
+
+        @self.app.post("/migration/cutover")
+        async def cutover_endpoint(force: bool = False, api_key: str = fastapi.Security(self.get_api_key)):
+            """Switches to the new model now; `force` accepts documents missing from the new index."""
+            if self.migration is None or not await asyncio.to_thread(self.migration.maybe_finish, force):
+                raise fastapi.HTTPException(status_code=409, detail="Migration has not caught up yet.")
+            return {"status": "success", "model": self.space.model_name}
+
+        @self.app.delete("/migration")
+        def cancel_migration_endpoint(api_key: str = fastapi.Security(self.get_api_key)):
+            if self.migration is None or not self.migration.active:
+                raise fastapi.HTTPException(status_code=404, detail="No migration is running.")
+            self.migration.cancel()
+            return {"status": "success", "model": self.space.model_name}
+
+        @self.app.get("/tuning")
+        def tuning_status_endpoint(api_key: str = fastapi.Security(self.get_api_key)):
+            """Current search breadth, measured p99 latency and sampled recall."""
+            if self.tuner is None:
+                raise fastapi.HTTPException(status_code=404, detail="Search tuning is disabled.")
+            return self.tuner.status()
+
+        @self.app.get("/cache")
+        def cache_status_endpoint(api_key: str = fastapi.Security(self.get_api_key)):
+            """Hit rate of the semantic query cache and how often sampled hits agree with a fresh search."""
+            if self.query_cache is None:
+                raise fastapi.HTTPException(status_code=404, detail="The semantic query cache is disabled.")
+            return self.query_cache.status()
+
+        @self.app.get("/duplicates")
+        def duplicates_status_endpoint(api_key: str = fastapi.Security(self.get_api_key)):
+            """How many documents are stored as aliases of a near-duplicate."""
+            if self.dedup is None:
+                raise fastapi.HTTPException(status_code=404, detail="Near-duplicate detection is disabled.")
+            return self.dedup.status()
+
+        @self.app.get("/chunks")
+        def chunks_status_endpoint(api_key: str = fastapi.Security(self.get_api_key)):
+            """Documents, stored chunks and the chunk expansion factor of the serving index."""
+            return self.space.chunk_status()
+
+        @self.app.get("/wal")
+        def wal_status_endpoint(api_key: str = fastapi.Security(self.get_api_key)):
+            """How far applying the write-ahead log lags behind acknowledged mutations."""
+            if self.wal_applier is None:
+                raise fastapi.HTTPException(status_code=404, detail="The write-ahead log is disabled.")
+            return {
+                "durable_lsn": self.wal.durable_lsn,
+                "applied_lsn": self.wal_applier.applied_lsn,
+                "lag": self.wal_applier.lag(),
+                "applied": self.wal_applier.applied,
+                "error": self.wal_applier.error,
+                "attempts": self.wal_applier.attempts,
+                "quarantined": self.wal_applier.quarantined,
+                "log_error": str(self.wal.error) if self.wal.error is not None else None,
+            }
+
+        @self.app.get("/snapshot")
+        async def snapshot_endpoint(api_key: str = fastapi.Security(self.get_api_key)):
+            """Exports a checksummed snapshot of the index if needed and returns its manifest."""
+            return await asyncio.to_thread(self.export_snapshot)
+
+        @self.app.get("/snapshot/files/{name}")
+        def snapshot_file_endpoint(name: str, api_key: str = fastapi.Security(self.get_api_key)):
+            """Streams one file of the last exported snapshot."""
+            manifest = self.snapshot_manifest
+            if manifest is None or name not in manifest["files"]:
+                raise fastapi.HTTPException(status_code=404, detail="No such snapshot file.")
+            return fastapi.responses.FileResponse(os.path.join(self.snapshot_dir, "latest", name))
 
         @self.app.get("/health", status_code=200)
         def health_check():
@@ -180,91 +610,369 @@ class Miner(BaseMinerNeuron):
         self, synapse: cers_subnet.protocol.EnterpriseRAG
     ) -> cers_subnet.protocol.EnterpriseRAG:
         """
-        Processes the incoming 'EnterpriseRAG' synapse by performing a simulated document search.
-        This method should be replaced with actual logic relevant to the miner's purpose.
+        Processes the incoming 'EnterpriseRAG' synapse by searching the miner's index for the query.
+
+        The search is bounded by the validator's timeout: a response that arrives after
+        `synapse.timeout` is scored 0, so when time runs short the index returns the best
+        partial top-k it has found instead of finishing the scan. If the synapse carries a
+        metadata `filter`, only matching documents are scored.
 
         Args:
             synapse (cers_subnet.protocol.EnterpriseRAG): The synapse object containing the query.
 
         Returns:
-            cers_subnet.protocol.EnterpriseRAG: The synapse object with the 'documents' field filled with the search results.
+            cers_subnet.protocol.EnterpriseRAG: The synapse object with the 'document_ids' field filled with the search results.
         """
-        # Now, we use ChromaDB to perform the semantic search.
+        deadline = Deadline.from_synapse(synapse, margin=self.deadline_margin)
         bt.logging.info(f"Received query: {synapse.query}")
 
-        def _search_and_retrieve(query: str) -> list:
+        # Pin the serving space for this request so a model switch cannot mix models.
+        space = self.space
+
+        def _search_and_retrieve(query: str, where: typing.Optional[dict]) -> list:
             """
-            Encapsulates the synchronous, CPU/GPU-bound and I/O-bound operations.
+            Encapsulates the synchronous, CPU/GPU-bound operations.
             """
-            # 1. Encode the query to get its embedding.
-            query_embedding = self.embedding_model.encode(query).tolist()
+            # 1. Encode the query to get its embedding. Repeated queries hit the cache.
+            query_embedding = space.encode_query(query)
+            if deadline.expired():
+                bt.logging.warning(f"Deadline reached after encoding query ({deadline.elapsed():.3f}s). Returning no results.")
+                return []
 
-            # 2. Query ChromaDB for the top-k most similar documents.
+            # 2. Reuse the result of a cached query with a near-identical embedding.
             k = self.config.get('miner.search_k', 2)  # Number of documents to return
-            
-            # Ensure we don't ask for more results than exist
-            n_results = min(k, self.collection.count())
-            if n_results == 0:
+            cached, verify = None, False
+            if self.query_cache is not None:
+                hit = self.query_cache.get(space.index, query_embedding, k, where)
+                if hit is not None:
+                    cached, verify = hit
+                    if not verify:
+                        return self.result_ids(space, cached, k)
+
+            # 3. Search the index for the top-k most similar documents within the remaining budget.
+            # Chunked documents can take several of the top hits, so fetch more chunks than documents.
+            fetch = k * self.config.get('miner.chunk_overfetch', 4) if space.chunks.extra_chunks else k
+            version = space.index.version
+            started = time.monotonic()
+            try:
+                result = space.index.search(query_embedding, fetch, deadline=deadline, where=where)
+            except ValueError as e:
+                bt.logging.warning(f"Rejected query filter {where}: {e}")
                 return []
-            
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results
-            )
-            return results.get('ids', [[]])[0]
+            if self.tuner is not None:
+                self.tuner.observe(
+                    space.index, query_embedding, result.keys, fetch, time.monotonic() - started, filtered=where is not None
+                )
+            keys = space.collapse(result.keys, k)
+            if not result.complete:
+                bt.logging.warning(f"Search stopped at the deadline after {deadline.elapsed():.3f}s; returning partial top-{k}.")
+            elif self.query_cache is not None:
+                if cached is not None:
+                    self.query_cache.record_agreement(cached, keys)
+                else:
+                    self.query_cache.put(
+                        space.index, version, query_embedding, k, where, keys, SemanticCache.floor(result, fetch)
+                    )
+            # Only the returned keys are turned back into document id strings.
+            return self.result_ids(space, keys, k)
 
         # Run the blocking operations in a separate thread to avoid blocking the asyncio event loop.
         # This is crucial for maintaining responsiveness under load.
-        synapse.document_ids = await asyncio.to_thread(_search_and_retrieve, synapse.query)
+        self.queries_in_flight += 1
+        try:
+            synapse.document_ids = await asyncio.to_thread(_search_and_retrieve, synapse.query, synapse.filter)
+        finally:
+            self.queries_in_flight -= 1
 
-        bt.logging.info(f"Returning {len(synapse.document_ids)} document IDs.")
+        bt.logging.info(f"Returning {len(synapse.document_ids)} document IDs in {deadline.elapsed():.3f}s.")
         return synapse
 
-    def _blocking_upsert(self, doc_id: str, document: str):
+    def _blocking_upsert(
+        self,
+        ids: typing.List[str],
+        documents: typing.List[str],
+        metadatas: typing.Optional[typing.List[typing.Optional[dict]]] = None,
+        records: typing.Optional[typing.List[dict]] = None,
+    ) -> int:
         """
         The synchronous, blocking part of the upsert operation.
-        This involves encoding the document and writing to the database.
+        This involves encoding the documents and writing to the database.
+
+        `records` are the mutation records of the documents, if any; embeddings they carry
+        for a space's model are used instead of encoding the document again.
+
+        Returns:
+            int: How many of the documents were stored as aliases of a near-duplicate.
         """
-        embedding = self.embedding_model.encode(document).tolist()
-        self.collection.upsert(
-            ids=[doc_id],
-            embeddings=[embedding]
-            # We do not store the document content itself for security reasons.
-        )
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(ids)
+        signatures = [self.dedup.signature(document) for document in documents] if self.dedup is not None else None
+        # Encode outside the lock so concurrent upserts only serialize on the writes.
+        # Documents that already match a stored duplicate are not encoded at all.
+        to_encode = [
+            i for i in range(len(ids))
+            if signatures is None or self.dedup.match(signatures[i], metadatas[i]) is None
+        ]
+        def encode(space: EmbeddingSpace, positions: typing.List[int]) -> dict:
+            vectors = {}
+            if records is not None:
+                for i in positions:
+                    embedding = record_embedding(records[i], space.model_name, space.chunking)
+                    if embedding is not None:
+                        vectors[i] = embedding
+            missing = [i for i in positions if i not in vectors]
+            if missing:
+                vectors.update(zip(missing, space.encode_documents([documents[i] for i in missing])))
+            return vectors
+
+        embeddings = {}
+        if to_encode:
+            for space in self.write_spaces():
+                embeddings[id(space)] = encode(space, to_encode)
+        # We do not store the document content itself for security reasons.
+        with self.write_lock:
+            keep = self._register_duplicates(ids, signatures, metadatas) if signatures is not None else list(range(len(ids)))
+            if keep:
+                for space in self.write_spaces():
+                    known = embeddings.setdefault(id(space), {})
+                    # The plan made before taking the lock can be outdated, e.g. a duplicate's original was deleted.
+                    missing = [i for i in keep if i not in known]
+                    if missing:
+                        known.update(encode(space, missing))
+                    space.upsert(
+                        [ids[i] for i in keep],
+                        [documents[i] for i in keep],
+                        [metadatas[i] for i in keep],
+                        embeddings=[known[i] for i in keep],
+                    )
+        if self.migration is not None:
+            self.migration.maybe_finish()
+        return len(ids) - len(keep)
+
+    def _register_duplicates(self, ids, signatures, metadatas) -> typing.List[int]:
+        """
+        Records each document in the near-duplicate registry; must hold `write_lock`.
 
-    async def upsert_document(self, doc_id: str, document: str) -> bool:
+        Returns:
+            List[int]: Positions of the documents that are canonical and must be stored.
+        """
+        keep = []
+        for i, doc_id in enumerate(ids):
+            # A changed document is registered again from scratch.
+            promoted = self.dedup.remove(doc_id)
+            if promoted is not None:
+                for space in self.write_spaces():
+                    space.rename(doc_id, promoted)
+            if self.dedup.add(doc_id, signatures[i], metadatas[i]) is None:
+                keep.append(i)
+            else:
+                for space in self.write_spaces():
+                    if doc_id in space.index:
+                        space.delete([doc_id])
+        return keep
+
+    async def upsert_document(self, doc_id: str, document: str, metadata: typing.Optional[dict] = None) -> bool:
         """
         Asynchronously upserts a document into the ChromaDB collection.
 
         Args:
             doc_id (str): The unique ID of the document to update.
             document (str): The text content for the document.
+            metadata (Optional[dict]): Structured attributes that query filters can match on.
         
         Returns:
             bool: True if upsert was successful, False otherwise.
         """
         try:
-            await asyncio.to_thread(self._blocking_upsert, doc_id, document)
+            record = upsert_record(DocumentPayload(id=doc_id, document=document, metadata=metadata))
+            await asyncio.to_thread(self.write_mutations, [record])
             bt.logging.info(f"Successfully upserted document with id: {doc_id}")
             return True
         except Exception as e:
             bt.logging.error(f"Failed to upsert document with id {doc_id}: {e}")
             return False
 
+    async def upsert_documents(self, documents: typing.List[DocumentPayload]) -> typing.Optional[dict]:
+        """
+        Asynchronously upserts a batch of documents, encoding them together.
+
+        Returns:
+            Optional[dict]: The number of documents and how many were stored as near-duplicate aliases
+            (None while they wait in the write-ahead log), or None if the upsert failed.
+        """
+        try:
+            records = [upsert_record(doc) for doc in documents]
+            duplicates = await asyncio.to_thread(self.write_mutations, records)
+            bt.logging.info(f"Successfully upserted {len(documents)} documents.")
+            return {"count": len(documents), "duplicates": duplicates}
+        except Exception as e:
+            bt.logging.error(f"Failed to upsert a batch of {len(documents)} documents: {e}")
+            return None
+
+    def write_mutations(self, records: typing.List[dict]) -> typing.Optional[int]:
+        """
+        Applies document mutations, or with `miner.wal` makes them durable in the write-ahead log.
+
+        Returns:
+            Optional[int]: How many upserts became near-duplicate aliases, or None if the
+            records were only logged and will be applied in the background.
+        """
+        if self.wal is not None:
+            self.wal.append(records)
+            return None
+        return self.apply_mutations(records)
+
+    def apply_mutations(self, records: typing.List[dict]) -> int:
+        """
+        Applies a batch of upsert/delete records, encoding all upserted documents together.
+
+        Only the last record for each id matters, so the batch is collapsed first.
+        """
+        latest = {}
+        for record in records:
+            latest.pop(record["id"], None)
+            latest[record["id"]] = record
+        for record in latest.values():
+            if record["op"] == "delete":
+                self._blocking_delete(record["id"])
+        upserts = [record for record in latest.values() if record["op"] == "upsert"]
+        if not upserts:
+            return 0
+        return self._blocking_upsert(
+            [record["id"] for record in upserts],
+            [record["document"] for record in upserts],
+            [record.get("metadata") for record in upserts],
+            records=upserts,
+        )
+
     def _blocking_delete(self, doc_id: str):
         """The synchronous, blocking part of the delete operation."""
-        self.collection.delete(ids=[doc_id])
+        with self.write_lock:
+            # Deleting a document that has near-duplicates hands its vector to one of them.
+            promoted = self.dedup.remove(doc_id) if self.dedup is not None else None
+            for space in self.write_spaces():
+                if promoted is not None:
+                    space.rename(doc_id, promoted)
+                else:
+                    space.delete([doc_id])
+        if self.migration is not None:
+            self.migration.maybe_finish()
 
     async def delete_document(self, doc_id: str) -> bool:
         """Asynchronously deletes a document from the ChromaDB collection using its ID."""
         try:
-            await asyncio.to_thread(self._blocking_delete, doc_id)
+            await asyncio.to_thread(self.write_mutations, [delete_record(doc_id)])
             bt.logging.info(f"Successfully deleted document with id: {doc_id}")
             return True
         except Exception as e:
             bt.logging.error(f"Failed to delete document with id {doc_id}: {e}")
             return False
 
+    def result_ids(self, space: EmbeddingSpace, keys: np.ndarray, k: int) -> typing.List[str]:
+        """Turns ranked document keys into ids, listing near-duplicate aliases after their canonical document."""
+        doc_ids = space.index.id_table.decode(keys)
+        if self.dedup is None:
+            return doc_ids
+        return self.dedup.expand(doc_ids, k)
+
+    async def forward_batch(
+        self, synapse: cers_subnet.protocol.EnterpriseRAGBatch
+    ) -> cers_subnet.protocol.EnterpriseRAGBatch:
+        """
+        Processes an 'EnterpriseRAGBatch' synapse, answering all of its queries together.
+
+        The queries are encoded in one model call and searched with one scan of the index
+        (`search_batch`); queries answered by the semantic cache skip the scan. Each query gets
+        its own top-k, capped at `miner.max_search_k`, and at most `miner.max_batch_queries`
+        queries are answered. Like `forward`, the scan stops at the validator's deadline and
+        returns the best partial results.
+
+        Args:
+            synapse (cers_subnet.protocol.EnterpriseRAGBatch): The synapse object containing the queries.
+
+        Returns:
+            cers_subnet.protocol.EnterpriseRAGBatch: The synapse object with one list of document IDs per query.
+        """
+        deadline = Deadline.from_synapse(synapse, margin=self.deadline_margin)
+        max_queries = self.config.get('miner.max_batch_queries', 64)
+        queries = synapse.queries[:max_queries]
+        if len(synapse.queries) > max_queries:
+            bt.logging.warning(f"Received {len(synapse.queries)} queries in one batch; answering the first {max_queries}.")
+        bt.logging.info(f"Received a batch of {len(queries)} queries.")
+        max_k = self.config.get('miner.max_search_k', 100)
+        ks = [min(max(int(k), 0), max_k) for k in synapse.k[: len(queries)]]
+        ks += [self.config.get('miner.search_k', 2)] * (len(queries) - len(ks))
+        where = synapse.filter
+
+        # Pin the serving space for this request so a model switch cannot mix models.
+        space = self.space
+
+        def _search_and_retrieve_batch() -> typing.List[typing.List[str]]:
+            if not queries:
+                return []
+            embeddings = space.encode_queries(queries)
+            if deadline.expired():
+                bt.logging.warning(f"Deadline reached after encoding queries ({deadline.elapsed():.3f}s). Returning no results.")
+                return [[] for _ in queries]
+
+            results: typing.List[typing.Optional[np.ndarray]] = [None] * len(queries)
+            cached: typing.Dict[int, np.ndarray] = {}
+            pending = []
+            for i in range(len(queries)):
+                hit = self.query_cache.get(space.index, embeddings[i], ks[i], where) if self.query_cache is not None else None
+                if hit is not None:
+                    keys, verify = hit
+                    if not verify:
+                        results[i] = keys
+                        continue
+                    cached[i] = keys
+                pending.append(i)
+
+            if pending:
+                fetch = max(ks[i] for i in pending)
+                if space.chunks.extra_chunks:
+                    fetch *= self.config.get('miner.chunk_overfetch', 4)
+                version = space.index.version
+                started = time.monotonic()
+                try:
+                    found = space.index.search_batch(embeddings[pending], fetch, deadline=deadline, where=where)
+                except ValueError as e:
+                    bt.logging.warning(f"Rejected query filter {where}: {e}")
+                    return [[] for _ in queries]
+                elapsed = (time.monotonic() - started) / len(pending)
+                for i, result in zip(pending, found):
+                    if self.tuner is not None:
+                        self.tuner.observe(space.index, embeddings[i], result.keys, fetch, elapsed, filtered=where is not None)
+                    results[i] = space.collapse(result.keys, ks[i])
+                    if result.complete and self.query_cache is not None:
+                        if i in cached:
+                            self.query_cache.record_agreement(cached[i], results[i])
+                        else:
+                            self.query_cache.put(
+                                space.index, version, embeddings[i], ks[i], where, results[i], SemanticCache.floor(result, fetch)
+                            )
+                if not all(result.complete for result in found):
+                    bt.logging.warning(f"Batch search stopped at the deadline after {deadline.elapsed():.3f}s; returning partial results.")
+            return [self.result_ids(space, keys, ks[i]) for i, keys in enumerate(results)]
+
+        self.queries_in_flight += 1
+        try:
+            synapse.document_ids = await asyncio.to_thread(_search_and_retrieve_batch)
+        finally:
+            self.queries_in_flight -= 1
+
+        bt.logging.info(f"Returning document IDs for {len(synapse.document_ids)} queries in {deadline.elapsed():.3f}s.")
+        return synapse
+
+    async def blacklist_batch(
+        self, synapse: cers_subnet.protocol.EnterpriseRAGBatch
+    ) -> typing.Tuple[bool, str]:
+        """Applies `blacklist` to batched requests."""
+        return await self.blacklist(synapse)
+
+    async def priority_batch(self, synapse: cers_subnet.protocol.EnterpriseRAGBatch) -> float:
+        """Applies `priority` to batched requests."""
+        return await self.priority(synapse)
+
     async def blacklist(
         self, synapse: cers_subnet.protocol.EnterpriseRAG
     ) -> typing.Tuple[bool, str]:
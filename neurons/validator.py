@@ -19,7 +19,11 @@
 import time
 import os
 import sys
+import typing
+import threading
+import traceback
 import torch
+import numpy as np
 
 # Bittensor
 import bittensor as bt
@@ -29,6 +33,12 @@ from cers_subnet.base.validator import BaseValidatorNeuron
 
 # Bittensor Validator Template:
 from cers_subnet.validator import forward
+from cers_subnet.validator.checkpoint import Checkpointer
+from cers_subnet.validator.dataset import BenchmarkDataset
+from cers_subnet.validator.latency import LatencyStats
+from cers_subnet.validator.metagraph import MetagraphFingerprint, diff_metagraph
+from cers_subnet.validator.sampler import CoverageSampler, UncertaintySampler
+from cers_subnet.validator.scheduler import ForwardScheduler
 from sentence_transformers import CrossEncoder
 
 
@@ -42,8 +52,32 @@ class Validator(BaseValidatorNeuron):
     """
 
     def __init__(self, config=None):
+        # Per-miner response times; created first because the base class syncs the metagraph.
+        self.latency_stats = LatencyStats()
+        # Forwards update scores on the event loop while the metagraph resync runs in a worker thread.
+        self.scores_lock = threading.Lock()
+        # Bumped on every change to the checkpointed state. The base class saves state while
+        # it initializes, before the checkpointer exists; those saves are skipped.
+        self.state_version = 0
+        self.checkpointer: typing.Optional[Checkpointer] = None
+        # Hotkey and endpoint hashes per UID as of the last resync.
+        self.metagraph_fingerprint: typing.Optional[MetagraphFingerprint] = None
+        # Parsed here rather than by the base class, whose metagraph sync already feeds the
+        # sampler: new hotkeys go first whichever sampler is configured.
+        config = config or self.config()
+        if config.get('validator.sampler', 'coverage') == 'uncertainty':
+            self.uid_sampler = UncertaintySampler(
+                floor=config.get('validator.sampler_floor', 0.25),
+                window=config.get('validator.sampler_window', 100),
+            )
+        else:
+            # Queries every available miner once per cycle.
+            self.uid_sampler = CoverageSampler()
         super(Validator, self).__init__(config=config)
 
+        self.checkpointer = Checkpointer(
+            self.config.neuron.full_path, interval=self.config.get('neuron.checkpoint_interval', 60.0)
+        )
         bt.logging.info("load_state()")
         self.load_state()
 
@@ -69,6 +103,26 @@ class Validator(BaseValidatorNeuron):
             bt.logging.error("No queries loaded. The validator requires queries to function.")
             sys.exit(1)
 
+        # Queries with known relevant documents, which the forward pass samples and scores against.
+        self.benchmark_dataset = self.load_benchmark_dataset()
+
+    def load_benchmark_dataset(self) -> typing.Optional[BenchmarkDataset]:
+        """Opens the benchmark dataset, compiling it into its memory-mapped form on first use."""
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        benchmark_path = os.path.join(root, self.config.get('validator.benchmark_file', 'data/benchmark.jsonl'))
+        qrels_file = self.config.get('validator.benchmark_qrels', None)
+        try:
+            dataset = BenchmarkDataset.load(
+                benchmark_path,
+                qrels=os.path.join(root, qrels_file) if qrels_file else None,
+                directory=self.config.get('validator.benchmark_cache', None),
+            )
+        except FileNotFoundError as e:
+            bt.logging.error(f"Benchmark dataset not found: {e}")
+            return None
+        bt.logging.info(f"Loaded a benchmark of {len(dataset)} queries from {benchmark_path}")
+        return dataset
+
     def load_queries(self) -> list[str]:
         """Loads queries from the data/queries.txt file."""
         queries_file = self.config.get('validator.queries_file', 'data/queries.txt')
@@ -98,6 +152,132 @@ class Validator(BaseValidatorNeuron):
         
         return queries
 
+    def resync_metagraph(self):
+        """
+        Resyncs the metagraph and updates the hotkeys, moving averages and latency statistics.
+
+        Changes are found by comparing per-UID hashes of hotkeys and axon endpoints instead of
+        copying the metagraph, and only the changed UIDs are touched. The chain query runs
+        without holding `scores_lock`, so forwards can keep scoring meanwhile; scores,
+        hotkeys and latency statistics only change under it, as they do in forwards.
+        """
+        bt.logging.info("resync_metagraph()")
+        # Without a fingerprint yet, compare against the hotkeys the scores were recorded for.
+        previous = self.metagraph_fingerprint or MetagraphFingerprint.of(self.hotkeys, self.metagraph.axons)
+        self.metagraph.sync(subtensor=self.subtensor)
+        current = MetagraphFingerprint.from_metagraph(self.metagraph)
+        self.metagraph_fingerprint = current
+        change = diff_metagraph(previous, current)
+        if change.empty:
+            return
+
+        bt.logging.info(
+            f"Metagraph updated: {change.replaced.size} replaced, {change.added.size} new and "
+            f"{change.moved.size} moved UIDs. Re-syncing hotkeys, moving averages and latencies."
+        )
+        with self.scores_lock:
+            if change.size > len(self.scores):
+                scores = np.zeros(change.size, dtype=np.float32)
+                scores[: len(self.scores)] = self.scores
+                self.scores = scores
+            # Zero out all hotkeys that have been replaced.
+            self.scores[change.replaced] = 0
+            hotkeys = list(self.hotkeys)
+            hotkeys.extend([None] * (change.size - len(hotkeys)))
+            for uid in np.concatenate([change.replaced, change.added]):
+                hotkeys[uid] = self.metagraph.hotkeys[uid]
+            self.hotkeys = hotkeys
+            # Response times measured at a miner's old endpoint say little about its new one.
+            self.latency_stats.reset(np.concatenate([change.replaced, change.moved]))
+            self.latency_stats.resize(change.size)
+            self.state_version += 1
+        self.uid_sampler.prioritize(np.concatenate([change.replaced, change.added]))
+
+    def update_scores(self, rewards: np.ndarray, uids: typing.List[int]):
+        with self.scores_lock:
+            super().update_scores(rewards, uids)
+            self.state_version += 1
+
+    def run(self):
+        """
+        Runs forwards in a sliding window until stopped.
+
+        Up to `neuron.num_concurrent_forwards` forwards are in flight at any time, and a new one
+        starts as soon as any finishes. Metagraph sync, weight setting and state saving run in
+        a worker thread after every `num_concurrent_forwards` completed forwards. `step` counts
+        completed forwards.
+        """
+        # Check that validator is registered on the network.
+        self.sync()
+        bt.logging.info(f"Validator starting at block: {self.block}")
+
+        def on_forward():
+            self.step += 1
+
+        scheduler = ForwardScheduler(
+            self.forward,
+            window=self.config.neuron.num_concurrent_forwards,
+            maintenance=self.sync,
+            should_exit=lambda: self.should_exit,
+            on_forward=on_forward,
+        )
+        try:
+            self.loop.run_until_complete(scheduler.run())
+
+        # If someone intentionally stops the validator, it'll safely terminate operations.
+        except KeyboardInterrupt:
+            self.axon.stop()
+            bt.logging.success("Validator killed by keyboard interrupt.")
+            exit()
+
+        except Exception as err:
+            bt.logging.error(f"Error during validation: {str(err)}")
+            bt.logging.debug(traceback.format_exc())
+
+    def checkpoint_state(self) -> typing.Dict[str, np.ndarray]:
+        """Copies of everything the validator checkpoints."""
+        with self.scores_lock:
+            return {
+                "step": np.asarray(self.step),
+                "scores": np.array(self.scores, dtype=np.float32),
+                "hotkeys": np.asarray(self.hotkeys, dtype=str),
+                **{name: np.array(values) for name, values in self.latency_stats.state().items()},
+            }
+
+    def save_state(self, force: bool = False):
+        """
+        Queues a checkpoint if the state changed and `neuron.checkpoint_interval` seconds have passed.
+
+        Called on every sync; the write itself happens in the checkpointer's thread.
+        """
+        if self.checkpointer is not None:
+            self.checkpointer.maybe_save(self.state_version, self.checkpoint_state, force=force)
+
+    def load_state(self):
+        """Restores the newest intact checkpoint; a validator without one starts fresh."""
+        state = self.checkpointer.load()
+        # The next resync compares the metagraph against the restored hotkeys.
+        self.metagraph_fingerprint = None
+        if state is None:
+            try:
+                # State saved by earlier versions, before checkpoints were checksummed.
+                super().load_state()
+            except (OSError, ValueError, KeyError) as e:
+                bt.logging.warning(f"No usable validator state found ({e}); starting fresh.")
+            return
+        self.step = int(state["step"])
+        self.scores = state["scores"]
+        self.hotkeys = state["hotkeys"].tolist()
+        if "latency_mean" in state:
+            self.latency_stats.load(state)
+        self.checkpointer.saved_version = self.state_version
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        super().__exit__(exc_type, exc_value, traceback)
+        # Keep what changed since the last periodic checkpoint.
+        self.save_state(force=True)
+        self.checkpointer.close(timeout=30)
+
     async def forward(self):
         """
         Validator forward pass. Consists of:
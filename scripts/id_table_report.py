@@ -0,0 +1,90 @@
+import time
+import uuid
+import argparse
+import tracemalloc
+
+from cers_subnet.miner.ids import IdTable
+
+
+def get_config():
+    """Parses command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Measures the memory and speed of the document id table."
+    )
+    parser.add_argument(
+        "--n", type=int, default=1000000, help="Number of document ids."
+    )
+    parser.add_argument(
+        "--k", type=int, default=10, help="Ids decoded per simulated response."
+    )
+    return parser.parse_args()
+
+
+class DictTable:
+    """What the indexes kept before the id table: a dict from id to row and a list of ids."""
+
+    def __init__(self):
+        self.keys = {}
+        self.strings = []
+
+    def intern(self, ids):
+        for doc_id in ids:
+            if doc_id not in self.keys:
+                self.keys[doc_id] = len(self.strings)
+                self.strings.append(doc_id)
+
+    def get(self, ids):
+        return [self.keys.get(doc_id, -1) for doc_id in ids]
+
+    def decode(self, keys):
+        return [self.strings[key] for key in keys]
+
+
+def fresh_ids(config):
+    """Ids arrive with requests in batches, so the table owns whatever it keeps of them."""
+    for first in range(0, config.n, 10000):
+        yield [
+            str(uuid.UUID(int=i))
+            for i in range(first, min(first + 10000, config.n))
+        ]
+
+
+def measure(make_table, config):
+    """Returns the bytes per id of a filled table and its intern, get and decode times."""
+    tracemalloc.start()
+    table = make_table()
+    for ids in fresh_ids(config):
+        table.intern(ids)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del table
+
+    # Timed again without tracemalloc, which slows allocations down.
+    table = make_table()
+    batches = list(fresh_ids(config))
+    started = time.perf_counter()
+    for ids in batches:
+        table.intern(ids)
+    intern_us = (time.perf_counter() - started) / config.n * 1e6
+    probe = [doc_id for ids in batches[::10] for doc_id in ids]
+    started = time.perf_counter()
+    table.get(probe)
+    get_us = (time.perf_counter() - started) / len(probe) * 1e6
+    started = time.perf_counter()
+    for first in range(0, 10000 * config.k, config.k):
+        table.decode(range(first % config.n, first % config.n + config.k))
+    decode_us = (time.perf_counter() - started) / 10000 * 1e6
+    return memory / config.n, intern_us, get_us, decode_us
+
+
+if __name__ == "__main__":
+    config = get_config()
+    print(f"{config.n} UUID document ids\n")
+    print(
+        f"{'table':<10}{'bytes/id':>10}{'intern us/id':>14}{'get us/id':>11}{f'decode {config.k} us':>14}"
+    )
+    for name, make_table in (("dict", DictTable), ("IdTable", IdTable)):
+        memory, intern_us, get_us, decode_us = measure(make_table, config)
+        print(
+            f"{name:<10}{memory:>10.0f}{intern_us:>14.2f}{get_us:>11.2f}{decode_us:>14.2f}"
+        )
@@ -0,0 +1,334 @@
+import os
+import csv
+import glob
+import json
+import struct
+import hashlib
+import argparse
+import concurrent.futures
+from typing import Iterator, List, Set, Tuple
+
+import numpy as np
+
+
+def get_config():
+    """Parses command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Labels benchmark queries with a cross-encoder and writes them in the validator's benchmark format."
+    )
+    parser.add_argument(
+        "--corpus",
+        default="data/documents.csv",
+        help="CSV file with `id` and `text` columns.",
+    )
+    parser.add_argument(
+        "--queries",
+        required=True,
+        help="Text file with one query per line, or JSONL with `query` or BEIR `_id`/`text`.",
+    )
+    parser.add_argument(
+        "--out",
+        required=True,
+        help="Benchmark JSONL to write. An existing file is resumed.",
+    )
+    parser.add_argument(
+        "--retriever",
+        default="all-MiniLM-L6-v2",
+        help="Sentence-transformer that picks the candidates.",
+    )
+    parser.add_argument(
+        "--cross-encoder",
+        default="cross-encoder/ms-marco-MiniLM-L-6-v2",
+        help="Model that scores the candidates.",
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        default=50,
+        help="Documents scored per query.",
+    )
+    parser.add_argument(
+        "--thresholds",
+        type=float,
+        nargs="+",
+        default=[0.0, 3.0, 6.0],
+        help="Cross-encoder scores at which a document reaches grade 1, 2, 3, ...",
+    )
+    parser.add_argument(
+        "--min-grade",
+        type=int,
+        default=1,
+        help="Lowest grade listed in `relevant_docs`.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Cross-encoder processes.",
+    )
+    parser.add_argument(
+        "--device",
+        default="cpu",
+        help="Device of the cross-encoder in every worker.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=64,
+        help="Pairs per cross-encoder batch.",
+    )
+    parser.add_argument(
+        "--queries-per-task",
+        type=int,
+        default=16,
+        help="Queries sent to a worker at a time.",
+    )
+    return parser.parse_args()
+
+
+def read_corpus(path: str) -> Tuple[List[str], List[str]]:
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    return [row["id"] for row in rows], [row["text"] for row in rows]
+
+
+def read_queries(path: str) -> List[Tuple[str, str]]:
+    """Returns (query id, text) pairs; queries from a text file are numbered by line."""
+    with open(path, "r", encoding="utf-8") as f:
+        if not path.endswith(".jsonl"):
+            return [
+                (str(i), line.strip())
+                for i, line in enumerate(f)
+                if line.strip()
+            ]
+        queries = []
+        for i, line in enumerate(f):
+            if line.strip():
+                record = json.loads(line)
+                queries.append(
+                    (
+                        str(record.get("_id", i)),
+                        record.get("text", record.get("query")),
+                    )
+                )
+        return queries
+
+
+def skipped_path(out: str) -> str:
+    """Where queries without any document of `--min-grade` are recorded instead of `out`."""
+    return out + ".skipped"
+
+
+def _read_query_ids(path: str, done: Set[str]) -> None:
+    if not os.path.exists(path):
+        return
+    valid = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["query_id"])
+            except (ValueError, KeyError):
+                break
+            valid += len(line)
+    with open(path, "r+b") as f:
+        f.truncate(valid)
+
+
+def completed_queries(path: str) -> Set[str]:
+    """Ids of queries already written to `path` or skipped; a line cut off by a crash is dropped."""
+    done: Set[str] = set()
+    _read_query_ids(path, done)
+    _read_query_ids(skipped_path(path), done)
+    return done
+
+
+def corpus_cache_path(config, doc_texts: List[str]) -> str:
+    """Where the corpus embeddings of `--retriever` are cached, keyed on a hash of the corpus texts."""
+    digest = hashlib.sha256()
+    for text in doc_texts:
+        raw = text.encode("utf-8")
+        digest.update(struct.pack("<Q", len(raw)))
+        digest.update(raw)
+    return f"{config.out}.corpus-{config.retriever.replace('/', '_')}-{digest.hexdigest()[:16]}.npy"
+
+
+def retrieve_candidates(
+    config, doc_texts: List[str], queries: List[str]
+) -> np.ndarray:
+    """Top `--candidates` corpus rows per query by embedding similarity; the corpus embeddings are cached next to the output."""
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(config.retriever)
+    cache = corpus_cache_path(config, doc_texts)
+    if os.path.exists(cache):
+        corpus = np.load(cache)
+    else:
+        corpus = model.encode(
+            doc_texts,
+            batch_size=256,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        ).astype(np.float32)
+        # Embeddings of an earlier version of the corpus are of no further use.
+        for stale in glob.glob(
+            f"{config.out}.corpus-{config.retriever.replace('/', '_')}-*.npy"
+        ):
+            os.remove(stale)
+        np.save(cache, corpus)
+    encoded = model.encode(
+        queries,
+        batch_size=256,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    ).astype(np.float32)
+    k = min(config.candidates, len(doc_texts))
+    candidates = np.empty((len(queries), k), dtype=np.int64)
+    for start in range(0, len(queries), 1024):
+        scores = encoded[start : start + 1024] @ corpus.T
+        candidates[start : start + 1024] = np.argpartition(
+            -scores, k - 1, axis=1
+        )[:, :k]
+    return candidates
+
+
+_cross_encoder = None
+
+
+def _load_cross_encoder(model_name: str, device: str) -> None:
+    global _cross_encoder
+    from sentence_transformers import CrossEncoder
+
+    _cross_encoder = CrossEncoder(model_name, device=device)
+
+
+def _score(
+    task: List[Tuple[str, str, List[str]]], batch_size: int
+) -> List[np.ndarray]:
+    """Scores every (query, candidate) pair of a task in batches; runs in a worker process."""
+    pairs = [(query, text) for _, query, texts in task for text in texts]
+    scores = np.asarray(
+        _cross_encoder.predict(pairs, batch_size=batch_size), dtype=np.float32
+    )
+    return np.split(
+        scores, np.cumsum([len(texts) for _, _, texts in task])[:-1]
+    )
+
+
+def grade(scores: np.ndarray, thresholds: List[float]) -> np.ndarray:
+    """Graded relevance: the number of thresholds each score reaches."""
+    return np.searchsorted(np.sort(thresholds), scores, side="right")
+
+
+def tasks(
+    queries, candidates, doc_texts, done: Set[str], size: int
+) -> Iterator[List[Tuple[str, str, List[str]]]]:
+    task = []
+    for (query_id, query), rows in zip(queries, candidates):
+        if query_id in done:
+            continue
+        task.append((query_id, query, [doc_texts[row] for row in rows]))
+        if len(task) == size:
+            yield task
+            task = []
+    if task:
+        yield task
+
+
+def label(
+    config,
+    doc_ids: List[str],
+    doc_texts: List[str],
+    queries,
+    candidates,
+    done: Set[str],
+    pool,
+) -> int:
+    """
+    Scores the candidates of every query not in `done` on `pool` and appends the labels to `--out`.
+
+    A query with no candidate of `--min-grade` has no relevant documents to score miners
+    on, so it goes to the `skipped_path` file instead, which only marks it as done.
+
+    Returns the number of queries labeled or skipped in total.
+    """
+    rows_of = {
+        query_id: rows for (query_id, _), rows in zip(queries, candidates)
+    }
+    labeled = len(done)
+    total = labeled + sum(1 for query_id, _ in queries if query_id not in done)
+    pending = tasks(
+        queries, candidates, doc_texts, done, config.queries_per_task
+    )
+    with open(config.out, "a", encoding="utf-8") as out, open(
+        skipped_path(config.out), "a", encoding="utf-8"
+    ) as skipped:
+        # Keep a bounded number of tasks in flight so the candidate texts of every query are never in memory at once.
+        futures = {}
+        for task in pending:
+            futures[pool.submit(_score, task, config.batch_size)] = task
+            if len(futures) >= 2 * config.workers:
+                break
+        while futures:
+            finished, _ = concurrent.futures.wait(
+                futures, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in finished:
+                task = futures.pop(future)
+                for (query_id, query, _), scores in zip(task, future.result()):
+                    rows = rows_of[query_id]
+                    grades = grade(scores, config.thresholds)
+                    labels = {
+                        doc_ids[rows[i]]: int(grades[i])
+                        for i in np.argsort(-scores)
+                        if grades[i] > 0
+                    }
+                    record = {
+                        "query_id": query_id,
+                        "query": query,
+                        "relevant_docs": [
+                            doc_id
+                            for doc_id, g in labels.items()
+                            if g >= config.min_grade
+                        ],
+                        "grades": labels,
+                    }
+                    target = out if record["relevant_docs"] else skipped
+                    target.write(json.dumps(record) + "\n")
+                labeled += len(task)
+                next_task = next(pending, None)
+                if next_task is not None:
+                    futures[
+                        pool.submit(_score, next_task, config.batch_size)
+                    ] = next_task
+            # Every finished task is a checkpoint: a restart skips the queries written so far.
+            for f in (out, skipped):
+                f.flush()
+                os.fsync(f.fileno())
+            print(f"Labeled {labeled}/{total} queries.", flush=True)
+    return labeled
+
+
+if __name__ == "__main__":
+    config = get_config()
+    doc_ids, doc_texts = read_corpus(config.corpus)
+    queries = read_queries(config.queries)
+    done = completed_queries(config.out)
+    print(
+        f"{len(queries)} queries, {len(doc_ids)} documents, {len(done)} queries already labeled."
+    )
+    # Only the queries left to label are encoded and given candidates.
+    queries = [
+        (query_id, query)
+        for query_id, query in queries
+        if query_id not in done
+    ]
+
+    candidates = retrieve_candidates(
+        config, doc_texts, [query for _, query in queries]
+    )
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=config.workers,
+        initializer=_load_cross_encoder,
+        initargs=(config.cross_encoder, config.device),
+    ) as pool:
+        label(config, doc_ids, doc_texts, queries, candidates, done, pool)
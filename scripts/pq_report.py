@@ -0,0 +1,138 @@
+import os
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+from cers_subnet.miner.index import FlatIndex
+from cers_subnet.miner.pq import PQIndex
+
+
+def get_config():
+    """Parses command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Compares the PQ index backend with exact search."
+    )
+    parser.add_argument(
+        "--embeddings",
+        help="Path to an .npy file of document embeddings. Synthetic data is used if omitted.",
+    )
+    parser.add_argument(
+        "--n", type=int, default=100000, help="Number of synthetic documents."
+    )
+    parser.add_argument(
+        "--dim",
+        type=int,
+        default=384,
+        help="Dimension of synthetic embeddings.",
+    )
+    parser.add_argument(
+        "--queries",
+        type=int,
+        default=200,
+        help="Number of queries to measure.",
+    )
+    parser.add_argument(
+        "--k", type=int, default=10, help="Number of results per query."
+    )
+    parser.add_argument(
+        "--m",
+        type=int,
+        nargs="+",
+        default=[16, 32, 48, 64],
+        help="Bytes per vector to try.",
+    )
+    parser.add_argument(
+        "--rerank",
+        type=int,
+        nargs="+",
+        default=[0, 100],
+        help="Exact re-rank depths to try.",
+    )
+    parser.add_argument(
+        "--train-size",
+        type=int,
+        default=65536,
+        help="Vectors used to train the codebooks.",
+    )
+    return parser.parse_args()
+
+
+def load_embeddings(config) -> np.ndarray:
+    """Loads embeddings from disk, or draws clustered vectors that resemble sentence embeddings."""
+    if config.embeddings:
+        return np.load(config.embeddings, mmap_mode="r").astype(np.float32)
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((max(config.n // 100, 1), config.dim))
+    noise = 0.6 * rng.standard_normal((config.n, config.dim))
+    return (centers[rng.integers(0, len(centers), config.n)] + noise).astype(
+        np.float32
+    )
+
+
+def measure(index, queries: np.ndarray, k: int):
+    """Runs every query and returns (results, latencies in ms)."""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(index.search(query, k).keys)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return results, np.asarray(latencies)
+
+
+if __name__ == "__main__":
+    config = get_config()
+    embeddings = load_embeddings(config)
+    ids = [str(i) for i in range(len(embeddings))]
+    rng = np.random.default_rng(1)
+    queries = embeddings[
+        rng.choice(len(embeddings), config.queries, replace=False)
+    ]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype(
+        np.float32
+    )
+    print(
+        f"{len(embeddings)} documents, {embeddings.shape[1]} dimensions, {config.queries} queries, k={config.k}\n"
+    )
+
+    exact = FlatIndex()
+    exact.upsert(ids, embeddings)
+    truth, latencies = measure(exact, queries, config.k)
+    rows = [("flat", "-", "-", 1.0, latencies, exact.memory_bytes())]
+
+    with tempfile.TemporaryDirectory() as directory:
+        for m in config.m:
+            for rerank in config.rerank:
+                index = PQIndex(
+                    os.path.join(directory, f"pq-{m}-{rerank}"),
+                    m=m,
+                    rerank=rerank,
+                    train_size=min(config.train_size, len(embeddings)),
+                    id_table=exact.id_table,
+                )
+                index.upsert(ids, embeddings)
+                index.wait_for_training()
+                results, latencies = measure(index, queries, config.k)
+                recall = np.mean(
+                    [
+                        len(set(a) & set(b)) / config.k
+                        for a, b in zip(results, truth)
+                    ]
+                )
+                rows.append(
+                    ("pq", m, rerank, recall, latencies, index.memory_bytes())
+                )
+
+    print(
+        f"{'backend':<8}{'bytes':>6}{'rerank':>8}{'recall@k':>10}{'p50 ms':>9}{'p99 ms':>9}{'RAM MiB':>10}"
+    )
+    for backend, m, rerank, recall, latencies, memory in rows:
+        print(
+            f"{backend:<8}{m:>6}{rerank:>8}{recall:>10.3f}"
+            f"{np.percentile(latencies, 50):>9.2f}{np.percentile(latencies, 99):>9.2f}{memory / 2**20:>10.1f}"
+        )
+    print(
+        "\nRAM is what the index itself holds (vectors or codes, row bookkeeping and the id table). "
+        "It leaves out the memory-mapped vectors and ChromaDB, which the miner also stores every vector in."
+    )
@@ -0,0 +1,108 @@
+import time
+import argparse
+import threading
+
+import numpy as np
+
+from cers_subnet.miner.index import FlatIndex
+from cers_subnet.miner.segments import SegmentedIndex
+
+
+def get_config():
+    """Parses command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Measures search latency while documents are bulk loaded."
+    )
+    parser.add_argument(
+        "--n",
+        type=int,
+        default=200000,
+        help="Documents in the index before the bulk load.",
+    )
+    parser.add_argument(
+        "--load",
+        type=int,
+        default=200000,
+        help="Documents written during the bulk load.",
+    )
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=1000,
+        help="Documents per upsert call of the bulk load.",
+    )
+    parser.add_argument(
+        "--dim", type=int, default=384, help="Embedding dimension."
+    )
+    parser.add_argument(
+        "--k", type=int, default=10, help="Number of results per query."
+    )
+    parser.add_argument(
+        "--merge-rows",
+        type=int,
+        default=10000,
+        help="Delta segment size that triggers a merge.",
+    )
+    return parser.parse_args()
+
+
+def vectors(rng, n: int, dim: int) -> np.ndarray:
+    return rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def measure(index, rng, config, load: bool):
+    """Runs queries until the bulk load (if any) finishes; returns latencies in ms and the load's duration."""
+    done = threading.Event()
+    elapsed = [0.0]
+
+    def bulk_load():
+        start = time.perf_counter()
+        load_rng = np.random.default_rng(2)
+        for first in range(0, config.load, config.batch):
+            count = min(config.batch, config.load - first)
+            index.upsert(
+                [f"new{first + i}" for i in range(count)],
+                vectors(load_rng, count, config.dim),
+            )
+        elapsed[0] = time.perf_counter() - start
+        done.set()
+
+    if load:
+        threading.Thread(target=bulk_load, daemon=True).start()
+    latencies = []
+    while (load and not done.is_set()) or (not load and len(latencies) < 500):
+        query = vectors(rng, 1, config.dim)[0]
+        start = time.perf_counter()
+        index.search(query, config.k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.asarray(latencies), elapsed[0]
+
+
+def build(segmented: bool, config):
+    main = FlatIndex()
+    main.upsert(
+        [str(i) for i in range(config.n)],
+        vectors(np.random.default_rng(0), config.n, config.dim),
+    )
+    if segmented:
+        return SegmentedIndex(main, merge_rows=config.merge_rows)
+    return main
+
+
+if __name__ == "__main__":
+    config = get_config()
+    rng = np.random.default_rng(1)
+    print(
+        f"{config.n} documents, {config.dim} dimensions, bulk load of {config.load} in batches of {config.batch}\n"
+    )
+    print(
+        f"{'index':<12}{'phase':<8}{'queries':>9}{'p50 ms':>9}{'p99 ms':>9}{'load s':>9}"
+    )
+    for name, segmented in (("flat", False), ("segmented", True)):
+        index = build(segmented, config)
+        for phase, load in (("idle", False), ("loading", True)):
+            latencies, elapsed = measure(index, rng, config, load)
+            print(
+                f"{name:<12}{phase:<8}{len(latencies):>9}{np.percentile(latencies, 50):>9.2f}"
+                f"{np.percentile(latencies, 99):>9.2f}{elapsed if load else 0:>9.1f}"
+            )
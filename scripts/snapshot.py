@@ -0,0 +1,120 @@
+import os
+import json
+import argparse
+
+import numpy as np
+
+from cers_subnet.miner.snapshot import (
+    export_snapshot,
+    fetch_snapshot,
+    verify_snapshot,
+)
+from cers_subnet.miner.space import EmbeddingSpace
+
+
+def get_config():
+    """Parses command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Exports, verifies and downloads miner index snapshots."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser(
+        "export", help="Exports the active collection of a miner's database."
+    )
+    export.add_argument(
+        "--db-path",
+        default="./chroma_db",
+        help="The miner's ChromaDB directory.",
+    )
+    export.add_argument(
+        "--out", required=True, help="Directory to write the snapshot to."
+    )
+    export.add_argument(
+        "--model",
+        default="all-MiniLM-L6-v2",
+        help="Embedding model, if the miner never migrated.",
+    )
+    export.add_argument(
+        "--collection",
+        default="enterprise-rag",
+        help="Collection name, if the miner never migrated.",
+    )
+    export.add_argument(
+        "--batch-size",
+        type=int,
+        default=10000,
+        help="Documents read per batch.",
+    )
+
+    verify = commands.add_parser(
+        "verify", help="Checks a snapshot against its manifest."
+    )
+    verify.add_argument("directory", help="The snapshot directory.")
+
+    fetch = commands.add_parser(
+        "fetch", help="Downloads a snapshot from a running miner's API."
+    )
+    fetch.add_argument(
+        "url", help="Base URL of the miner's API, e.g. http://10.0.0.5:8001."
+    )
+    fetch.add_argument(
+        "--out", required=True, help="Directory to write the snapshot to."
+    )
+    return parser.parse_args()
+
+
+def collection_batches(collection, batch_size: int):
+    """Yields (ids, embeddings, metadatas) for every document of a ChromaDB collection."""
+    for offset in range(0, collection.count(), batch_size):
+        page = collection.get(
+            include=["embeddings", "metadatas"],
+            limit=batch_size,
+            offset=offset,
+        )
+        if page["ids"]:
+            yield (
+                page["ids"],
+                np.asarray(page["embeddings"], dtype=np.float32),
+                [
+                    EmbeddingSpace.decode_metadata(stored)
+                    for stored in page["metadatas"]
+                ],
+            )
+
+
+if __name__ == "__main__":
+    config = get_config()
+    if config.command == "export":
+        import chromadb
+
+        # The miner records its active model and collection after every migration.
+        try:
+            with open(
+                os.path.join(config.db_path, "embedding_space.json"),
+                "r",
+                encoding="utf-8",
+            ) as f:
+                active = json.load(f)
+        except FileNotFoundError:
+            active = {"model": config.model, "collection": config.collection}
+        collection = chromadb.PersistentClient(
+            path=config.db_path
+        ).get_collection(active["collection"])
+        manifest = export_snapshot(
+            collection_batches(collection, config.batch_size),
+            config.out,
+            active["model"],
+            duplicates=os.path.join(config.db_path, "duplicates.jsonl"),
+            chunking=(
+                active.get("chunk_tokens", 0),
+                active.get("chunk_overlap", 0),
+            ),
+        )
+    elif config.command == "verify":
+        manifest = verify_snapshot(config.directory)
+    else:
+        manifest = fetch_snapshot(
+            config.url, config.out, api_key=os.getenv("SNAPSHOT_API_KEY")
+        )
+    print(json.dumps(manifest, indent=2))
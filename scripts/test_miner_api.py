@@ -27,7 +27,7 @@ def test_upsert_document(base_url: str):
     
     url = f"{base_url}/documents"
     headers = {"X-API-Key": API_KEY}
-    payload = {"id": doc_id, "document": doc_content}
+    payload = {"id": doc_id, "document": doc_content, "metadata": {"department": "engineering", "acl": ["research"]}}
 
     print(f"Attempting to upsert document with ID: {doc_id}")
     
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from cers_subnet.miner.index import BaseIndex, FlatIndex
+from cers_subnet.miner.segments import SegmentedIndex
+from cers_subnet.validator.reward import get_batch_rewards
+
+
+def test_search_batch_matches_single_queries():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 16)).astype(np.float32)
+    queries = rng.normal(size=(6, 16)).astype(np.float32)
+    for index in (
+        FlatIndex(block_size=64),
+        SegmentedIndex(FlatIndex(block_size=64)),
+    ):
+        index.upsert([f"doc{i}" for i in range(500)], vectors)
+        index.delete(["doc3", "doc42"])
+        for query, result in zip(queries, index.search_batch(queries, 5)):
+            expected = index.search(query, 5)
+            assert result.keys.tolist() == expected.keys.tolist()
+            assert np.allclose(result.scores, expected.scores)
+
+
+class PerQueryIndex(FlatIndex):
+    _score_batch = BaseIndex._score_batch
+
+
+def test_search_batch_falls_back_to_single_queries():
+    with pytest.raises(TypeError):
+        BaseIndex()
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(300, 8)).astype(np.float32)
+    queries = rng.normal(size=(3, 8)).astype(np.float32)
+    index = PerQueryIndex(block_size=32)
+    index.upsert([f"doc{i}" for i in range(300)], vectors)
+    for query, result in zip(queries, index.search_batch(queries, 5)):
+        assert result.keys.tolist() == index.search(query, 5).keys.tolist()
+
+
+class Config(dict):
+    def get(self, key, default=None):
+        return super().get(key, default)
+
+
+def response(document_ids, success=True, process_time=0.1):
+    return SimpleNamespace(
+        document_ids=document_ids,
+        dendrite=SimpleNamespace(
+            is_success=success, process_time=process_time
+        ),
+    )
+
+
+def test_batch_rewards_average_the_metric_over_queries():
+    validator = SimpleNamespace(config=Config({"validator.latency_weight": 0}))
+    responses = [
+        response([["a", "x"], ["b"]]),
+        response([["x", "a"], []]),
+        response([["a"], ["b"]], success=False),
+    ]
+    rewards = get_batch_rewards(validator, [{"a"}, {"b"}], responses)
+    assert np.allclose(rewards, [1.0, 0.25, 0.0])
@@ -0,0 +1,89 @@
+import numpy as np
+
+from cers_subnet.miner import filters
+from cers_subnet.miner.binary import BinaryPrefilter, binarize
+from cers_subnet.miner.index import FlatIndex
+
+
+def clustered(rng, n, dim=96, clusters=30):
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    return centers[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal(
+        (n, dim)
+    ).astype(np.float32)
+
+
+def test_binarize_packs_signs_little_endian_with_zero_padding():
+    vector = np.full(70, -1.0, dtype=np.float32)
+    vector[[0, 3, 64, 69]] = 1.0
+    codes = binarize(vector)
+    assert codes.shape == (1, 2) and codes.dtype == np.uint64
+    assert codes[0].tolist() == [0b1001, (1 << 0) | (1 << 5)]
+
+
+def test_prefilter_shortlists_by_hamming_distance(monkeypatch):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 96)).astype(np.float32)
+    prefilter = BinaryPrefilter(shortlist=20)
+    prefilter.resize(500, 0, 96)
+    prefilter.write(np.arange(500), vectors)
+    live = np.ones(500, dtype=bool)
+    live[7] = False
+    query = rng.standard_normal(96).astype(np.float32)
+    distances = ((vectors > 0) != (query > 0)).sum(axis=1)
+    distances[7] = 10**6
+
+    for bitwise_count in (True, False):
+        if not bitwise_count:
+            # The lookup-table popcount used on NumPy versions without np.bitwise_count.
+            monkeypatch.delattr(np, "bitwise_count", raising=False)
+        rows, complete = prefilter.select(
+            query, [slice(0, 250), slice(250, 500)], live, 5
+        )
+        assert complete and len(rows) == 20 and 7 not in rows.tolist()
+        assert sorted(distances[rows].tolist()) == sorted(distances)[:20]
+        assert filters.popcount(binarize(query) ^ binarize(-query)).sum() == 96
+
+
+def test_prefiltered_search_keeps_recall_and_filters():
+    rng = np.random.default_rng(1)
+    vectors = clustered(rng, 3000)
+    ids = [f"d{i}" for i in range(len(vectors))]
+    metadatas = [{"team": str(i % 3)} for i in range(len(vectors))]
+    exact = FlatIndex()
+    exact.upsert(ids, vectors, metadatas)
+    prefiltered = FlatIndex(
+        prefilter=BinaryPrefilter(shortlist=200), id_table=exact.id_table
+    )
+    prefiltered.upsert(ids, vectors, metadatas)
+    prefiltered.delete(["d5"])
+    exact.delete(["d5"])
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    hits = 0
+    query_rng = np.random.default_rng(2)
+    queries = vectors[
+        query_rng.integers(0, len(vectors), 40)
+    ] + 0.5 * query_rng.standard_normal((40, 96)).astype(np.float32)
+    for query in queries:
+        truth = exact.search(query, 10).keys.tolist()
+        found = prefiltered.search(query, 10)
+        hits += len(set(truth) & set(found.keys.tolist()))
+        # Survivors are re-scored with the full vectors, so their scores are exact.
+        rows = [
+            int(doc_id[1:]) for doc_id in exact.id_table.decode(found.keys)
+        ]
+        cosines = normalized[rows] @ (query / np.linalg.norm(query))
+        np.testing.assert_allclose(found.scores, cosines, rtol=1e-5, atol=1e-6)
+        filtered = prefiltered.search(query, 10, where={"team": "1"}).keys
+        assert all(
+            int(doc_id[1:]) % 3 == 1
+            for doc_id in exact.id_table.decode(filtered)
+        )
+    assert hits / (10 * len(queries)) >= 0.9
+    assert "d5" not in exact.id_table.decode(
+        prefiltered.search(vectors[5], 10).keys
+    )
+    # 96 sign bits take 2 words, 16 bytes per vector against 384 for float32.
+    assert prefiltered.prefilter.memory_bytes() == 16 * len(
+        prefiltered.prefilter._codes
+    )
@@ -0,0 +1,139 @@
+import numpy as np
+
+from cers_subnet.miner.cache import SemanticCache
+from cers_subnet.miner.index import FlatIndex
+from cers_subnet.miner.segments import SegmentedIndex
+
+
+def unit(rng, dim=16):
+    vector = rng.standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def cached_search(cache, index, query, k, where=None):
+    """Searches like the miner does: answer hits from the cache and cache complete misses."""
+    hit = cache.get(index, query, k, where)
+    if hit is not None:
+        return hit[0].tolist(), True
+    version = index.version
+    result = index.search(query, k, where=where)
+    cache.put(
+        index,
+        version,
+        query,
+        k,
+        where,
+        result.keys,
+        SemanticCache.floor(result, k),
+    )
+    return result.keys.tolist(), False
+
+
+def test_unrelated_writes_keep_entries_and_related_ones_evict_them():
+    rng = np.random.default_rng(0)
+    index = FlatIndex()
+    index.upsert(
+        [f"d{i}" for i in range(50)], np.stack([unit(rng) for _ in range(50)])
+    )
+    cache = SemanticCache(capacity=8, threshold=0.99, sample_rate=0.0)
+    query = unit(rng)
+    keys, hit = cached_search(cache, index, query, 3)
+    assert not hit
+    # A document far from the query does not change its top 3.
+    index.upsert(["far"], -query[None, :])
+    assert cached_search(cache, index, query, 3) == (keys, True)
+    # A document closer than the third result does.
+    index.upsert(["near"], query[None, :])
+    fresh, hit = cached_search(cache, index, query, 3)
+    assert not hit and index.id_table.decode(fresh[:1]) == ["near"]
+    # So does deleting one of the results.
+    assert cached_search(cache, index, query, 3) == (fresh, True)
+    index.delete(index.id_table.decode(fresh[2:]))
+    assert not cached_search(cache, index, query, 3)[1]
+    assert cache.status()["evictions"] == 2
+
+
+def test_lookups_check_every_close_entry_for_a_matching_filter_and_k():
+    rng = np.random.default_rng(1)
+    index = FlatIndex()
+    index.upsert(
+        [f"d{i}" for i in range(40)],
+        np.stack([unit(rng) for _ in range(40)]),
+        [{"team": i % 2} for i in range(40)],
+    )
+    cache = SemanticCache(capacity=8, threshold=0.95, sample_rate=0.0)
+    query = unit(rng)
+    even, _ = cached_search(cache, index, query, 4, {"team": 0})
+    odd, _ = cached_search(cache, index, query, 4, {"team": 1})
+    assert cached_search(cache, index, query, 4, {"team": 0}) == (even, True)
+    assert cached_search(cache, index, query, 4, {"team": 1}) == (odd, True)
+    # A shorter result is the start of the longer one.
+    assert cached_search(cache, index, query, 2, {"team": 1}) == (
+        odd[:2],
+        True,
+    )
+    assert not cached_search(cache, index, query, 5, {"team": 1})[1]
+
+
+def test_results_that_missed_a_relevant_write_are_not_cached():
+    rng = np.random.default_rng(2)
+    index = FlatIndex()
+    index.upsert(
+        [f"d{i}" for i in range(20)], np.stack([unit(rng) for _ in range(20)])
+    )
+    cache = SemanticCache(capacity=8, threshold=0.99, sample_rate=0.0)
+    cache.get(index, unit(rng), 2)
+    query = unit(rng)
+    version = index.version
+    result = index.search(query, 2)
+    index.upsert(["far"], -query[None, :])
+    cache.put(
+        index,
+        version,
+        query,
+        2,
+        None,
+        result.keys,
+        SemanticCache.floor(result, 2),
+    )
+    assert cache.get(index, query, 2) is not None
+
+    other = unit(rng)
+    version = index.version
+    result = index.search(other, 2)
+    index.upsert(["near"], other[None, :])
+    cache.put(
+        index,
+        version,
+        other,
+        2,
+        None,
+        result.keys,
+        SemanticCache.floor(result, 2),
+    )
+    assert cache.get(index, other, 2) is None
+
+
+def test_cached_results_match_fresh_searches_under_ingestion():
+    rng = np.random.default_rng(3)
+    index = SegmentedIndex(FlatIndex(), merge_rows=50, merge_interval=0.01)
+    index.upsert(
+        [f"d{i}" for i in range(200)],
+        np.stack([unit(rng) for _ in range(200)]),
+    )
+    cache = SemanticCache(capacity=16, threshold=0.999, sample_rate=0.0)
+    queries = [unit(rng) for _ in range(10)]
+    hits = 0
+    for step in range(1000):
+        if rng.random() < 0.3:
+            doc_id = f"d{rng.integers(0, 250)}"
+            if rng.random() < 0.8:
+                index.upsert([doc_id], unit(rng)[None, :])
+            else:
+                index.delete([doc_id])
+        query = queries[rng.integers(0, len(queries))]
+        keys, hit = cached_search(cache, index, query, 5)
+        hits += hit
+        assert keys == index.search(query, 5).keys.tolist()
+    # Most writes leave most entries alone, so the cache keeps answering while documents arrive.
+    assert hits > 500
@@ -0,0 +1,34 @@
+import numpy as np
+
+from cers_subnet.validator.checkpoint import Checkpointer
+
+
+def test_checkpointer_writes_in_background_and_falls_back_to_previous(
+    tmp_path,
+):
+    checkpointer = Checkpointer(str(tmp_path), interval=3600)
+    first = {
+        "step": np.asarray(1),
+        "scores": np.array([0.5, 0.25], dtype=np.float32),
+    }
+    assert checkpointer.maybe_save(1, lambda: first, force=True)
+    # Within the interval, and with an unchanged version, nothing is queued.
+    assert not checkpointer.maybe_save(2, lambda: first)
+    assert checkpointer.flush(timeout=5)
+    assert not checkpointer.maybe_save(1, lambda: first, force=True)
+
+    second = {
+        "step": np.asarray(2),
+        "scores": np.array([0.75, 0.0], dtype=np.float32),
+    }
+    assert checkpointer.maybe_save(2, lambda: second, force=True)
+    checkpointer.close(timeout=5)
+    assert int(checkpointer.load()["step"]) == 2
+
+    # A torn or corrupted newest checkpoint is skipped in favour of the previous one.
+    data = bytearray((tmp_path / "state.ckpt").read_bytes())
+    data[-5] ^= 0xFF
+    (tmp_path / "state.ckpt").write_bytes(bytes(data))
+    restored = Checkpointer(str(tmp_path)).load()
+    assert int(restored["step"]) == 1
+    np.testing.assert_array_equal(restored["scores"], first["scores"])
@@ -0,0 +1,46 @@
+import numpy as np
+
+from cers_subnet.miner.chunking import (
+    ChunkMap,
+    Chunker,
+    chunk_id,
+    split_chunk_id,
+)
+from cers_subnet.miner.index import FlatIndex
+
+
+def test_chunker_splits_into_overlapping_windows():
+    chunker = Chunker(max_tokens=4, overlap=1)
+    text = " ".join(f"w{i}" for i in range(10))
+    assert chunker.split("short text") == ["short text"]
+    assert chunker.split(text) == ["w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7 w8 w9"]
+    assert split_chunk_id(chunk_id("doc", 2)) == ("doc", 2)
+    assert chunk_id("doc", 0) == "doc"
+
+
+def test_chunk_hits_collapse_to_documents_by_best_chunk():
+    index = FlatIndex()
+    vectors = np.eye(4, dtype=np.float32)
+    stored = [
+        chunk_id("a", 0),
+        chunk_id("a", 1),
+        chunk_id("b", 0),
+        chunk_id("c", 0),
+    ]
+    index.upsert(stored, vectors)
+    chunks = ChunkMap()
+    chunks.add(stored)
+    assert chunks.extra_chunks == 1 and chunks.chunk_ids("a") == [
+        "a",
+        chunk_id("a", 1),
+    ]
+
+    query = np.array([0.2, 1.0, 0.1, 0.5], dtype=np.float32)
+    result = index.search(query, 4)
+    assert index.id_table.decode(result.keys)[:2] == [chunk_id("a", 1), "c"]
+    assert index.id_table.decode(
+        chunks.collapse(index.id_table, result.keys, 3)
+    ) == ["a", "c", "b"]
+
+    chunks.remove([chunk_id("a", 1)])
+    assert chunks.extra_chunks == 0 and chunks.chunk_ids("a") == ["a"]
@@ -0,0 +1,29 @@
+import json
+
+from cers_subnet.validator.dataset import BenchmarkDataset
+
+
+def test_benchmark_dataset_compiles_and_reopens(tmp_path):
+    path = tmp_path / "benchmark.jsonl"
+    rows = [
+        {"query": "what is bittensor?", "relevant_docs": ["0", "3"]},
+        {"query": "capitale de la France ?", "relevant_docs": ["2", "2"]},
+        {"query": "no answer", "relevant_docs": []},
+    ]
+    path.write_text(
+        "".join(json.dumps(row) + "\n" for row in rows), encoding="utf-8"
+    )
+
+    dataset = BenchmarkDataset.load(str(path))
+    assert len(dataset) == 3 and dataset.manifest["documents"] == 3
+    assert dataset[1] == {
+        "query": "capitale de la France ?",
+        "relevant_docs": ["2"],
+    }
+    assert dataset[-1]["relevant_docs"] == []
+    assert dataset.relevant_keys(0).tolist() == [0, 1]
+
+    # An unchanged file reuses the compiled form; a changed one is compiled again.
+    assert BenchmarkDataset.load(str(path)).manifest == dataset.manifest
+    path.write_text(json.dumps(rows[0]) + "\n", encoding="utf-8")
+    assert len(BenchmarkDataset.load(str(path))) == 1
@@ -0,0 +1,92 @@
+import time
+
+import numpy as np
+
+from cers_subnet.miner.deadline import Deadline
+from cers_subnet.miner.index import FlatIndex
+from cers_subnet.miner.segments import SegmentedIndex
+
+
+class BlockDeadline(Deadline):
+    """Expires after it has been checked `checks` times, i.e. after `checks + 1` blocks."""
+
+    def __init__(self, checks: int):
+        super().__init__(None)
+        self.checks = checks
+
+    def expired(self) -> bool:
+        self.checks -= 1
+        return self.checks < 0
+
+
+def build(n=1000, dim=8, block_size=100):
+    vectors = (
+        np.random.default_rng(0).standard_normal((n, dim)).astype(np.float32)
+    )
+    index = FlatIndex(block_size=block_size)
+    index.upsert([f"d{i}" for i in range(n)], vectors)
+    return index, vectors
+
+
+def test_deadline_keeps_a_margin_for_the_response():
+    assert not Deadline(None).expired() and Deadline(
+        None
+    ).remaining() == float("inf")
+    deadline = Deadline(2.0, margin=0.15)
+    assert 1.8 <= deadline.remaining() <= 1.85
+    assert Deadline(0.0, margin=1.0).expired()
+    deadline = Deadline(0.05)
+    assert deadline.remaining() <= 0.05
+    time.sleep(0.06)
+    assert deadline.expired() and deadline.remaining() == 0.0
+
+
+def test_the_margin_is_capped_for_sub_second_timeouts():
+    # The miner's default margin of 1s would otherwise exhaust these timeouts up front.
+    deadline = Deadline(0.5, margin=1.0)
+    assert not deadline.expired()
+    assert 0.4 <= deadline.remaining() <= 0.45
+    assert Deadline(12.0, margin=1.0).remaining() > 10.9
+
+
+def test_search_returns_the_best_of_the_blocks_scanned_before_the_deadline():
+    index, vectors = build()
+    query = vectors[950]
+    full = index.search(query, 5)
+    assert full.complete and index.id_table.decode(full.keys[:1]) == ["d950"]
+
+    partial = index.search(query, 5, deadline=BlockDeadline(2))
+    assert not partial.complete
+    # The exact top 5 of the first three blocks, rows 0-299.
+    scores = (
+        vectors[:300] / np.linalg.norm(vectors[:300], axis=1, keepdims=True)
+    ) @ (query / np.linalg.norm(query))
+    assert index.id_table.decode(partial.keys) == [
+        f"d{i}" for i in np.argsort(-scores)[:5]
+    ]
+    np.testing.assert_allclose(
+        partial.scores, np.sort(scores)[::-1][:5], rtol=1e-5
+    )
+
+
+def test_an_expired_deadline_still_scans_the_first_block():
+    index, vectors = build()
+    result = index.search(vectors[10], 3, deadline=Deadline(0.0))
+    assert not result.complete
+    assert index.id_table.decode(result.keys[:1]) == ["d10"]
+    assert all(
+        int(doc_id[1:]) < 100 for doc_id in index.id_table.decode(result.keys)
+    )
+
+
+def test_segmented_search_reports_a_partial_main_index():
+    index, vectors = build()
+    segmented = SegmentedIndex(index, merge_interval=60.0)
+    query = np.ones(8, dtype=np.float32)
+    segmented.upsert(["new"], query[None, :])
+    result = segmented.search(query, 3, deadline=BlockDeadline(0))
+    assert not result.complete
+    # The small delta segment is always searched whole, so a fresh write is found anyway.
+    doc_ids = segmented.id_table.decode(result.keys)
+    assert doc_ids[0] == "new"
+    assert all(int(doc_id[1:]) < 100 for doc_id in doc_ids[1:])
@@ -0,0 +1,51 @@
+from cers_subnet.miner.dedup import Deduplicator
+
+CONTRACT = (
+    "This agreement is made between the company and the contractor for services "
+    "rendered during the year under the terms and conditions set out below"
+)
+
+
+def test_near_duplicates_become_aliases_and_survive_restart(tmp_path):
+    path = str(tmp_path / "duplicates.jsonl")
+    dedup = Deduplicator(threshold=0.8, path=path)
+    assert dedup.add("a", dedup.signature(CONTRACT)) is None
+    assert dedup.add("b", dedup.signature(CONTRACT + " signed")) == "a"
+    assert (
+        dedup.add(
+            "c", dedup.signature("quarterly revenue grew in every region")
+        )
+        is None
+    )
+    # Identical text with different metadata stays a separate document.
+    assert (
+        dedup.add("d", dedup.signature(CONTRACT), {"department": "legal"})
+        is None
+    )
+
+    restarted = Deduplicator(threshold=0.8, path=path)
+    assert restarted.canonical_of("b") == "a"
+    assert restarted.status()["aliases"] == 1
+
+
+def test_removing_a_canonical_document_promotes_an_alias():
+    dedup = Deduplicator(threshold=0.8)
+    dedup.add("a", dedup.signature(CONTRACT))
+    dedup.add("b", dedup.signature(CONTRACT + " signed"))
+    dedup.add("c", dedup.signature(CONTRACT + " copy"))
+
+    assert dedup.remove("a") == "b"
+    assert "a" not in dedup
+    assert dedup.canonical_of("c") == "b"
+    assert dedup.remove("c") is None
+    assert dedup.aliases("b") == []
+
+
+def test_search_results_list_aliases_after_their_canonical_document():
+    dedup = Deduplicator(threshold=0.8)
+    dedup.add("a", dedup.signature(CONTRACT))
+    dedup.add("b", dedup.signature(CONTRACT + " signed"))
+    dedup.add("c", dedup.signature("quarterly revenue grew in every region"))
+
+    assert dedup.expand(["c", "a"], 3) == ["c", "a", "b"]
+    assert dedup.expand(["a", "c"], 2) == ["a", "b"]
@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+
+from cers_subnet.miner.filters import (
+    MetadataIndex,
+    RoaringBitmap,
+    parse_metadata_value,
+)
+
+
+@pytest.mark.parametrize("n", [0, 10, 5000, 200000])
+def test_roaring_bitmap_set_operations(n):
+    rng = np.random.default_rng(n)
+    a = rng.choice(300000, size=n, replace=False)
+    b = rng.choice(300000, size=n // 2 + 3, replace=False)
+    bitmap_a = RoaringBitmap.from_array(a)
+    bitmap_b = RoaringBitmap.from_array(b)
+
+    assert len(bitmap_a) == n
+    assert np.array_equal((bitmap_a | bitmap_b).to_array(), np.union1d(a, b))
+    assert np.array_equal(
+        (bitmap_a & bitmap_b).to_array(), np.intersect1d(a, b)
+    )
+    assert np.array_equal((bitmap_a - bitmap_b).to_array(), np.setdiff1d(a, b))
+
+
+def test_roaring_bitmap_add_and_discard_switch_containers():
+    values = np.random.default_rng(0).choice(70000, 5000, replace=False)
+    bitmap = RoaringBitmap()
+    for value in values:
+        bitmap.add(int(value))
+    assert np.array_equal(bitmap.to_array(), np.sort(values))
+    assert int(values[0]) in bitmap
+
+    for value in values[:4500]:
+        bitmap.discard(int(value))
+    assert np.array_equal(bitmap.to_array(), np.sort(values[4500:]))
+    assert int(values[0]) not in bitmap
+
+
+def test_metadata_index_filters():
+    index = MetadataIndex()
+    for row in range(100):
+        index.set(
+            row,
+            {
+                "department": ["eng", "legal"][row % 2],
+                "date": 20240000 + row,
+                "acl": ["a", "b"] if row % 3 else ["c"],
+            },
+        )
+
+    legal = index.evaluate({"department": "legal"}).to_array()
+    assert np.array_equal(legal, np.arange(1, 100, 2))
+
+    recent_eng_c = index.evaluate(
+        {
+            "$and": [
+                {"department": {"$ne": "legal"}},
+                {"date": {"$gte": 20240050}},
+            ],
+            "acl": {"$in": ["c"]},
+        }
+    ).to_array()
+    assert np.array_equal(recent_eng_c, [54, 60, 66, 72, 78, 84, 90, 96])
+
+    index.remove(1)
+    index.set(3, {"department": "eng"})
+    legal = index.evaluate({"department": {"$eq": "legal"}}).to_array()
+    assert 1 not in legal and 3 not in legal
+
+
+def test_booleans_and_integers_do_not_share_a_bitmap():
+    index = MetadataIndex()
+    index.set(0, {"flag": True})
+    index.set(1, {"flag": 1})
+    index.set(2, {"flag": False})
+    index.set(3, {"flag": 0})
+    assert index.evaluate({"flag": True}).to_array().tolist() == [0]
+    assert index.evaluate({"flag": 1}).to_array().tolist() == [1]
+    assert index.evaluate({"flag": {"$in": [False]}}).to_array().tolist() == [
+        2
+    ]
+    assert index.evaluate({"flag": {"$ne": 0}}).to_array().tolist() == [
+        0,
+        1,
+        2,
+    ]
+    index.remove(0)
+    assert index.evaluate({"flag": 1}).to_array().tolist() == [1]
+
+
+def test_metadata_index_rejects_unknown_operators():
+    index = MetadataIndex()
+    index.set(0, {"department": "eng"})
+    with pytest.raises(ValueError):
+        index.evaluate({"department": {"$regex": "e.*"}})
+    with pytest.raises(ValueError):
+        index.evaluate({"$not": {"department": "eng"}})
+
+
+def test_csv_metadata_values_are_typed_for_range_filters():
+    assert parse_metadata_value("20240101") == 20240101
+    assert parse_metadata_value("-3") == -3
+    assert parse_metadata_value("2.5") == 2.5
+    assert parse_metadata_value("1e3") == 1000.0
+    assert parse_metadata_value("True") is True
+    for text in ("02134", "legal", "2024-01-01", "inf", "nan", "1.", ""):
+        assert parse_metadata_value(text) == text
+
+    index = MetadataIndex()
+    for row, date in enumerate(
+        ["20231231", "20240101", "20240615", "2024-01-01"]
+    ):
+        index.set(row, {"date": parse_metadata_value(date)})
+    assert index.evaluate(
+        {"date": {"$gte": 20240101}}
+    ).to_array().tolist() == [1, 2]
+    assert index.evaluate({"date": {"$gte": "2024"}}).to_array().tolist() == [
+        3
+    ]
+
+
+def test_metadata_index_keeps_rows_compactly_and_reclaims_freed_space():
+    index = MetadataIndex()
+    for row in range(2000):
+        index.set(row, {"team": f"t{row % 7}", "acl": ["eng"], "n": row})
+    assert index.get(5) == {"team": "t5", "acl": ["eng"], "n": 5}
+    assert index.get(4000) == {}
+    size = index.memory_bytes()
+
+    for row in range(1500):
+        index.remove(row)
+    # Once freed bytes make up half of the buffer they are compacted away.
+    assert index.memory_bytes() < size
+    assert index.get(10) == {}
+    assert index.get(1999) == {"team": "t4", "acl": ["eng"], "n": 1999}
+    assert index.evaluate({"team": "t4"}).to_array().tolist() == [
+        row for row in range(1500, 2000) if row % 7 == 4
+    ]
@@ -0,0 +1,80 @@
+import numpy as np
+
+from cers_subnet.miner.ids import IdTable
+from cers_subnet.miner.index import FlatIndex
+
+
+def test_id_table_persists_keys_and_drops_partial_records(tmp_path):
+    path = str(tmp_path / "ids.bin")
+    table = IdTable(path)
+    assert table.intern(["a", "b"]).tolist() == [0, 1]
+    assert table.intern(["b", "é"]).tolist() == [1, 2]
+    table.close()
+    with open(path, "ab") as f:
+        f.write(b"\x09\x00\x00\x00par")
+
+    table = IdTable(path)
+    assert len(table) == 3
+    assert table.get(["é", "missing"]).tolist() == [2, -1]
+    assert table.intern(["c"]).tolist() == [3]
+    assert table.decode([3, 0]) == ["c", "a"]
+
+
+def test_index_search_returns_keys_and_reuses_them_after_delete():
+    table = IdTable()
+    index = FlatIndex(initial_capacity=4, id_table=table)
+    vectors = np.eye(8, dtype=np.float32)
+    index.upsert([f"doc{i}" for i in range(8)], vectors)
+
+    result = index.search(vectors[3], 1)
+    assert result.keys.dtype == np.int32
+    assert table.decode(result.keys) == ["doc3"]
+
+    assert index.delete(["doc3", "unknown"]) == 1
+    assert "doc3" not in index and len(index) == 7
+    assert "doc3" not in table.decode(index.search(vectors[3], 8).keys)
+
+    index.upsert(["doc3"], vectors[3:4])
+    assert (
+        index.search(vectors[3], 1).keys.tolist()
+        == table.get(["doc3"]).tolist()
+    )
+
+
+def test_id_table_matches_a_dict_through_growth_and_hash_collisions(
+    monkeypatch,
+):
+    table = IdTable()
+    reference = {}
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        ids = [f"doc-{i}" for i in rng.integers(0, 5000, 200)]
+        keys = table.intern(ids)
+        for doc_id, key in zip(ids, keys.tolist()):
+            assert reference.setdefault(doc_id, len(reference)) == key
+    assert len(table) == len(reference)
+    assert table.decode(table.get(list(reference))) == list(reference)
+    assert table.get(["doc-5000", "missing"]).tolist() == [-1, -1]
+
+    # Ids that share a hash are told apart by their bytes.
+    monkeypatch.setattr(
+        IdTable,
+        "_hash",
+        staticmethod(lambda ids: np.full(len(ids), 7, dtype=np.int64)),
+    )
+    colliding = IdTable()
+    assert colliding.intern(["x", "y", "x", "z"]).tolist() == [0, 1, 0, 2]
+    assert colliding.get(["z", "w", "y"]).tolist() == [2, -1, 1]
+
+
+def test_compact_keeps_live_ids_in_order_and_rewrites_the_file(tmp_path):
+    path = str(tmp_path / "ids.bin")
+    table = IdTable(path)
+    table.intern([f"d{i}" for i in range(10)])
+    assert table.compact(["d7", "d2", "unknown", "d5"]) == 7
+    assert table.decode([0, 1, 2]) == ["d2", "d5", "d7"]
+    assert table.intern(["d9", "d5"]).tolist() == [3, 1]
+    table.close()
+
+    table = IdTable(path)
+    assert table.decode(range(len(table))) == ["d2", "d5", "d7", "d9"]
@@ -0,0 +1,144 @@
+import argparse
+import concurrent.futures
+import importlib.util
+import json
+import os
+
+import numpy as np
+import pytest
+
+SCRIPT = os.path.join(
+    os.path.dirname(__file__), "..", "scripts", "label_benchmark.py"
+)
+
+
+@pytest.fixture
+def labeling():
+    spec = importlib.util.spec_from_file_location("label_benchmark", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class OverlapScorer:
+    """Scores a (query, document) pair by the number of words they share."""
+
+    def predict(self, pairs, batch_size):
+        return [
+            len(set(query.split()) & set(text.split()))
+            for query, text in pairs
+        ]
+
+
+def config_for(tmp_path, **overrides):
+    values = dict(
+        out=str(tmp_path / "benchmark.jsonl"),
+        retriever="org/retriever",
+        thresholds=[1.0, 2.0],
+        min_grade=2,
+        workers=2,
+        batch_size=4,
+        queries_per_task=2,
+    )
+    values.update(overrides)
+    return argparse.Namespace(**values)
+
+
+def test_grade_counts_the_thresholds_a_score_reaches(labeling):
+    scores = np.array([-1.0, 0.0, 2.9, 3.0, 7.5])
+    assert labeling.grade(scores, [6.0, 0.0, 3.0]).tolist() == [0, 1, 1, 2, 3]
+
+
+def test_completed_queries_truncates_a_torn_last_line(labeling, tmp_path):
+    path = tmp_path / "benchmark.jsonl"
+    assert labeling.completed_queries(str(path)) == set()
+    whole = (
+        json.dumps({"query_id": "q1", "query": "a"})
+        + "\n"
+        + json.dumps({"query_id": "q2", "query": "b"})
+        + "\n"
+    )
+    path.write_text(whole + '{"query_id": "q3", "qu', encoding="utf-8")
+    assert labeling.completed_queries(str(path)) == {"q1", "q2"}
+    assert path.read_text(encoding="utf-8") == whole
+
+
+def test_an_interrupted_run_resumes_without_duplicates(labeling, tmp_path):
+    doc_ids = [f"d{i}" for i in range(6)]
+    doc_texts = [
+        "red apple",
+        "green apple",
+        "red car",
+        "blue car",
+        "red green blue",
+        "apple car",
+    ]
+    queries = [
+        (f"q{i}", text)
+        for i, text in enumerate(
+            ["red apple", "blue car", "green", "apple car", "red"]
+        )
+    ]
+    candidates = np.tile(np.arange(6), (len(queries), 1))
+    config = config_for(tmp_path)
+    labeling._cross_encoder = OverlapScorer()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+        assert (
+            labeling.label(
+                config, doc_ids, doc_texts, queries, candidates, set(), pool
+            )
+            == 5
+        )
+        with open(config.out, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        expected = {
+            json.loads(line)["query_id"]: json.loads(line) for line in lines
+        }
+        # "green" and "red" share at most one word with every document.
+        assert sorted(expected) == ["q0", "q1", "q3"]
+        assert labeling.completed_queries(config.out) == {
+            "q0",
+            "q1",
+            "q2",
+            "q3",
+            "q4",
+        }
+        assert expected["q0"]["relevant_docs"] == ["d0"]
+        assert expected["q0"]["grades"] == {
+            "d0": 2,
+            "d1": 1,
+            "d2": 1,
+            "d4": 1,
+            "d5": 1,
+        }
+
+        # A crash in the middle of the third record.
+        with open(config.out, "w", encoding="utf-8") as f:
+            f.write("".join(lines[:2]) + lines[2][:10])
+        done = labeling.completed_queries(config.out)
+        assert len(done) == 4
+        assert (
+            labeling.label(
+                config, doc_ids, doc_texts, queries, candidates, done, pool
+            )
+            == 5
+        )
+
+    with open(config.out, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert sorted(record["query_id"] for record in records) == [
+        "q0",
+        "q1",
+        "q3",
+    ]
+    assert {record["query_id"]: record for record in records} == expected
+
+
+def test_corpus_cache_is_keyed_on_the_corpus_content(labeling, tmp_path):
+    config = config_for(tmp_path)
+    path = labeling.corpus_cache_path(config, ["one", "two"])
+    assert path.startswith(config.out + ".corpus-org_retriever-")
+    assert labeling.corpus_cache_path(config, ["one", "two"]) == path
+    # Same number of documents, different texts.
+    assert labeling.corpus_cache_path(config, ["one", "three"]) != path
+    assert labeling.corpus_cache_path(config, ["on", "etwo"]) != path
@@ -0,0 +1,33 @@
+import numpy as np
+
+from cers_subnet.validator.latency import LatencyStats, latency_scores
+
+
+def test_latency_scores_rank_and_timeout_modes():
+    times = np.array([0.5, np.nan, 2.0, 0.5, 1.0])
+    eligible = np.array([True, True, True, True, False])
+    np.testing.assert_allclose(
+        latency_scores(times, eligible, timeout=10, mode="rank"),
+        [0.75, 0, 0, 0.75, 0],
+    )
+    np.testing.assert_allclose(
+        latency_scores(times, eligible, timeout=4, mode="timeout", exponent=1),
+        [0.875, 0, 0.5, 0.875, 0],
+    )
+
+
+def test_latency_stats_track_moving_averages_per_uid():
+    stats = LatencyStats(alpha=0.5)
+    stats.update([1, 3], np.array([1.0, np.nan]))
+    stats.update([1], np.array([3.0]))
+    assert len(stats) == 4
+    summary = stats.summary([1, 3])
+    assert summary[1] == {
+        "mean": 2.0,
+        "std": 1.0,
+        "responses": 2,
+        "failures": 0,
+    }
+    assert np.isnan(summary[3]["mean"]) and summary[3]["failures"] == 1
+    stats.reset([1])
+    assert np.isnan(stats.mean[1]) and stats.responses[1] == 0
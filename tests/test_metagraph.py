@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+from cers_subnet.validator.metagraph import (
+    MetagraphFingerprint,
+    diff_metagraph,
+)
+
+
+def axon(ip, port=8091):
+    return SimpleNamespace(ip=ip, port=port, ip_type=4, protocol=4)
+
+
+def test_metagraph_diff_finds_replaced_added_and_moved_uids():
+    before = MetagraphFingerprint.of(
+        ["a", "b", "c"], [axon("1.1.1.1"), axon("2.2.2.2"), axon("3.3.3.3")]
+    )
+    after = MetagraphFingerprint.of(
+        ["a", "x", "c", "d"],
+        [
+            axon("1.1.1.1"),
+            axon("2.2.2.2"),
+            axon("3.3.3.3", 9000),
+            axon("4.4.4.4"),
+        ],
+    )
+    change = diff_metagraph(before, after)
+    assert change.replaced.tolist() == [1]
+    assert change.added.tolist() == [3]
+    assert change.moved.tolist() == [2]
+    assert change.size == 4
+    assert diff_metagraph(after, after).empty
+
+
+def test_fingerprint_hashes_are_stable_and_distinct():
+    hotkeys = [f"5F{i:046d}" for i in range(2000)] + [
+        "",
+        "a",
+        "ab",
+        "hotkey-é",
+        "x" * 100,
+    ]
+    first = MetagraphFingerprint.of(hotkeys, [axon("1.1.1.1")] * len(hotkeys))
+    again = MetagraphFingerprint.of(
+        list(reversed(hotkeys)), [axon("1.1.1.1")] * len(hotkeys)
+    )
+    assert first.hotkeys.tolist() == again.hotkeys[::-1].tolist()
+    assert len(set(first.hotkeys.tolist())) == len(hotkeys)
+    endpoints = MetagraphFingerprint.of(
+        ["a"] * 4,
+        [
+            axon("1.1.1.1"),
+            axon("1.1.1.1", 8092),
+            axon("1.1.1.12"),
+            axon("11.1.1.1"),
+        ],
+    ).endpoints
+    assert len(set(endpoints.tolist())) == 4
+    assert len(MetagraphFingerprint.of([], [])) == 0
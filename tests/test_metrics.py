@@ -0,0 +1,31 @@
+import numpy as np
+
+from cers_subnet.validator.metrics import score_batch
+
+
+def test_score_batch_computes_metrics_per_query_and_miner():
+    responses = [
+        [["a", "x", "b"], ["x", "y", "a"], None, ["a", "a", "a"]],
+        [["q"], ["z", "q"], ["p", "q"], []],
+    ]
+    relevant = [{"a", "b"}, {"q"}]
+    metrics = score_batch(responses, relevant, k=2, depth=3)
+
+    np.testing.assert_allclose(
+        metrics.mrr, [[1.0, 1 / 3, 0.0, 1.0], [1.0, 0.5, 0.5, 0.0]], rtol=1e-6
+    )
+    np.testing.assert_allclose(
+        metrics.recall, [[0.5, 0.0, 0.0, 0.5], [1.0, 1.0, 1.0, 0.0]]
+    )
+    np.testing.assert_allclose(
+        metrics.precision, [[0.5, 0.0, 0.0, 0.5], [0.5, 0.5, 0.5, 0.0]]
+    )
+    ideal = 1 + 1 / np.log2(3)
+    np.testing.assert_allclose(
+        metrics.ndcg,
+        [
+            [1 / ideal, 0.0, 0.0, 1 / ideal],
+            [1.0, 1 / np.log2(3), 1 / np.log2(3), 0.0],
+        ],
+        rtol=1e-6,
+    )
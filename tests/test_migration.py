@@ -0,0 +1,211 @@
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from cers_subnet.miner.ids import IdTable
+from cers_subnet.miner.index import FlatIndex
+from cers_subnet.miner.migration import ModelMigration
+from cers_subnet.miner.space import (
+    EmbeddingSpace,
+    read_space_file,
+    startup_migration,
+    write_space_file,
+)
+
+
+class WordModel:
+    """Embeds text as a bag of hashed words; `seed` makes models disagree like real ones do."""
+
+    def __init__(self, seed: int, dim: int = 256):
+        self.seed, self.dim = seed, dim
+
+    def encode(self, texts, convert_to_numpy=True):
+        if isinstance(texts, str):
+            return self.encode([texts])[0]
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.split():
+                vectors[
+                    row, (zlib.crc32(word.encode()) + self.seed) % self.dim
+                ] += 1.0
+        return vectors
+
+
+class MemoryCollection:
+    """The part of a ChromaDB collection that `EmbeddingSpace` writes to."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = {}
+
+    def upsert(self, ids, embeddings, metadatas):
+        self.rows.update(zip(ids, zip(embeddings, metadatas)))
+
+    def delete(self, ids):
+        for doc_id in ids:
+            self.rows.pop(doc_id, None)
+
+
+def space(name: str, seed: int, id_table: IdTable) -> EmbeddingSpace:
+    return EmbeddingSpace(
+        name,
+        WordModel(seed),
+        MemoryCollection(name),
+        index=FlatIndex(id_table=id_table),
+    )
+
+
+CORPUS = [
+    (f"d{i}", f"topic{i} shared words number {i}", {"n": i}) for i in range(40)
+]
+
+
+def migration_for(source, target, documents, **kwargs):
+    ready = []
+    migration = ModelMigration(
+        source,
+        target,
+        lambda: iter(documents),
+        threading.Lock(),
+        ready.append,
+        batch_size=8,
+        duty_cycle=1.0,
+        **kwargs,
+    )
+    return migration, ready
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_migration_cuts_over_once_the_target_holds_every_document():
+    ids = IdTable()
+    source, target = space("old", 0, ids), space("new", 7, ids)
+    source.upsert(
+        [doc_id for doc_id, _, _ in CORPUS],
+        [text for _, text, _ in CORPUS],
+        [meta for _, _, meta in CORPUS],
+    )
+    # A document that only arrived through the API is not in the document source.
+    source.upsert(["api"], ["sent once through the api"])
+    migration, ready = migration_for(source, target, CORPUS)
+    migration.start()
+    wait_for(lambda: migration.state == "catching_up")
+    assert migration.backfilled == len(CORPUS) and not ready
+    assert migration.missing() == ["api"]
+
+    # Sending it again (double-written by the miner) completes the migration.
+    target.upsert(["api"], ["sent once through the api"])
+    assert migration.maybe_finish()
+    assert ready == [migration] and migration.state == "done"
+    query = target.encode_query("topic17 shared words number 17")
+    assert target.index.id_table.decode(
+        target.index.search(query, 1).keys
+    ) == ["d17"]
+    metadata = {
+        doc_id: meta
+        for batch_ids, _, metas in target.index.batches()
+        for doc_id, meta in zip(batch_ids, metas)
+    }
+    assert metadata["d17"] == {"n": 17}
+    # The old model and index are released once the backfill thread is done.
+    migration._thread.join(timeout=5.0)
+    assert migration.source is None and migration.target is target
+    status = migration.status()
+    assert status["state"] == "done" and status["source_model"] == "old"
+    assert status["source_documents"] == len(CORPUS) + 1
+
+
+def test_backfill_skips_documents_deleted_or_rewritten_during_the_migration():
+    ids = IdTable()
+    source, target = space("old", 0, ids), space("new", 7, ids)
+    source.upsert(
+        [doc_id for doc_id, _, _ in CORPUS], [text for _, text, _ in CORPUS]
+    )
+    source.delete(["d3"])
+    target.upsert(["d5"], ["the newer text of d5"])
+    migration, ready = migration_for(source, target, CORPUS)
+    migration.start()
+    wait_for(lambda: migration.state not in ("backfilling", "catching_up"))
+    assert "d3" not in target.index
+    query = target.encode_query("the newer text of d5")
+    assert target.index.id_table.decode(
+        target.index.search(query, 1).keys
+    ) == ["d5"]
+    assert migration.state == "done" and ready == [migration]
+
+
+def test_a_cancelled_migration_never_cuts_over():
+    ids = IdTable()
+    source, target = space("old", 0, ids), space("new", 7, ids)
+    source.upsert(
+        [doc_id for doc_id, _, _ in CORPUS], [text for _, text, _ in CORPUS]
+    )
+    busy = threading.Event()
+    busy.set()
+    migration, ready = migration_for(
+        source, target, CORPUS, is_busy=busy.is_set
+    )
+    migration.start()
+    # Queries in flight hold the backfill after its first batch.
+    wait_for(lambda: migration.backfilled == 8)
+    migration.cancel()
+    busy.clear()
+    migration._thread.join(timeout=5.0)
+    assert not migration._thread.is_alive()
+    assert migration.state == "cancelled" and migration.backfilled == 8
+    assert migration.target is None and migration.source is source
+    assert migration.status()["target_documents"] == 8
+    assert not migration.maybe_finish() and not migration.maybe_finish(
+        force=True
+    )
+    assert not ready
+
+
+def test_a_forced_cutover_switches_with_documents_missing():
+    ids = IdTable()
+    source, target = space("old", 0, ids), space("new", 7, ids)
+    source.upsert(["api"], ["sent once through the api"])
+    migration, ready = migration_for(source, target, [])
+    migration.start()
+    wait_for(lambda: migration.state == "catching_up")
+    assert not migration.maybe_finish()
+    assert migration.maybe_finish(force=True)
+    assert ready == [migration] and migration.state == "done"
+
+
+def test_restarts_keep_a_model_switched_to_by_the_api_or_a_snapshot(
+    tmp_path,
+):
+    path = str(tmp_path / "embedding_space.json")
+    default = "all-MiniLM-L6-v2"
+
+    def restart(model, configured):
+        write_space_file(
+            path,
+            {
+                "model": model,
+                "collection": "rag",
+                "chunk_tokens": 0,
+                "chunk_overlap": 0,
+                "configured_model": configured,
+            },
+        )
+        return startup_migration(read_space_file(path), default)
+
+    assert startup_migration(read_space_file(path), default) is None
+    # After a cutover started through POST /migration.
+    assert restart("e5-base", default) is None
+    # After importing a snapshot made with another model.
+    assert restart("snapshot-model", default) is None
+    # After changing --miner.embedding_model; the file is unchanged until the
+    # cutover, so a restart during the migration starts it again.
+    assert restart("e5-base", "e5-base") == default
+    write_space_file(path, {"model": "e5-base", "collection": "rag"})
+    assert startup_migration(read_space_file(path), default) is None
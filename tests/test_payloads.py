@@ -0,0 +1,65 @@
+import json
+
+import numpy as np
+
+from cers_subnet.miner.payloads import (
+    DocumentPayload,
+    delete_record,
+    record_embedding,
+    upsert_record,
+)
+from cers_subnet.miner.space import read_space_file, write_space_file
+
+
+def test_upsert_records_carry_embeddings_through_json():
+    document = DocumentPayload(
+        id="a",
+        document="some text",
+        metadata={"department": "hr", "year": 2024},
+    )
+    embedding = np.random.default_rng(0).random((3, 8), dtype=np.float32)
+    record = json.loads(
+        json.dumps(upsert_record(document, "model-a", embedding, (254, 32)))
+    )
+    assert record["op"] == "upsert" and record["metadata"] == {
+        "department": "hr",
+        "year": 2024,
+    }
+    np.testing.assert_array_equal(
+        record_embedding(record, "model-a", (254, 32)), embedding
+    )
+    # The same record without chunking information is accepted by any chunk setting.
+    np.testing.assert_array_equal(
+        record_embedding(record, "model-a"), embedding
+    )
+
+
+def test_embeddings_from_another_model_or_chunking_are_not_used():
+    document = DocumentPayload(id="a", document="some text")
+    record = upsert_record(
+        document, "model-a", np.ones((2, 4), dtype=np.float32), (254, 32)
+    )
+    assert record_embedding(record, "model-b", (254, 32)) is None
+    assert record_embedding(record, "model-a", (128, 32)) is None
+    assert record_embedding(upsert_record(document), "model-a") is None
+    assert delete_record("a") == {"op": "delete", "id": "a"}
+
+
+def test_space_file_carries_the_chunk_settings(tmp_path):
+    path = str(tmp_path / "embedding_space.json")
+    assert read_space_file(path) is None
+    settings = {
+        "model": "model-a",
+        "collection": "rag",
+        "chunk_tokens": 254,
+        "chunk_overlap": 32,
+    }
+    write_space_file(path, settings)
+    assert read_space_file(path) == settings
+    # Files written before the chunk settings were recorded mean whole documents.
+    write_space_file(path, {"model": "model-a", "collection": "rag"})
+    assert read_space_file(path) == {
+        **settings,
+        "chunk_tokens": 0,
+        "chunk_overlap": 0,
+    }
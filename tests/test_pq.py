@@ -0,0 +1,146 @@
+import threading
+import numpy as np
+
+from cers_subnet.miner.index import FlatIndex
+import cers_subnet.miner.pq as pq_module
+from cers_subnet.miner.pq import PQIndex
+
+
+def clustered(rng, n, dim=32, clusters=40):
+    """Vectors around a few directions, like sentence embeddings of a corpus with topics."""
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    return centers[rng.integers(0, clusters, n)] + 0.4 * rng.standard_normal(
+        (n, dim)
+    ).astype(np.float32)
+
+
+def recall(index, exact, queries, k=10):
+    hits = 0
+    for query in queries:
+        truth = set(exact.search(query, k).keys.tolist())
+        hits += len(truth & set(index.search(query, k).keys.tolist()))
+    return hits / (k * len(queries))
+
+
+def build(tmp_path, rerank, vectors):
+    ids = [f"d{i}" for i in range(len(vectors))]
+    exact = FlatIndex()
+    exact.upsert(ids, vectors)
+    pq = PQIndex(
+        str(tmp_path / f"pq{rerank}"),
+        m=8,
+        rerank=rerank,
+        train_size=2000,
+        iterations=8,
+        id_table=exact.id_table,
+    )
+    pq.upsert(ids[:1000], vectors[:1000])
+    assert not pq.trained
+    pq.upsert(ids[1000:], vectors[1000:])
+    # Training runs in the background; the write itself returns at once.
+    assert pq.wait_for_training(timeout=60)
+    return pq, exact
+
+
+def test_pq_recall_against_exact_search(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = clustered(rng, 4000)
+    queries = clustered(np.random.default_rng(1), 50)
+
+    compressed, exact = build(tmp_path, 0, vectors)
+    reranked, _ = build(tmp_path, 100, vectors)
+    approximate = recall(compressed, exact, queries)
+    assert approximate >= 0.4
+    # Re-scoring 100 candidates from the full vectors recovers almost all of the exact top 10.
+    assert recall(reranked, exact, queries) >= max(0.9, approximate)
+    # 8 bytes of codes per vector instead of 128 bytes of float32.
+    assert compressed._codes[: len(compressed)].nbytes == 8 * len(vectors)
+
+
+def test_pq_scores_exactly_until_trained(tmp_path):
+    rng = np.random.default_rng(2)
+    vectors = clustered(rng, 500)
+    pq = PQIndex(str(tmp_path / "pq"), m=8, train_size=1000)
+    exact = FlatIndex(id_table=pq.id_table)
+    ids = [f"d{i}" for i in range(len(vectors))]
+    pq.upsert(ids, vectors)
+    exact.upsert(ids, vectors)
+    for query in clustered(np.random.default_rng(3), 5):
+        assert (
+            pq.search(query, 10).keys.tolist()
+            == exact.search(query, 10).keys.tolist()
+        )
+
+
+def test_pq_restores_codes_and_codebooks_after_a_restart(
+    tmp_path, monkeypatch
+):
+    rng = np.random.default_rng(4)
+    vectors = clustered(rng, 3000)
+    ids = [f"d{i}" for i in range(len(vectors))]
+    path = str(tmp_path / "pq")
+    pq = PQIndex(path, m=8, rerank=20, train_size=2000, iterations=4)
+    pq.upsert(ids, vectors, [{"n": i} for i in range(len(ids))])
+    assert pq.wait_for_training(timeout=60)
+    pq.delete(ids[:10])
+    queries = clustered(np.random.default_rng(5), 5)
+    before = [pq.search(q, 10).keys.tolist() for q in queries]
+    memory = pq.memory_bytes()
+    assert memory > pq._codes.nbytes + pq._keys.nbytes
+
+    restarted = PQIndex(
+        path, m=8, rerank=20, train_size=2000, id_table=pq.id_table
+    )
+    # Neither the codebooks nor unchanged vectors are computed again.
+    monkeypatch.setattr(pq_module, "kmeans", lambda *args: 1 / 0)
+    monkeypatch.setattr(restarted, "_encode", lambda *args: 1 / 0)
+    assert restarted.restore() == len(ids) - 10
+    assert restarted.trained and ids[0] not in restarted
+    restarted.upsert(
+        ids[10:], vectors[10:], [{"n": i} for i in range(10, 3000)]
+    )
+    assert restarted._unverified is None
+    assert [restarted.search(q, 10).keys.tolist() for q in queries] == before
+    assert restarted.metadata.get(
+        int(restarted._rows[pq.id_table.get(["d42"])[0]])
+    ) == {"n": 42}
+
+
+def test_a_fresh_pq_index_discards_what_an_earlier_run_left(tmp_path):
+    vectors = clustered(np.random.default_rng(6), 300)
+    ids = [f"d{i}" for i in range(len(vectors))]
+    path = str(tmp_path / "pq")
+    first = PQIndex(path, m=8, train_size=200, iterations=2)
+    first.upsert(ids, vectors)
+    assert first.wait_for_training(timeout=60)
+    # Without `restore`, e.g. for a migration target, the old rows are not reused.
+    second = PQIndex(path, m=8, train_size=10000, id_table=first.id_table)
+    second.upsert(ids[:5], vectors[:5])
+    assert not second.trained and len(second) == 5
+    third = PQIndex(path, m=8, train_size=10000, id_table=first.id_table)
+    assert third.restore() == 5 and not third.trained
+
+
+def test_training_runs_off_the_write_path(tmp_path, monkeypatch):
+    vectors = clustered(np.random.default_rng(7), 400)
+    ids = [f"d{i}" for i in range(len(vectors))]
+    started, release = threading.Event(), threading.Event()
+    kmeans = pq_module.kmeans
+
+    def blocked_kmeans(*args):
+        started.set()
+        release.wait(timeout=30)
+        return kmeans(*args)
+
+    monkeypatch.setattr(pq_module, "kmeans", blocked_kmeans)
+    pq = PQIndex(str(tmp_path / "pq"), m=8, train_size=200, iterations=2)
+    pq.upsert(ids[:200], vectors[:200])
+    assert started.wait(timeout=30)
+    # Writes go on while the codebooks are trained, and are encoded afterwards.
+    pq.upsert(ids[200:], vectors[200:])
+    assert not pq.trained and len(pq) == 400
+    release.set()
+    assert pq.wait_for_training(timeout=60)
+    assert np.array_equal(
+        pq._codes[:400], pq._encode(pq._read(np.arange(400)))
+    )
@@ -0,0 +1,74 @@
+import numpy as np
+
+from cers_subnet.validator.sampler import CoverageSampler, UncertaintySampler
+
+
+def test_every_available_miner_is_queried_once_per_cycle():
+    available = np.ones(10, dtype=bool)
+    available[[3, 7]] = False
+    sampler = CoverageSampler(rng=np.random.default_rng(0))
+
+    first = np.concatenate([sampler.sample(available, 3) for _ in range(3)])[
+        :8
+    ]
+    assert sorted(first.tolist()) == np.flatnonzero(available).tolist()
+    for _ in range(29):
+        sampler.sample(available, 3)
+    coverage = sampler.coverage(available)
+    assert coverage["max_queries"] - coverage["min_queries"] <= 1
+    assert coverage["never_queried"] == 0
+
+
+def test_prioritized_uids_are_queried_next_and_once():
+    available = np.ones(6, dtype=bool)
+    sampler = CoverageSampler(rng=np.random.default_rng(1))
+    sampler.sample(available, 2)
+    sampler.prioritize([5])
+    assert 5 in sampler.sample(available, 2).tolist()
+    rest = np.concatenate(
+        [sampler.sample(available, 1), sampler.sample(available, 1)]
+    )
+    assert 5 not in rest.tolist()
+    assert sampler.counts[5] == 1
+
+
+def test_uncertainty_sampler_favours_noisy_miners_but_keeps_coverage():
+    rng = np.random.default_rng(2)
+    available = np.ones(8, dtype=bool)
+    sampler = UncertaintySampler(floor=0.25, rng=rng)
+    for _ in range(200):
+        uids = sampler.sample(available, 4)
+        assert len(set(uids.tolist())) == 4
+        # Miners 0 and 1 are noisy, the rest always earn the same reward.
+        rewards = np.where(uids < 2, rng.random(uids.size), 0.5)
+        sampler.observe(uids, rewards)
+    assert sampler.counts[:2].min() > 2 * sampler.counts[2:].max()
+    assert sampler.counts.min() >= 200 // 8
+
+
+def test_uncertainty_sampler_spends_queries_on_close_rankings():
+    rng = np.random.default_rng(3)
+    available = np.ones(8, dtype=bool)
+    # Miners 0 and 1 are tied; miner 2 is as noisy but well ahead of everyone else.
+    centers = np.array([0.5, 0.5, 0.95, 0.05, 0.15, 0.25, 0.7, 0.8])
+    sampler = UncertaintySampler(floor=0.25, rng=rng)
+    for _ in range(200):
+        uids = sampler.sample(available, 4)
+        noise = np.where(uids < 3, rng.uniform(-0.05, 0.05, uids.size), 0.0)
+        sampler.observe(uids, centers[uids] + noise)
+    assert sampler.counts[:2].min() > 2 * sampler.counts[2]
+    priority = sampler.rank_uncertainty(available)
+    assert priority[:2].min() > priority[2:].max()
+
+
+def test_forward_without_a_benchmark_dataset_does_not_use_up_a_sample():
+    import asyncio
+    from types import SimpleNamespace
+
+    from cers_subnet.validator.forward import forward
+
+    sampler = CoverageSampler(rng=np.random.default_rng(2))
+    validator = SimpleNamespace(benchmark_dataset=[], uid_sampler=sampler)
+    asyncio.run(forward(validator))
+    # No miner is counted as queried, so the coverage cycle is untouched.
+    assert not sampler.counts.any()
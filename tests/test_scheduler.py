@@ -0,0 +1,39 @@
+import asyncio
+import threading
+import time
+
+from cers_subnet.validator.scheduler import ForwardScheduler
+
+
+def test_scheduler_keeps_window_full_and_runs_maintenance_in_background():
+    state = {"running": 0, "peak": 0, "started": 0, "maintenance": 0}
+    maintenance_threads = set()
+
+    async def forward():
+        state["started"] += 1
+        number = state["started"]
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        # One slow forward must not hold up the others.
+        await asyncio.sleep(0.05 if number == 1 else 0.001)
+        state["running"] -= 1
+        if number == 5:
+            raise RuntimeError("miner query failed")
+
+    def maintenance():
+        maintenance_threads.add(threading.get_ident())
+        time.sleep(0.01)
+        state["maintenance"] += 1
+
+    scheduler = ForwardScheduler(
+        forward,
+        window=3,
+        maintenance=maintenance,
+        should_exit=lambda: scheduler.completed >= 30,
+    )
+    asyncio.run(scheduler.run())
+
+    assert state["peak"] == 3
+    assert scheduler.completed >= 30 and scheduler.failed == 1
+    assert state["maintenance"] >= 1
+    assert threading.get_ident() not in maintenance_threads
@@ -0,0 +1,98 @@
+import threading
+
+import numpy as np
+
+from cers_subnet.miner.index import FlatIndex
+from cers_subnet.miner.segments import SegmentedIndex
+
+
+def test_segmented_index_matches_a_reference_under_concurrent_merges():
+    index = SegmentedIndex(
+        FlatIndex(initial_capacity=16),
+        merge_rows=40,
+        merge_interval=0.005,
+        merge_chunk=8,
+    )
+    rng = np.random.default_rng(0)
+    reference = {}
+    stop = threading.Event()
+    errors = []
+
+    def search():
+        query_rng = np.random.default_rng(1)
+        while not stop.is_set():
+            keys = index.search(
+                query_rng.standard_normal(16).astype(np.float32), 10
+            ).keys.tolist()
+            if len(keys) != len(set(keys)) or len(keys) > 10:
+                errors.append(keys)
+
+    searchers = [threading.Thread(target=search) for _ in range(3)]
+    for thread in searchers:
+        thread.start()
+    try:
+        for step in range(1500):
+            doc_id = f"doc{rng.integers(0, 150)}"
+            if rng.random() < 0.7:
+                vector = rng.standard_normal(16).astype(np.float32)
+                index.upsert([doc_id], vector[None, :])
+                reference[doc_id] = vector
+                # Every acknowledged write is visible to the next query, whatever the merge thread is doing.
+                assert index.id_table.decode(index.search(vector, 1).keys) == [
+                    doc_id
+                ]
+            else:
+                assert index.delete([doc_id]) == (
+                    1 if reference.pop(doc_id, None) is not None else 0
+                )
+                assert doc_id not in index
+            assert len(index) == len(reference)
+    finally:
+        stop.set()
+        for thread in searchers:
+            thread.join()
+
+    assert not errors
+    assert index.merges > 0
+    index.merge()
+    assert sorted(index.ids()) == sorted(reference)
+    for doc_id, vector in reference.items():
+        result = index.search(vector, 1)
+        assert index.id_table.decode(result.keys) == [doc_id]
+        assert np.isclose(result.scores[0], 1.0, atol=1e-5)
+
+
+def test_deletes_request_a_merge():
+    index = SegmentedIndex(FlatIndex(), merge_rows=50, merge_interval=3600)
+    vectors = np.random.default_rng(2).standard_normal((200, 8))
+    ids = [f"doc{i}" for i in range(200)]
+    index.upsert(ids[:40], vectors[:40].astype(np.float32))
+    index.merge()
+    merges = index.merges
+    index.delete(ids[:30])
+    index.delete(ids[30:40])
+    index.upsert(ids[40:50], vectors[40:50].astype(np.float32))
+    # 10 new rows and 40 deletes reach merge_rows without waiting for the interval.
+    with index._merged:
+        assert index._merged.wait_for(lambda: index.merges > merges, timeout=5)
+
+
+def test_many_hidden_keys_are_excluded_instead_of_truncating_the_overfetch():
+    rng = np.random.default_rng(3)
+    vectors = rng.standard_normal((2000, 8)).astype(np.float32)
+    ids = [f"doc{i}" for i in range(2000)]
+    index = SegmentedIndex(
+        FlatIndex(block_size=128), merge_rows=10**6, merge_interval=3600
+    )
+    index.upsert(ids, vectors)
+    index.merge()
+    # Far more deletes than MAX_OVERFETCH, all of them the best matches of the query.
+    query = vectors[0]
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    nearest = np.argsort(-(unit @ query))
+    index.delete([ids[i] for i in nearest[:600]])
+    result = index.search(query, 10)
+    expected = [ids[i] for i in nearest[600:610]]
+    assert index.id_table.decode(result.keys) == expected
+    batched = index.search_batch(query[None, :], 10)[0]
+    assert index.id_table.decode(batched.keys) == expected
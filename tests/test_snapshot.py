@@ -0,0 +1,116 @@
+import os
+
+import numpy as np
+import pytest
+
+from cers_subnet.miner.index import FlatIndex
+from cers_subnet.miner.snapshot import (
+    check_chunking,
+    check_manifest,
+    export_snapshot,
+    read_snapshot,
+    verify_snapshot,
+)
+
+
+def test_snapshot_round_trips_and_detects_corruption(tmp_path):
+    index = FlatIndex(initial_capacity=4)
+    vectors = (
+        np.random.default_rng(0).standard_normal((10, 8)).astype(np.float32)
+    )
+    index.upsert(
+        [f"doc{i}" for i in range(10)],
+        vectors,
+        [{"team": str(i % 2)} for i in range(10)],
+    )
+    index.delete(["doc4"])
+
+    directory = str(tmp_path / "snap")
+    manifest = export_snapshot(
+        index.batches(3), directory, "model-a", version=index.version
+    )
+    assert manifest["count"] == 9 and manifest["dim"] == 8
+    assert verify_snapshot(directory)["model"] == "model-a"
+
+    restored = {}
+    for ids, embeddings, metadatas in read_snapshot(directory, batch_size=4):
+        for doc_id, embedding, metadata in zip(ids, embeddings, metadatas):
+            restored[doc_id] = (embedding, metadata)
+    assert sorted(restored) == sorted(f"doc{i}" for i in range(10) if i != 4)
+    np.testing.assert_allclose(
+        restored["doc7"][0], vectors[7] / np.linalg.norm(vectors[7]), rtol=1e-6
+    )
+    assert restored["doc7"][1] == {"team": "1"}
+
+    with open(os.path.join(directory, "vectors.f32"), "r+b") as f:
+        f.seek(5)
+        f.write(b"\xff")
+    with pytest.raises(ValueError):
+        verify_snapshot(directory)
+
+
+def test_manifest_rejects_foreign_file_names_and_wrong_sizes(tmp_path):
+    index = FlatIndex(initial_capacity=4)
+    index.upsert(["a", "b"], np.eye(2, 4, dtype=np.float32))
+    manifest = export_snapshot(
+        index.batches(), str(tmp_path / "snap"), "model-a"
+    )
+    assert check_manifest(manifest) is manifest
+
+    for name in ("/root/.bashrc", "../../x"):
+        files = dict(manifest["files"], **{name: manifest["files"]["ids.bin"]})
+        with pytest.raises(ValueError):
+            check_manifest(dict(manifest, files=files))
+    with pytest.raises(ValueError):
+        check_manifest(dict(manifest, count=3))
+    with pytest.raises(ValueError):
+        check_manifest(dict(manifest, dim=-4))
+
+
+def test_snapshot_carries_the_near_duplicate_registry(tmp_path):
+    from cers_subnet.miner.dedup import Deduplicator
+
+    registry = str(tmp_path / "duplicates.jsonl")
+    dedup = Deduplicator(threshold=0.8, path=registry)
+    dedup.add(
+        "a",
+        dedup.signature(
+            "the same contract text for every supplier in the region"
+        ),
+    )
+    dedup.add(
+        "b",
+        dedup.signature(
+            "the same contract text for every supplier in the region signed"
+        ),
+    )
+    dedup.close()
+    index = FlatIndex(initial_capacity=4)
+    index.upsert(["a"], np.ones((1, 4), dtype=np.float32))
+
+    directory = str(tmp_path / "snap")
+    manifest = export_snapshot(
+        index.batches(), directory, "model-a", duplicates=registry
+    )
+    assert "duplicates.jsonl" in verify_snapshot(directory)["files"]
+    restored = Deduplicator(
+        threshold=0.8, path=os.path.join(directory, "duplicates.jsonl")
+    )
+    assert restored.canonical_of("b") == "a"
+    assert check_manifest(manifest) is manifest
+
+
+def test_snapshot_records_its_chunking_and_rejects_a_mismatch(tmp_path):
+    index = FlatIndex(initial_capacity=4)
+    index.upsert(["a#0", "a#1"], np.eye(2, 4, dtype=np.float32))
+    manifest = export_snapshot(
+        index.batches(), str(tmp_path / "snap"), "model-a", chunking=(254, 32)
+    )
+    assert (manifest["chunk_tokens"], manifest["chunk_overlap"]) == (254, 32)
+    check_chunking(manifest, (254, 32))
+    for chunking in ((0, 0), (254, 16), (128, 32)):
+        with pytest.raises(ValueError):
+            check_chunking(manifest, chunking)
+    # Snapshots exported before the chunking was recorded are still accepted.
+    del manifest["chunk_tokens"], manifest["chunk_overlap"]
+    check_chunking(manifest, (0, 0))
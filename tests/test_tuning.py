@@ -0,0 +1,81 @@
+import time
+
+import numpy as np
+
+from cers_subnet.miner.index import SearchResult
+from cers_subnet.miner.tuning import BreadthTuner
+
+
+class LinearIndex:
+    """An index whose search time grows linearly with its breadth and whose exact results are fixed."""
+
+    def __init__(self, breadth, seconds_per_row=5e-5, exact_keys=(1, 2, 3)):
+        self.breadth = breadth
+        self.seconds_per_row = seconds_per_row
+        self.exact_keys = np.asarray(exact_keys, dtype=np.int32)
+
+    def latency(self, rng):
+        return (
+            self.breadth * self.seconds_per_row * (1.0 + 0.05 * rng.random())
+        )
+
+    def exact_search(self, query, k):
+        return SearchResult(
+            self.exact_keys[:k], np.ones(k, dtype=np.float32), True
+        )
+
+
+def run(tuner, index, searches, keys, rng):
+    for _ in range(searches):
+        tuner.observe(index, None, keys, 3, index.latency(rng))
+
+
+def test_breadth_converges_into_the_latency_band_from_either_side():
+    rng = np.random.default_rng(0)
+    # A 10ms target at 0.05-0.0525ms per row: p99 is under target up to 190 rows and has headroom below 133 to 140.
+    for start in (2000, 20):
+        tuner = BreadthTuner(
+            target_p99=0.01,
+            window=20,
+            sample_rate=0.0,
+            min_breadth=8,
+            max_breadth=4096,
+        )
+        index = LinearIndex(start)
+        run(tuner, index, 20 * 60, np.array([9]), rng)
+        settled, adjustments = index.breadth, tuner.status()["adjustments"]
+        assert 133 <= settled <= 190
+        # Once inside the band it stays put.
+        run(tuner, index, 20 * 20, np.array([9]), rng)
+        assert (
+            index.breadth == settled
+            and tuner.status()["adjustments"] == adjustments
+        )
+        assert tuner.status()["last_p99_ms"] <= 10.0
+
+
+def test_breadth_does_not_grow_once_sampled_recall_meets_the_target():
+    rng = np.random.default_rng(1)
+    tuner = BreadthTuner(
+        target_p99=0.01, window=20, sample_rate=1.0, target_recall=0.99
+    )
+    index = LinearIndex(40)
+    tuner.observe(index, None, index.exact_keys, 3, index.latency(rng))
+    deadline = time.monotonic() + 5.0
+    while tuner.recall() is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert tuner.recall() == 1.0
+    run(tuner, index, 20 * 10, index.exact_keys, rng)
+    # Plenty of latency headroom, but nothing to gain.
+    assert index.breadth == 40 and tuner.status()["adjustments"] == 0
+
+
+def test_breadth_shrinks_to_the_minimum_when_no_breadth_meets_the_target():
+    rng = np.random.default_rng(2)
+    tuner = BreadthTuner(
+        target_p99=0.001, window=20, sample_rate=0.0, min_breadth=16
+    )
+    index = LinearIndex(1000)
+    run(tuner, index, 20 * 40, np.array([9]), rng)
+    assert index.breadth == 16
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from cers_subnet.utils.uids import (
+    check_uid_availability,
+    sample_uids,
+    uid_availability,
+)
+
+
+def metagraph(serving, permit, stake, block=1):
+    return SimpleNamespace(
+        axons=[SimpleNamespace(is_serving=s) for s in serving],
+        validator_permit=np.array(permit),
+        S=np.array(stake, dtype=np.float32),
+        block=block,
+    )
+
+
+def test_availability_is_cached_per_sync():
+    graph = metagraph(
+        [True, False, True, True], [False, False, True, True], [0, 0, 5000, 10]
+    )
+    availability = uid_availability(graph, 4096)
+    assert availability.available.tolist() == [True, False, False, True]
+    assert uid_availability(graph, 4096) is availability
+    assert not check_uid_availability(graph, 2, 4096)
+
+    graph.axons[1].is_serving = True
+    graph.block = 2
+    assert uid_availability(graph, 4096).available.tolist() == [
+        True,
+        True,
+        False,
+        True,
+    ]
+
+
+def test_sample_uids_prefers_non_excluded():
+    available = np.array([True, True, False, True, True])
+    rng = np.random.default_rng(0)
+    uids = sample_uids(available, 2, exclude=[0, 1], rng=rng)
+    assert sorted(uids.tolist()) == [3, 4]
+    uids = sample_uids(available, 3, exclude=[0, 1], rng=rng)
+    assert {3, 4} <= set(uids.tolist()) and len(set(uids.tolist())) == 3
+    assert sorted(sample_uids(available, 10, rng=rng).tolist()) == [0, 1, 3, 4]
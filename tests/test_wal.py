@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+import time
+import zlib
+
+import pytest
+
+from cers_subnet.miner import wal as wal_module
+from cers_subnet.miner.wal import LogApplier, WriteAheadLog
+
+
+def upsert(doc_id):
+    return {"op": "upsert", "id": doc_id, "document": f"text of {doc_id}"}
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_concurrent_appends_share_fsyncs(tmp_path, monkeypatch):
+    syncs = []
+    fsync = os.fsync
+    monkeypatch.setattr(
+        wal_module.os, "fsync", lambda fd: (syncs.append(fd), fsync(fd))
+    )
+    log = WriteAheadLog(str(tmp_path), group_commit_ms=20)
+    lsns = []
+    threads = [
+        threading.Thread(
+            target=lambda i=i: lsns.append(log.append([upsert(f"d{i}")]))
+        )
+        for i in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(lsns) == list(range(1, 21))
+    assert len(syncs) < 20
+    log.close()
+
+
+def test_restart_truncates_a_torn_tail_and_replays_unapplied_records(tmp_path):
+    log = WriteAheadLog(str(tmp_path))
+    log.append([upsert("a"), upsert("b")])
+    log.mark_applied(1)
+    log.append([upsert("c")])
+    log.close()
+    ((_, path),) = log.segments()
+    with open(path, "ab") as f:
+        f.write(b"\x10\x00\x00\x00garbage")
+
+    log = WriteAheadLog(str(tmp_path))
+    assert log.last_lsn == 3
+    applied = []
+    applier = LogApplier(log, applied.extend)
+    assert applier.catch_up() == 2
+    assert [record["id"] for record in applied] == ["b", "c"]
+    assert log.append([upsert("d")]) == 4
+    log.close()
+
+
+def test_applied_segments_are_deleted_including_the_last(tmp_path):
+    log = WriteAheadLog(str(tmp_path), segment_bytes=64)
+    for i in range(5):
+        log.append([upsert(f"d{i}")])
+    assert len(log.segments()) > 1
+    log.mark_applied(3)
+    assert log.segments()[0][0] > 1
+    log.mark_applied(5)
+    wait_for(lambda: not log.segments())
+    assert log.read(0) == []
+    # Writing continues in a new segment after the deleted ones.
+    assert log.append([upsert("e")]) == 6
+    assert [lsn for lsn, _ in log.read(5)] == [6]
+    log.close()
+
+
+def test_reader_tails_records_written_by_another_log(tmp_path):
+    writer = WriteAheadLog(str(tmp_path))
+    reader = WriteAheadLog(str(tmp_path), writer=False)
+    writer.append([upsert("a")])
+    assert [record["id"] for _, record in reader.read(0)] == ["a"]
+    writer.append([upsert("b"), {"op": "delete", "id": "a"}])
+    assert [lsn for lsn, _ in reader.read(1)] == [2, 3]
+    assert reader.durable_lsn == 3
+    reader.mark_applied(3)
+    # The writer deletes its segment once the reader applied everything in it.
+    wait_for(lambda: not writer.segments())
+    writer.close()
+
+
+def test_a_failed_fsync_makes_appends_raise(tmp_path, monkeypatch):
+    log = WriteAheadLog(str(tmp_path))
+
+    def fail(fd):
+        raise OSError("disk gone")
+
+    monkeypatch.setattr(wal_module.os, "fsync", fail)
+    with pytest.raises(RuntimeError):
+        log.append([upsert("a")])
+    with pytest.raises(RuntimeError):
+        log.append([upsert("b")])
+
+
+def test_records_that_keep_failing_are_quarantined(tmp_path):
+    log = WriteAheadLog(str(tmp_path))
+    log.append([upsert("good"), upsert("bad"), upsert("later")])
+    applied = []
+
+    def apply(records):
+        if any(record["id"] == "bad" for record in records):
+            raise ValueError("cannot encode")
+        applied.extend(record["id"] for record in records)
+
+    applier = LogApplier(log, apply, max_attempts=2)
+    with pytest.raises(ValueError):
+        applier.catch_up()
+    assert applier.catch_up() == 3
+    assert applied == ["good", "later"]
+    assert applier.quarantined == [2]
+    assert os.path.exists(applier.quarantine_path)
+    assert log.applied_lsn() == 3
+    log.close()
+
+
+def test_reader_waits_for_a_record_that_is_still_being_written(tmp_path):
+    writer = WriteAheadLog(str(tmp_path))
+    reader = WriteAheadLog(str(tmp_path), writer=False)
+    writer.append([upsert("a")])
+    writer.close()
+    ((_, path),) = writer.segments()
+    payload = json.dumps(upsert("b")).encode("utf-8")
+    record = (
+        wal_module._HEADER.pack(len(payload), zlib.crc32(payload), 2) + payload
+    )
+    with open(path, "ab") as f:
+        f.write(record[: len(record) // 2])
+        f.flush()
+        assert [lsn for lsn, _ in reader.read(0)] == [1]
+        assert reader.read(1) == []
+        f.write(record[len(record) // 2 :])
+    assert [record["id"] for _, record in reader.read(1)] == ["b"]
+    assert reader.durable_lsn == 2
+
+
+def test_reader_applier_follows_the_writer_across_segments(tmp_path):
+    writer = WriteAheadLog(str(tmp_path), segment_bytes=64)
+    applied = []
+    applier = LogApplier(
+        WriteAheadLog(str(tmp_path), writer=False),
+        applied.extend,
+        poll_interval=0.01,
+    )
+    applier.start()
+    for i in range(10):
+        writer.append([upsert(f"d{i}")])
+    wait_for(lambda: applier.applied == 10)
+    assert [record["id"] for record in applied] == [f"d{i}" for i in range(10)]
+    assert applier.lag() == 0
+    # Every applied segment is deleted again, by the reader or, for the active one, the writer.
+    wait_for(lambda: not writer.segments())
+    writer.close()